@@ -0,0 +1,163 @@
+import heapq
+import threading
+
+# Kinds of the stock alerts
+LOW_STOCK = 'low_stock'
+RESTOCKED = 'restocked'
+
+
+class LowStockMonitor:
+    """
+    The LowStockMonitor class watches the quantity of the stocked products of a
+    store and tells when one drops below a threshold (or comes back above it).
+    The quantities are kept in a min-heap with lazy invalidation: every change
+    pushes a new entry, and entries that no longer match the quantity of their
+    product are skipped when they come up. The products below the threshold are
+    also kept in a set. So the products under the threshold and the next ones to
+    run out are found without walking the catalog.
+    Alerts are not sent from the order path: they are collected, one per product
+    (a product that drops and comes back before the next flush sends nothing),
+    and the callback gets them in a batch on flush(), or from a background thread.
+    An alert is a (kind, product key, quantity) tuple, kind is LOW_STOCK or
+    RESTOCKED.
+    """
+
+    def __init__(self, store_obj: object, threshold: int, callback=None):
+        """
+        Constructor of the LowStockMonitor class. Starts watching the store.
+        :param store_obj: store object to watch
+        :param threshold: products with a quantity below it are low on stock
+        :param callback: function called with the list of alerts on every flush
+        """
+        if threshold <= 0:
+            raise ValueError("The low stock threshold must be greater than 0")
+        self._store = store_obj
+        self._threshold = threshold
+        self._callback = callback
+        self._lock = threading.Lock()
+        # Quantity of every stocked product, by key
+        self._quantities = {}
+        # (quantity, key) entries, some of them out of date
+        self._heap = []
+        self._below = set()
+        # Alerts not sent yet, by key
+        self._pending = {}
+        self._stop = threading.Event()
+        self._flusher = None
+        with store_obj._lock:
+            for product in store_obj._products.values():
+                self.record_change(product)
+            # The starting inventory is not news
+            self._pending.clear()
+            store_obj._monitor = self
+
+    @property
+    def threshold(self) -> int:
+        """ Getter method for the low stock threshold """
+        return self._threshold
+
+    def record_change(self, product: object):
+        """
+        Takes the new quantity of a product of the store. Products that do not
+        track stock are not watched.
+        """
+        if not product._tracks_stock:
+            return
+        key, quantity = product.key, product.quantity
+        with self._lock:
+            if self._quantities.get(key) == quantity:
+                return
+            self._quantities[key] = quantity
+            heapq.heappush(self._heap, (quantity, key))
+            if len(self._heap) > 2 * len(self._quantities) + 64:
+                # Too many entries are out of date, rebuilds the heap
+                self._heap = [(quantity, key) for key, quantity in
+                              self._quantities.items()]
+                heapq.heapify(self._heap)
+            if quantity < self._threshold:
+                if key not in self._below:
+                    self._below.add(key)
+                    self._alert(key, (LOW_STOCK, key, quantity))
+                elif key in self._pending:
+                    self._pending[key] = (LOW_STOCK, key, quantity)
+            elif key in self._below:
+                self._below.discard(key)
+                self._alert(key, (RESTOCKED, key, quantity))
+
+    def _alert(self, key: str, alert: tuple):
+        """
+        Collects an alert. An alert that undoes the one not sent yet cancels it.
+        The caller holds the lock.
+        """
+        if key in self._pending:
+            del self._pending[key]
+        else:
+            self._pending[key] = alert
+
+    def record_remove(self, product: object):
+        """ Stops watching a product that was removed from the store """
+        with self._lock:
+            self._quantities.pop(product.key, None)
+            self._below.discard(product.key)
+            self._pending.pop(product.key, None)
+
+    def below_threshold(self) -> list:
+        """
+        Returns the (product key, quantity) of all the products below the threshold,
+        lowest quantity first.
+        """
+        with self._lock:
+            return sorted(((key, self._quantities[key]) for key in self._below),
+                          key=lambda item: (item[1], item[0]))
+
+    def next_to_run_out(self, count: int) -> list:
+        """
+        Returns the (product key, quantity) of the count products with the lowest
+        quantity, lowest first. Drops the out of date heap entries it meets.
+        """
+        found = []
+        with self._lock:
+            heap, quantities = self._heap, self._quantities
+            while heap and len(found) < count:
+                quantity, key = heapq.heappop(heap)
+                # Entries of products that changed again (or left) are out of date
+                if quantities.get(key) == quantity and (key, quantity) not in found:
+                    found.append((key, quantity))
+            for key, quantity in found:
+                heapq.heappush(heap, (quantity, key))
+        return found
+
+    def flush(self) -> list:
+        """
+        Sends the alerts collected so far to the callback, in one batch.
+        :return: list of the alerts sent
+        """
+        with self._lock:
+            alerts = list(self._pending.values())
+            self._pending.clear()
+        if alerts and self._callback is not None:
+            self._callback(alerts)
+        return alerts
+
+    def _flush_periodically(self, interval: float):
+        """ Background thread: flushes the alerts every interval seconds """
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def start(self, interval: float = 1.0):
+        """ Starts a background thread that flushes the alerts every interval """
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_periodically,
+                                         args=(interval,), daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """ Stops the background thread, sends the last alerts and stops watching """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._store._lock:
+            if self._store._monitor is self:
+                self._store._monitor = None
+        self.flush()
@@ -0,0 +1,60 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+import catalog
+import main
+
+PROMOTION_NAMES = [None, "Second Half price!", "Third One Free!", "30% off!"]
+
+
+def write_catalog(path: str, rows: int):
+    """ Writes a catalog file (CSV or JSONL, by the extension) with mixed products """
+    with open(path, 'w', newline='') as catalog_file:
+        writer = csv.writer(catalog_file) if path.endswith('.csv') else None
+        if writer is not None:
+            writer.writerow(catalog.COLUMNS[:-1])
+        for number in range(rows):
+            if number % 5 == 3:
+                row = ['non_stocked', f"License {number}", 125, '', '']
+            elif number % 5 == 4:
+                row = ['limited', f"Shipping {number}", 10, 250, 1]
+            else:
+                row = ['product', f"Product {number}", 10 + number % 90, 100, '']
+            row.append(PROMOTION_NAMES[number % len(PROMOTION_NAMES)] or '')
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                catalog_file.write(json.dumps(dict(zip(catalog.COLUMNS, row))) + '\n')
+
+
+def bench(rows: int, workers: int) -> dict:
+    """
+    Measures the time to load a store from a CSV and a JSONL catalog, with one
+    process and with the given number of worker processes.
+    """
+    report = {'rows': rows, 'workers': workers}
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in ('csv', 'jsonl'):
+            path = os.path.join(directory, f"catalog.{extension}")
+            write_catalog(path, rows)
+            for worker_count in sorted({1, workers}):
+                started = time.perf_counter()
+                store_obj = catalog.load_store(path, main.create_promotions(),
+                                               worker_count)
+                elapsed = time.perf_counter() - started
+                assert len(store_obj._products) == rows
+                report[f"{extension}_seconds_per_million_rows_{worker_count}_workers"] = \
+                    elapsed / rows * 1e6
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the catalog loader")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    arguments = parser.parse_args()
+    print(json.dumps(bench(arguments.rows, arguments.workers), indent=2))
@@ -0,0 +1,48 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.bench_order import PROMOTIONS
+from ledger import SalesLedger
+
+
+def bench(rows: int, products: int, batch: int) -> dict:
+    """
+    Measures how many sales per second the ledger records (in batches, as orders
+    do), and how many records per second every query reads.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        ledger = SalesLedger(os.path.join(directory, 'sales.ledger'))
+        lines = [(f"Product {number % products}", 1 + number % 5, 10.0 + number % 90,
+                  PROMOTIONS[number % len(PROMOTIONS)]) for number in range(batch)]
+        started = time.perf_counter()
+        for number in range(rows // batch):
+            ledger.record(lines, when=number)
+        ledger.flush()
+        results = {'record': rows / (time.perf_counter() - started)}
+
+        queries = {'total_revenue': lambda: ledger.total_revenue(),
+                   'revenue_by_product': lambda: ledger.revenue_by_product(),
+                   'revenue_by_promotion': lambda: ledger.revenue_by_promotion(),
+                   'revenue_by_bucket': lambda: ledger.revenue_by_bucket(60),
+                   'last_tenth_by_product': lambda: ledger.revenue_by_product(
+                       start=rows // batch * 0.9)}
+        for name, query in queries.items():
+            started = time.perf_counter()
+            query()
+            results[name] = rows / (time.perf_counter() - started)
+        ledger.close()
+    return {'rows': rows, 'products': products,
+            'bytes': rows * 32, 'rows_per_second': results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the sales ledger")
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--batch', type=int, default=1000)
+    arguments = parser.parse_args()
+    print(json.dumps(bench(arguments.rows, arguments.products, arguments.batch),
+                     indent=2))
@@ -0,0 +1,49 @@
+import argparse
+import gc
+import json
+import tracemalloc
+
+import promotions
+from products import Product, NonStockedProduct, LimitedProduct
+
+NAME = "MacBook Air M2"
+
+FACTORIES = {
+    'Product': lambda: Product(NAME, price=1450, quantity=100),
+    'NonStockedProduct': lambda: NonStockedProduct(NAME, price=125),
+    'LimitedProduct': lambda: LimitedProduct(NAME, price=10, quantity=250, maximum=1),
+    'PercentDiscount': lambda: promotions.PercentDiscount(NAME, percent=30),
+    'SecondHalfPrice': lambda: promotions.SecondHalfPrice(NAME),
+    'ThirdOneFree': lambda: promotions.ThirdOneFree(NAME),
+}
+
+
+def bytes_per_instance(factory, count: int) -> float:
+    """
+    Creates the given number of instances and returns the memory they take, per
+    instance (bytes). All instances share one name string, so only the layout of
+    the instances is measured.
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [factory() for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding the instances is not part of their size
+    size = (after - before - instances.__sizeof__()) / count
+    del instances
+    return size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Memory per instance of the product and promotion classes")
+    parser.add_argument('--count', type=int, default=1_000_000)
+    arguments = parser.parse_args()
+    report = {'count': arguments.count}
+    for name, factory in FACTORIES.items():
+        size = bytes_per_instance(factory, arguments.count)
+        report[name] = {'bytes_per_instance': round(size, 1),
+                        'megabytes_total': round(size * arguments.count / 2 ** 20, 1)}
+    print(json.dumps(report, indent=2))
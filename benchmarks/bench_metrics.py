@@ -0,0 +1,72 @@
+import argparse
+import json
+import statistics
+import time
+
+import metrics
+from benchmarks.bench_order import make_store
+
+
+def time_orders(store_obj, shopping_lists: list, batch: int = None) -> float:
+    """
+    Returns the time (seconds) of buying all the shopping lists, one by one with
+    Store.order, or in batches of the given size with Store.order_many
+    """
+    started = time.perf_counter()
+    if batch is None:
+        for shopping_list in shopping_lists:
+            store_obj.order(shopping_list)
+    else:
+        for start in range(0, len(shopping_lists), batch):
+            store_obj.order_many(shopping_lists[start:start + batch])
+    return time.perf_counter() - started
+
+
+def bench(size: int, orders: int, lines: int, rounds: int, batch: int = None) -> dict:
+    """
+    Measures Store.order (or Store.order_many, in batches of the given size) with
+    the instrumentation off and on, and reports the overhead of turning it on.
+    Every round times both, one right after the other (in turns, off first or on
+    first), and the overhead is the median of the rounds, so that a slow spell of
+    the machine does not count as overhead. The units sold are added up when the
+    metrics are read: the time of reading them once after a round is reported
+    apart, per order.
+    """
+    store_obj = make_store(size)
+    product_list = list(store_obj._products.values())
+    shopping_lists = [[(product_list[(number * lines + line) * 7919 % size],
+                        1 + line % 5) for line in range(lines)]
+                      for number in range(orders)]
+    disabled, enabled, ratios, snapshots = [], [], [], []
+    for number in range(rounds):
+        for turn_on in ((False, True) if number % 2 == 0 else (True, False)):
+            if turn_on:
+                registry = metrics.Metrics()
+                metrics.enable(registry)
+                enabled.append(time_orders(store_obj, shopping_lists, batch))
+                started = time.perf_counter()
+                registry.snapshot()
+                snapshots.append(time.perf_counter() - started)
+            else:
+                metrics.disable()
+                disabled.append(time_orders(store_obj, shopping_lists, batch))
+        ratios.append(enabled[-1] / disabled[-1])
+    metrics.disable()
+    return {'orders': orders, 'lines_per_order': lines, 'batch': batch,
+            'order_us_disabled': statistics.median(disabled) / orders * 1e6,
+            'order_us_enabled': statistics.median(enabled) / orders * 1e6,
+            'overhead_percent': (statistics.median(ratios) - 1) * 100,
+            'snapshot_us_per_order': statistics.median(snapshots) / orders * 1e6}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overhead of the instrumentation")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--orders', type=int, default=50_000)
+    parser.add_argument('--lines', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--batch', type=int,
+                        help="buy the orders in batches of this size (Store.order_many)")
+    arguments = parser.parse_args()
+    print(json.dumps(bench(arguments.products, arguments.orders, arguments.lines,
+                           arguments.rounds, arguments.batch), indent=2))
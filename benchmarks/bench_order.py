@@ -0,0 +1,66 @@
+import argparse
+import json
+import time
+
+import promotions
+from products import Product, NonStockedProduct, LimitedProduct
+from store import Store
+
+PROMOTIONS = [None,
+              promotions.PercentDiscount("30% off!", percent=30),
+              promotions.SecondHalfPrice("Second Half price!"),
+              promotions.ThirdOneFree("Third One Free!")]
+
+
+def make_store(size: int, prefix: str = '') -> Store:
+    """
+    Creates a store with the given number of products of every kind, with every
+    promotion. The names of the products start with the given prefix.
+    """
+    product_list = []
+    for number in range(size):
+        if number % 5 == 3:
+            product = NonStockedProduct(f"{prefix}License {number}", price=125)
+        elif number % 5 == 4:
+            product = LimitedProduct(f"{prefix}Shipping {number}", price=10,
+                                     quantity=10 ** 9, maximum=10)
+        else:
+            product = Product(f"{prefix}Product {number}", price=10 + number % 90,
+                              quantity=10 ** 9)
+        product.promotion = PROMOTIONS[number % len(PROMOTIONS)]
+        product_list.append(product)
+    return Store(product_list)
+
+
+def bench(size: int, orders: int, lines: int) -> dict:
+    """
+    Measures how many order lines per second Store.order buys, and how many of them
+    are priced per second, with orders of the given number of lines over a mixed
+    catalog.
+    """
+    store_obj = make_store(size)
+    product_list = list(store_obj._products.values())
+    shopping_lists = [[(product_list[(number * lines + line) * 7919 % size],
+                        1 + line % 5) for line in range(lines)]
+                      for number in range(orders)]
+    started = time.perf_counter()
+    for shopping_list in shopping_lists:
+        store_obj._price_order(shopping_list)
+    pricing_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    for shopping_list in shopping_lists:
+        store_obj.order(shopping_list)
+    elapsed = time.perf_counter() - started
+    return {'products': size, 'orders': orders, 'lines_per_order': lines,
+            'seconds': elapsed, 'lines_per_second': orders * lines / elapsed,
+            'priced_lines_per_second': orders * lines / pricing_elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of Store.order")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--lines', type=int, default=5)
+    arguments = parser.parse_args()
+    print(json.dumps(bench(arguments.products, arguments.orders, arguments.lines),
+                     indent=2))
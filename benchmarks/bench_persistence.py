@@ -0,0 +1,66 @@
+import argparse
+import json
+import tempfile
+import time
+
+from persistence import InventoryJournal
+from products import Product
+from store import Store
+
+
+def make_store(size: int) -> Store:
+    """ Creates a store with the given number of products """
+    return Store([Product(f"Product {number}", price=10 + number % 90, quantity=10 ** 6)
+                  for number in range(size)])
+
+
+def time_orders(store_obj: Store, orders: int) -> float:
+    """ Returns the time (seconds) of the given number of two-line orders """
+    product_list = list(store_obj._products.values())
+    started = time.perf_counter()
+    for number in range(orders):
+        store_obj.order([(product_list[number % len(product_list)], 1),
+                         (product_list[(number * 7) % len(product_list)], 2)])
+    return time.perf_counter() - started
+
+
+def bench(size: int, orders: int) -> dict:
+    """
+    Measures the time per order with and without the journal, and the recovery time
+    from a snapshot only and from a snapshot plus a log tail of all the orders.
+    """
+    report = {'products': size, 'orders': orders}
+    report['order_us_without_journal'] = time_orders(make_store(size), orders) / \
+        orders * 1e6
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = InventoryJournal(directory, snapshot_every=10 ** 9)
+        store_obj = make_store(size)
+        journal.open(store_obj)
+        report['order_us_with_journal'] = time_orders(store_obj, orders) / orders * 1e6
+        journal.close()
+
+        started = time.perf_counter()
+        journal = InventoryJournal(directory)
+        report['log_records_replayed'] = journal.open(make_store(size))
+        report['recovery_seconds_with_log_tail'] = time.perf_counter() - started
+        journal.snapshot()
+        journal.close()
+
+        started = time.perf_counter()
+        journal = InventoryJournal(directory)
+        journal.open(make_store(size))
+        report['recovery_seconds_from_snapshot'] = time.perf_counter() - started
+        journal.close()
+    report['journal_overhead_percent'] = (report['order_us_with_journal'] /
+                                          report['order_us_without_journal'] - 1) * 100
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the write-ahead log and snapshots of the inventory")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--orders', type=int, default=50_000)
+    arguments = parser.parse_args()
+    print(json.dumps(bench(arguments.products, arguments.orders), indent=2))
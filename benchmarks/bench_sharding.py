@@ -0,0 +1,56 @@
+import argparse
+import json
+import time
+
+from benchmarks.bench_order import make_store
+from sharding import ShardedStore, shard_of
+
+
+def make_orders(keys: list, shards: int, orders: int, lines: int, local: bool) -> list:
+    """
+    Makes orders of the given number of lines. Local orders only have products of
+    one shard; the others pick products anywhere, so most of them span shards.
+    """
+    by_shard = [[] for _ in range(shards)]
+    for key in keys:
+        by_shard[shard_of(key, shards)].append(key)
+    made = []
+    for number in range(orders):
+        candidates = by_shard[number % shards] if local else keys
+        made.append([(candidates[(number * lines + line) * 7919 % len(candidates)],
+                      1 + line % 5) for line in range(lines)])
+    return made
+
+
+def bench(size: int, shard_counts: list, orders: int, lines: int, batch: int) -> dict:
+    """
+    Measures how many orders per second a sharded store buys with order_many, in
+    batches, for every number of shards, with local and with spanning orders.
+    """
+    product_list = make_store(size).all_products
+    keys = [product.key for product in product_list]
+    results = {}
+    for shards in shard_counts:
+        with ShardedStore(product_list, shards=shards) as sharded:
+            for local in (True, False):
+                made = make_orders(keys, shards, orders, lines, local)
+                started = time.perf_counter()
+                for start in range(0, orders, batch):
+                    sharded.order_many(made[start:start + batch])
+                elapsed = time.perf_counter() - started
+                results[f"{shards}/{'local' if local else 'spanning'}"] = \
+                    orders / elapsed
+    return {'products': size, 'orders': orders, 'lines_per_order': lines,
+            'batch': batch, 'orders_per_second': results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the sharded store")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--orders', type=int, default=50_000)
+    parser.add_argument('--lines', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=1000)
+    arguments = parser.parse_args()
+    print(json.dumps(bench(arguments.products, arguments.shards, arguments.orders,
+                           arguments.lines, arguments.batch), indent=2))
@@ -0,0 +1,254 @@
+import argparse
+import functools
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import promotions
+from benchmarks.bench_order import make_store
+from products import Product
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+# Number of operations timed by the cases that repeat a cheap operation
+OPERATIONS = 10_000
+
+
+@functools.lru_cache(maxsize=1)
+def shared_store(size: int):
+    """
+    Returns a store with the given number of products of every kind, with every
+    promotion, for the cases that do not change the catalog. Orders take from a
+    stock large enough that they never run out.
+    """
+    return make_store(size)
+
+
+def case_all_products(size: int) -> tuple:
+    """ Store.all_products: lists the active products """
+    store_obj = shared_store(size)
+    return 1, lambda: store_obj, lambda store_obj: store_obj.all_products
+
+
+def case_total_quantity(size: int) -> tuple:
+    """ Store.total_quantity """
+    store_obj = shared_store(size)
+
+    def run(store_obj):
+        for _ in range(OPERATIONS):
+            store_obj.total_quantity
+    return OPERATIONS, lambda: store_obj, run
+
+
+def case_contains(size: int) -> tuple:
+    """ Store.__contains__, half by key and half by product """
+    store_obj = shared_store(size)
+    product_list = list(store_obj._products.values())
+    items = [product_list[number * 7919 % size] for number in range(OPERATIONS // 2)]
+    items += [product.key for product in items]
+
+    def run(store_obj):
+        for item in items:
+            item in store_obj
+    return OPERATIONS, lambda: store_obj, run
+
+
+def case_remove_product(size: int) -> tuple:
+    """ Store.remove_product, of 1000 products (or all of a smaller store) """
+    count = min(1000, size)
+
+    def setup():
+        store_obj = make_store(size)
+        product_list = list(store_obj._products.values())
+        return store_obj, [product_list[number * 7919 % size] for number in range(count)]
+
+    def run(state):
+        store_obj, product_list = state
+        for product in product_list:
+            store_obj.remove_product(product)
+    return count, setup, run
+
+
+def case_sell_out(size: int) -> tuple:
+    """
+    Store.order of the whole stock of 1000 products (or of every stocked product
+    of a smaller store), which takes them off the search indexes, then their
+    restocking, which puts them back
+    """
+    # Products of make_store whose number is 0, 1 or 2 modulo 5 keep their stock
+    count = min(1000, (size + 4) // 5 + (size + 3) // 5 + (size + 2) // 5)
+
+    def setup():
+        store_obj = make_store(size)
+        product_list = [product for product in store_obj._products.values()
+                        if type(product) is Product]
+        return store_obj, [product_list[number * 7919 % len(product_list)]
+                           for number in range(count)]
+
+    def run(state):
+        store_obj, product_list = state
+        for product in product_list:
+            if product.quantity:
+                stock = product.quantity
+                store_obj.order([(product, stock)])
+                product.quantity = stock
+    return count, setup, run
+
+
+def case_order(size: int) -> tuple:
+    """ Store.order, of 5-line orders over products of every kind and promotion """
+    store_obj = shared_store(size)
+    product_list = list(store_obj._products.values())
+    shopping_lists = [[(product_list[(number * 5 + line) * 7919 % size], 1 + line % 5)
+                       for line in range(5)] for number in range(OPERATIONS // 10)]
+
+    def run(store_obj):
+        for shopping_list in shopping_lists:
+            store_obj.order(shopping_list)
+    return len(shopping_lists), lambda: store_obj, run
+
+
+def case_buy(size: int) -> tuple:
+    """ Product.buy, on products of every kind and promotion """
+    store_obj = shared_store(size)
+    product_list = list(store_obj._products.values())
+    lines = [(product_list[number * 7919 % size], 1 + number % 5)
+             for number in range(OPERATIONS)]
+
+    def run(store_obj):
+        for product, quantity in lines:
+            product.buy(product, quantity)
+    return OPERATIONS, lambda: store_obj, run
+
+
+def case_store_add(size: int) -> tuple:
+    """ Store.__add__, of two stores of the given size """
+    def setup():
+        return make_store(size), make_store(size, prefix='Other ')
+    return 1, setup, lambda stores: stores[0] + stores[1]
+
+
+def promotion_case(promotion: object):
+    """ Makes the case of the apply_promotion method of a promotion """
+    def case(size: int) -> tuple:
+        product = Product("MacBook Air M2", price=1450, quantity=10 ** 9)
+
+        def run(product):
+            for quantity in range(1, OPERATIONS + 1):
+                promotion.apply_promotion(product, quantity)
+        return OPERATIONS, lambda: product, run
+    case.__doc__ = f"{type(promotion).__name__}.apply_promotion"
+    return case
+
+
+# The promotion cases do not depend on the size of the catalog
+PROMOTION_CASES = {
+    f"apply_promotion_{type(promotion).__name__}": promotion_case(promotion)
+    for promotion in (promotions.PercentDiscount("30% off!", percent=30),
+                      promotions.SecondHalfPrice("Second Half price!"),
+                      promotions.ThirdOneFree("Third One Free!"))}
+CASES = {'all_products': case_all_products,
+         'total_quantity': case_total_quantity,
+         'contains': case_contains,
+         'remove_product': case_remove_product,
+         'sell_out': case_sell_out,
+         'order': case_order,
+         'buy': case_buy,
+         'store_add': case_store_add}
+
+
+def measure(case, size: int, repeat: int) -> dict:
+    """
+    Times a case: every round gets a new setup (not timed), and the best round
+    counts.
+    :return: result (dict) with the operations per second and seconds per operation
+    """
+    operations, setup, run = case(size)
+    best = float('inf')
+    for _ in range(repeat):
+        state = setup()
+        started = time.perf_counter()
+        run(state)
+        best = min(best, time.perf_counter() - started)
+    return {'operations': operations, 'seconds_per_operation': best / operations,
+            'operations_per_second': operations / best}
+
+
+def git_commit() -> str:
+    """ Returns the commit the benchmarks run on, or None outside a git checkout """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes=SIZES, repeat: int = 3, selected=None) -> dict:
+    """
+    Runs every case at every catalog size (the promotion cases once).
+    :param sizes: catalog sizes
+    :param repeat: number of rounds of every case
+    :param selected: names of the cases to run, or None for all of them
+    :return: report (dict) with the results by "case/size"
+    """
+    results = {}
+    for size in sizes:
+        for name, case in CASES.items():
+            if selected is None or name in selected:
+                results[f"{name}/{size}"] = measure(case, size, repeat)
+        shared_store.cache_clear()
+    for name, case in PROMOTION_CASES.items():
+        if selected is None or name in selected:
+            results[name] = measure(case, 0, repeat)
+    return {'commit': git_commit(), 'python': platform.python_version(),
+            'machine': platform.machine(), 'sizes': list(sizes), 'results': results}
+
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.1) -> list:
+    """
+    Compares a report with a baseline report.
+    :param tolerance: largest slowdown (fraction) that is not a regression
+    :return: list of (name, baseline ops/s, ops/s, ratio, regression) tuples for
+    the results in both reports
+    """
+    rows = []
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['operations_per_second']
+        after = result['operations_per_second']
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio < 1 - tolerance))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite of the store")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help="catalog sizes")
+    parser.add_argument('--repeat', type=int, default=3, help="rounds of every case")
+    parser.add_argument('--cases', nargs='+',
+                        choices=list(CASES) + list(PROMOTION_CASES),
+                        help="cases to run (all by default)")
+    parser.add_argument('--save', help="write the results to this baseline file")
+    parser.add_argument('--compare', help="compare the results with a baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="slowdown (fraction) allowed by --compare")
+    arguments = parser.parse_args()
+
+    report = run_suite(arguments.sizes, arguments.repeat, arguments.cases)
+    if arguments.save:
+        with open(arguments.save, 'w') as baseline_file:
+            json.dump(report, baseline_file, indent=2, sort_keys=True)
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        rows = compare(report, baseline, arguments.tolerance)
+        for name, before, after, ratio, regression in rows:
+            print(f"{name:45} {before:14.1f} {after:14.1f} {ratio:6.2f}x"
+                  f"{'  REGRESSION' if regression else ''}")
+        sys.exit(1 if any(row[4] for row in rows) else 0)
+    if not arguments.save:
+        print(json.dumps(report, indent=2, sort_keys=True))
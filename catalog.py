@@ -0,0 +1,201 @@
+import csv
+import gc
+import itertools
+import json
+import multiprocessing
+
+import persistence
+import products
+from store import Store
+
+# Columns of a catalog file. A CSV catalog has them as its header, every line of a
+# JSONL catalog is an object with them as keys. Only kind, name and price are
+# required: quantity defaults to 0, maximum is only read for limited products,
+# promotion is the name of a promotion of the promotion catalog (or empty) and
+# active defaults to true.
+COLUMNS = ('kind', 'name', 'price', 'quantity', 'maximum', 'promotion', 'active')
+KINDS = ('product', 'non_stocked', 'limited')
+
+
+def _number(value, column: str):
+    """
+    Converts a number read from a catalog (text in CSV, a number in JSONL). Whole
+    numbers stay int, so prices are shown like in the hard-coded catalog.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"The column '{column}' must be a number, not "
+                         f"'{value}'") from None
+
+
+def parse_row(row: dict, promotion_names=()) -> dict:
+    """
+    Turns a row of a catalog into a product description (as made by
+    persistence.describe_product) and validates it with the same rules as the
+    Product constructor. If the row is invalid, raises an exception.
+    :param row: row (dict of values by column)
+    :param promotion_names: names of the promotions a row may refer to
+    :return: product description (dict)
+    """
+    kind = (row.get('kind') or 'product').strip()
+    if kind not in KINDS:
+        raise ValueError(f"Unknown product kind '{kind}'")
+    name = row.get('name')
+    price = _number(row.get('price'), 'price')
+    if kind == 'non_stocked':
+        quantity = 0
+    else:
+        quantity = _number(row.get('quantity') or 0, 'quantity')
+    products.validate_product(name, price, quantity)
+    if not isinstance(quantity, int):
+        raise ValueError("The argument: 'quantity' must be an integer")
+    description = {'kind': kind, 'name': name, 'price': price, 'quantity': quantity}
+
+    if kind == 'limited':
+        maximum = _number(row.get('maximum'), 'maximum')
+        if not isinstance(maximum, int) or maximum <= 0:
+            raise ValueError("The maximum per order must be an integer greater than 0")
+        description['maximum'] = maximum
+    promotion = row.get('promotion') or None
+    if promotion is not None and promotion not in promotion_names:
+        raise ValueError(f"Unknown promotion '{promotion}'")
+    description['promotion'] = promotion
+    active = row.get('active', True)
+    if isinstance(active, str):
+        active = active.strip().lower() not in ('0', 'false', 'no')
+    description['active'] = bool(active)
+    return description
+
+
+def _read_rows(path: str, keep=None):
+    """
+    Streams the rows of a catalog file, CSV or JSONL (by the extension).
+    :param keep: if given, function of the name of a row telling if the row is
+    read. The other rows are skipped before they are parsed; a JSONL row is only
+    decoded to find its name. Rows without a readable name are always read, so
+    they fail like the other invalid rows.
+    :return: generator of (line number, row) tuples
+    """
+    with open(path, newline='') as catalog_file:
+        if path.endswith('.jsonl'):
+            for line_number, line in enumerate(catalog_file, start=1):
+                if not line.strip():
+                    continue
+                if keep is not None:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        row = None
+                    if isinstance(row, dict) and isinstance(row.get('name'), str):
+                        if keep(row['name']):
+                            yield line_number, row
+                        continue
+                yield line_number, line
+        else:
+            reader = csv.DictReader(catalog_file)
+            for row in reader:
+                if keep is None or not row.get('name') or keep(row['name']):
+                    yield reader.line_num, row
+
+
+def _parse_chunk(arguments: tuple) -> list:
+    """
+    Parses a chunk of rows (in a worker process, or in this one).
+    :param arguments: list of (line number, row) tuples and the promotion names
+    :return: list of (line number, description or None, error or None) tuples
+    """
+    chunk, promotion_names = arguments
+    parsed = []
+    for line_number, row in chunk:
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)
+                if not isinstance(row, dict):
+                    raise ValueError("A JSONL row must be an object")
+            parsed.append((line_number, parse_row(row, promotion_names), None))
+        except (ValueError, NameError, TypeError) as error:
+            parsed.append((line_number, None, f"{type(error).__name__}: {error}"))
+    return parsed
+
+
+def _chunks(rows, chunk_size: int, promotion_names: frozenset):
+    """ Groups the rows in lists of chunk_size rows """
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        yield chunk, promotion_names
+
+
+def _parse_chunks(chunks, pool, workers: int):
+    """
+    Parses the chunks in order, in the pool if there is one. The pool gets a few
+    chunks per worker at a time, so the file is not read far ahead of the products
+    created from it.
+    :return: generator of parsed chunks (see _parse_chunk)
+    """
+    if pool is None:
+        yield from map(_parse_chunk, chunks)
+        return
+    while window := list(itertools.islice(chunks, 2 * workers)):
+        yield from pool.imap(_parse_chunk, window)
+
+
+def read_catalog(path: str, promotion_catalog: dict = None, workers: int = 1,
+                 chunk_size: int = 10_000, errors: list = None, keep=None):
+    """
+    Streams the products of a catalog file. The file is read a chunk at a time,
+    so it never has to fit in memory as text. With more than one worker, the rows
+    are parsed and validated by a pool of worker processes, and the products are
+    created here (so they share the promotion objects).
+    :param path: path of the CSV or JSONL catalog file
+    :param promotion_catalog: promotions (Promotion objects) by name
+    :param workers: number of processes that parse the rows
+    :param chunk_size: number of rows sent to a worker at a time
+    :param errors: if a list is given, (line number, error message) is appended to
+    it for every invalid row and the row is skipped. Otherwise, an invalid row
+    raises an exception.
+    :param keep: if given, function of a product key telling if the product is
+    read: the rows of the other products are skipped before they are parsed
+    :return: generator of products (Product objects)
+    """
+    promotion_catalog = promotion_catalog or {}
+    chunks = _chunks(_read_rows(path, keep), chunk_size, frozenset(promotion_catalog))
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        for parsed in _parse_chunks(chunks, pool, workers):
+            for line_number, description, error in parsed:
+                if error is not None:
+                    if errors is None:
+                        raise ValueError(f"{path}, line {line_number}: {error}")
+                    errors.append((line_number, error))
+                    continue
+                yield persistence.build_product(description, promotion_catalog)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def load_store(path: str, promotion_catalog: dict = None, workers: int = 1,
+               chunk_size: int = 10_000, errors: list = None, **store_options) -> Store:
+    """
+    Creates a store (Store object) with the products of a catalog file, see
+    read_catalog. A product key that is in the catalog twice raises an exception.
+    The garbage collector is paused while loading: the new products are all kept,
+    and collecting over and over while millions of them are created takes about
+    as long as creating them.
+    :param store_options: other arguments of the Store constructor
+    """
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return Store(read_catalog(path, promotion_catalog, workers, chunk_size,
+                                  errors), **store_options)
+    finally:
+        if collecting:
+            gc.enable()
@@ -0,0 +1,424 @@
+import operator
+from array import array
+from itertools import compress
+
+import products
+import promotions
+
+# Product kind codes stored in the kind column of the inventory table
+STOCKED = 0
+NON_STOCKED = 1
+LIMITED = 2
+
+DEACTIVATED_SUFFIX = ' (deactivated)'
+
+
+class InventoryTable:
+    """
+    The InventoryTable class is an array-backed storage engine for products.
+    Instead of one Product object per product, it keeps the prices, quantities,
+    active flags, maximum per order and kind of every product in typed columns
+    (array.array). Totals, active filters and stock checks run over whole columns.
+    Each row can be used as a Product through a lightweight ProductView, so the
+    Store and the CLI work with the table the same way they work with products.
+    The columns support the buffer protocol, so they can be wrapped without
+    copying (for example by numpy.frombuffer) where NumPy is available.
+    """
+
+    def __init__(self):
+        """
+        Constructor of the InventoryTable class. Creates the (empty) columns.
+        """
+        self._keys = {}
+        self._names = []
+        self._prices = array('d')
+        self._quantities = array('q')
+        self._active = array('b')
+        self._maximums = array('q')
+        self._kinds = array('b')
+        self._total_prices = array('d')
+        # Sparse columns: most rows have no promotion and no observers, and only
+        # the rows that were shown have a rendered line
+        self._promotions = {}
+        self._pricers = {}
+        self._observers = {}
+        self._rendered = {}
+        self._views = []
+
+    def __len__(self):
+        return len(self._names)
+
+    def append(self, name: str, price: float, quantity: int = 0,
+               kind: int = STOCKED, maximum: int = 0):
+        """
+        Adds a product to the table, validating it with the same rules as
+        Product. Returns the view (ProductView object) of the new row.
+        :param name: name of the product
+        :param price: price of the product
+        :param quantity: quantity of the product (ignored for non stocked products)
+        :param kind: STOCKED, NON_STOCKED or LIMITED
+        :param maximum: maximum quantity per order (limited products only)
+        :return: ProductView object
+        """
+        if kind not in (STOCKED, NON_STOCKED, LIMITED):
+            raise ValueError(f"Unknown product kind '{kind}'")
+        if kind == NON_STOCKED:
+            quantity = 0
+        products.validate_product(name, price, quantity)
+        if name in self._keys:
+            raise ValueError(f"A product with the key '{name}' is already in the "
+                             "table")
+
+        row = len(self._names)
+        self._keys[name] = row
+        self._names.append(name)
+        self._prices.append(price)
+        self._quantities.append(quantity)
+        self._active.append(1)
+        self._maximums.append(maximum)
+        self._kinds.append(kind)
+        self._total_prices.append(0)
+        view = ProductView(self, row)
+        self._views.append(view)
+        return view
+
+    @classmethod
+    def from_products(cls, product_list: list):
+        """
+        Creates a table from a list of products (Product objects), keeping their
+        prices, quantities, active state and promotions.
+        """
+        table = cls()
+        for product in product_list:
+            if isinstance(product, products.NonStockedProduct):
+                view = table.append(product.key, product.price, kind=NON_STOCKED)
+            elif isinstance(product, products.LimitedProduct):
+                view = table.append(product.key, product.price, product.quantity,
+                                    kind=LIMITED, maximum=product._max_purchase)
+            else:
+                view = table.append(product.key, product.price, product.quantity)
+            if product.promotion is not None:
+                view.promotion = product.promotion
+            if not product._active:
+                view.deactivate()
+        return table
+
+    def view(self, key: str):
+        """
+        Gets the key of a product and returns its view (ProductView object).
+        """
+        try:
+            return self._views[self._keys[key]]
+        except KeyError:
+            raise ValueError(f"There is no product with the key '{key}' in the "
+                             "table") from None
+
+    def views(self) -> list:
+        """
+        Returns the views (ProductView objects) of all the rows, in order.
+        """
+        return list(self._views)
+
+    @property
+    def total_quantity(self) -> int:
+        """
+        Returns how many items are in the table in total
+        """
+        return sum(self._quantities)
+
+    def active_rows(self) -> list:
+        """
+        Returns the rows (int) of the products that are active: the active flag is
+        set and the product is in stock or is a non stocked product.
+        """
+        in_stock = map(operator.or_, map(bool, self._quantities),
+                       map(NON_STOCKED.__eq__, self._kinds))
+        return list(compress(range(len(self._names)),
+                             map(operator.and_, self._active, in_stock)))
+
+    def active_products(self) -> list:
+        """
+        Returns the views (ProductView objects) of all the active products.
+        """
+        return list(map(self._views.__getitem__, self.active_rows()))
+
+    def in_stock(self, rows: list, quantities: list) -> list:
+        """
+        Checks a batch of (row, quantity) pairs against the stock in the table.
+        Non stocked and limited products never run out of stock.
+        :param rows: rows (int) of the products
+        :param quantities: wanted quantities (int), one per row
+        :return: list of True or False (bool), one per row
+        """
+        available = map(self._quantities.__getitem__, rows)
+        unlimited = map(STOCKED.__ne__, map(self._kinds.__getitem__, rows))
+        return list(map(operator.or_, unlimited,
+                        map(operator.le, quantities, available)))
+
+
+class ProductView:
+    """
+    A ProductView is a row of an InventoryTable that behaves like a Product,
+    NonStockedProduct or LimitedProduct (depending on the kind of the row).
+    It only holds the table and the row, all the data lives in the table columns.
+    """
+    __slots__ = ('_table', '_row')
+
+    def __init__(self, table: InventoryTable, row: int):
+        """ Constructor of the ProductView class """
+        self._table = table
+        self._row = row
+
+    @property
+    def _observers(self) -> tuple:
+        """ Getter function for the observers of the row """
+        return self._table._observers.get(self._row, ())
+
+    @_observers.setter
+    def _observers(self, observers: tuple):
+        """ Setter function for the observers of the row """
+        if observers:
+            self._table._observers[self._row] = observers
+        else:
+            self._table._observers.pop(self._row, None)
+
+    def _notify(self, quantity_delta: int = 0):
+        """
+        Notifies the observers of the row that the product has changed, and drops
+        the rendered line of the row.
+        :param quantity_delta: change of the quantity of the product (int)
+        """
+        self._table._rendered.pop(self._row, None)
+        for observer in self._table._observers.get(self._row, ()):
+            observer(self, quantity_delta)
+
+    @property
+    def _active(self) -> bool:
+        """ Getter function for the active flag of the row """
+        return bool(self._table._active[self._row])
+
+    @property
+    def _max_purchase(self) -> int:
+        """ Getter function for the maximum quantity per order of the row """
+        return self._table._maximums[self._row]
+
+    @property
+    def kind(self) -> int:
+        """ Getter function for the kind code of the product """
+        return self._table._kinds[self._row]
+
+    @property
+    def key(self) -> str:
+        """ Getter function for the stable key of the product """
+        return self._table._names[self._row]
+
+    @property
+    def price(self) -> float:
+        """ Getter function for price. Returns the price (float) """
+        return self._table._prices[self._row]
+
+    @price.setter
+    def price(self, new_price):
+        """ Setter function for price. """
+        if new_price <= 0:
+            raise ValueError("Price must be greater than 0")
+        with products.lock_for(self):
+            self._table._prices[self._row] = new_price
+            self._notify()
+
+    @property
+    def total_price(self) -> float:
+        """ Getter function for total price. Returns the total price (float) """
+        return self._table._total_prices[self._row]
+
+    @total_price.setter
+    def total_price(self, new_total_price):
+        """ Setter function for total price. """
+        self._table._total_prices[self._row] = new_total_price
+
+    @property
+    def promotion(self):
+        """ Getter function for the promotion object """
+        return self._table._promotions.get(self._row)
+
+    @promotion.setter
+    def promotion(self, promotion_objt: object):
+        """ Setter function for the promotion object (None removes the promotion) """
+        with products.lock_for(self):
+            if promotion_objt is None:
+                self._table._promotions.pop(self._row, None)
+                self._table._pricers.pop(self._row, None)
+            else:
+                self._table._promotions[self._row] = promotion_objt
+                self._table._pricers[self._row] = promotion_objt.price
+            self._notify()
+
+    @property
+    def quantity(self) -> int:
+        """ Getter function for quantity. Returns the quantity (int) """
+        return self._table._quantities[self._row]
+
+    @quantity.setter
+    def quantity(self, quantity: int):
+        """
+        Setter function for quantity. Adds the given quantity to the quantity of
+        the product. If quantity reaches 0, deactivates the product.
+        """
+        if isinstance(quantity, str):
+            raise ValueError("The argument: 'quantity' must be an integer")
+        quantities, row = self._table._quantities, self._row
+        with products.lock_for(self):
+            old_quantity = quantities[row]
+            if old_quantity + quantity <= 0:
+                quantities[row] = 0
+                self.deactivate()
+            else:
+                quantities[row] = old_quantity + quantity
+            self._notify(quantities[row] - old_quantity)
+
+    @property
+    def is_active(self) -> bool:
+        """
+        Getter function for active.
+        Returns True if the product is active, otherwise False.
+        """
+        table, row = self._table, self._row
+        if not table._active[row]:
+            return False
+        return table._kinds[row] == NON_STOCKED or table._quantities[row] > 0
+
+    @property
+    def is_non_stocked_product(self) -> bool:
+        """
+        Returns True if it is Non Stocked Product, otherwise False.
+        """
+        return self._table._kinds[self._row] == NON_STOCKED
+
+    def activate(self):
+        """
+        Activates the product.
+        """
+        with products.lock_for(self):
+            self._table._active[self._row] = 1
+            self._notify()
+
+    def deactivate(self):
+        """
+        Deactivates the product
+        """
+        with products.lock_for(self):
+            self._table._active[self._row] = 0
+            self._notify()
+
+    def __len__(self):
+        return int(self.price)
+
+    def __gt__(self, other):
+        return len(self) > len(other)
+
+    def __str__(self):
+        """
+        Returns a string that represents the product (see _render), cached until
+        the product changes, like Product.__str__.
+        """
+        rendered = self._table._rendered.get(self._row)
+        if rendered is None:
+            with products.lock_for(self):
+                rendered = self._render()
+                if rendered is not None:
+                    self._table._rendered[self._row] = rendered
+        return rendered
+
+    def _render(self):
+        """
+        Returns a string that represents the product, in the same format as the
+        Product class of the same kind.
+        """
+        table, row = self._table, self._row
+        kind = table._kinds[row]
+        name = table._names[row]
+        if not table._active[row]:
+            name += DEACTIVATED_SUFFIX
+        # Prints whole prices without the decimal part, like the Product class
+        price = table._prices[row]
+        if price.is_integer():
+            price = int(price)
+        promotion = getattr(self.promotion, 'name', None)
+        if kind == NON_STOCKED:
+            quantity = "Quantity: Unlimited"
+        elif kind == LIMITED:
+            quantity = f"Limited to {table._maximums[row]} per order!"
+        elif self.is_active:
+            quantity = f"Quantity: {table._quantities[row]}"
+        else:
+            return None
+        return f"{name}, Price: {price}, {quantity}, " \
+               f"Promotion: {promotion}"
+
+    @property
+    def _tracks_stock(self) -> bool:
+        """ Returns True if buying the product takes items out of its quantity """
+        return self._table._kinds[self._row] == STOCKED
+
+    def _check_quantity(self, quantity: int, allocated: int = 0):
+        """
+        Checks that the given quantity of the product can be bought. If it cannot,
+        raises an exception.
+        :param quantity: order quantity
+        :param allocated: items of the product already taken by earlier order lines
+        """
+        table, row = self._table, self._row
+        kind = table._kinds[row]
+        if not isinstance(quantity, int):
+            raise ValueError("Quantity must be an integer")
+        if quantity <= 0:
+            raise ValueError("Quantity must be greater than 0")
+        if kind == LIMITED and quantity > table._maximums[row]:
+            raise ValueError(f"Error: Only maximum quantity of {table._maximums[row]} "
+                             "per order is allowed!")
+        if kind == STOCKED and quantity > table._quantities[row] - allocated:
+            raise ValueError(f"The quantity {quantity} entered is above the quantity of "
+                             "product in the store")
+
+    def _take_stock(self, quantity: int):
+        """
+        Takes the given quantity of items out of the quantity of the product.
+        """
+        self._table._quantities[self._row] -= quantity
+        self._notify(-quantity)
+
+    def _release_stock(self, quantity: int):
+        """
+        Puts the given quantity of items back into the quantity of the product.
+        """
+        self._table._quantities[self._row] += quantity
+        self._notify(quantity)
+
+    def _price_purchase(self, quantity: int) -> tuple:
+        """
+        Gets the order quantity and returns the total price of the purchase (or the
+        discounted price) and the total items received (tuple).
+        Does not change the quantity of the product.
+        """
+        table, row = self._table, self._row
+        price = table._prices[row]
+        # Gets the total price for the product [price * quantity]
+        table._total_prices[row] = price * quantity
+        return table._pricers.get(row, promotions.full_price)(price, quantity)
+
+    def buy(self, product: object, quantity: int) -> float:
+        """
+        Gets a product object and given quantity of the product.
+        If promotion is set on the product, it applies promotion on the product.
+        Returns the total price (float) of the purchase or the discounted price
+        Updates the quantity of the product (stocked products only).
+        """
+        with products.lock_for(self):
+            self._check_quantity(quantity)
+            total_price, total_items_received = self._price_purchase(quantity)
+            if self._table._kinds[self._row] == STOCKED:
+                self._take_stock(quantity)
+            # Promotions that give free items return the price and the items
+            if total_items_received:
+                return total_price, total_items_received
+            return total_price
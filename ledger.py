@@ -0,0 +1,313 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Every sale (order line) is a fixed-width record: timestamp (microseconds),
+# quantity, charged amount, product index and promotion code. The fields are
+# aligned so that the mapped file can be read as typed columns (memoryview.cast),
+# see SalesLedger._columns.
+_RECORD = struct.Struct('<qqdih2x')
+RECORD_SIZE = _RECORD.size
+# Number of records read at a time by the queries
+CHUNK_RECORDS = 1 << 20
+# Promotion code of the lines sold without a promotion
+NO_PROMOTION = 0
+MICROSECONDS = 1_000_000
+
+
+class SalesLedger:
+    """
+    The SalesLedger class keeps every sale (order line) in an append-only file of
+    fixed-width binary records: when it was sold, the product (as an index), the
+    quantity, the amount charged and the promotion (as a code). The product keys
+    and promotion names of the indexes and codes are appended to a small names
+    file next to it.
+    Queries (revenue and units by product, revenue by promotion and by time
+    bucket) map the file read-only and read it a chunk at a time as typed columns,
+    so a ledger of any size is never loaded into Python objects. Records are in
+    time order, so time ranges are found by bisection.
+    Attached to a store, the ledger records every line the store sells: orders,
+    batches of orders and confirmed holds.
+    New names are written (and synced) to the names file before any record that
+    uses them, so a crash never leaves records whose product or promotion is
+    unknown. The number of records checked against the names, and the number of
+    product and promotion names they need, are kept in a marks file
+    (path + '.marks'), so opening the ledger only checks the records after them.
+    """
+
+    def __init__(self, path: str, clock=time.time):
+        """
+        Constructor of the SalesLedger class. Opens the ledger file, or creates it.
+        :param path: path of the ledger file. The names are kept in path + '.names'
+        and the marks of the checked records in path + '.marks'
+        :param clock: function returning the current time (seconds)
+        """
+        self._path = path
+        self._clock = clock
+        self._store = None
+        self._lock = threading.Lock()
+        self._products = {}
+        self._product_keys = []
+        self._promotions = {None: NO_PROMOTION}
+        self._promotion_names = [None]
+        if os.path.exists(path + '.names'):
+            with open(path + '.names', 'rb+') as names_file:
+                names = names_file.read()
+                # Drops the end of a name that was cut short by a crash: no record
+                # uses it, since the names are synced before the records
+                complete = names[:names.rfind(b"\n") + 1]
+                if len(complete) < len(names):
+                    names_file.truncate(len(complete))
+            for line in complete.decode().splitlines():
+                if line.strip():
+                    self._add_name(*json.loads(line))
+        self._file = open(path, 'ab')
+        # Drops the tail of a record that was cut short by a crash
+        size = os.fstat(self._file.fileno()).st_size
+        self._file.truncate(size - size % RECORD_SIZE)
+        self._count = size // RECORD_SIZE
+        self._last_timestamp = self._read_last_timestamp()
+        self._names_file = open(path + '.names', 'a')
+        try:
+            self._check_names()
+        except ValueError:
+            self._names_file.close()
+            self._file.close()
+            raise
+
+    def _add_name(self, kind: str, name: str) -> int:
+        """ Gives the next index (product) or code (promotion) to a name """
+        if kind == 'product':
+            self._products[name] = len(self._product_keys)
+            self._product_keys.append(name)
+            return self._products[name]
+        self._promotions[name] = len(self._promotion_names)
+        self._promotion_names.append(name)
+        return self._promotions[name]
+
+    def _check_names(self):
+        """
+        Checks that every product index and promotion code of the records has a
+        name. Otherwise the records would be added up under the wrong names (or
+        not at all), so raises an exception. Only the records after those of the
+        marks file are read, then the marks are saved for the next time.
+        """
+        checked, products, promotions = 0, 0, 1
+        try:
+            with open(self._path + '.marks') as marks_file:
+                marks = json.load(marks_file)
+            # Marks of more records than the ledger has are not to be trusted
+            if marks['records'] <= self._count:
+                checked, products, promotions = \
+                    marks['records'], marks['products'], marks['promotions']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        for columns in self._columns(first_record=checked):
+            products = max(products, max(columns[3]) + 1)
+            promotions = max(promotions, max(columns[4]) + 1)
+        if products > len(self._product_keys) or \
+                promotions > len(self._promotion_names):
+            raise ValueError(f"The ledger '{self._path}' has records of products or "
+                             "promotions missing from its names file")
+        self._save_marks(products, promotions)
+
+    def _save_marks(self, products: int, promotions: int):
+        """
+        Writes the marks file: the number of records, and the number of product
+        and promotion names they need.
+        """
+        temporary_path = self._path + '.marks.tmp'
+        with open(temporary_path, 'w') as marks_file:
+            json.dump({'records': self._count, 'products': products,
+                       'promotions': promotions}, marks_file)
+        os.replace(temporary_path, self._path + '.marks')
+
+    def _read_last_timestamp(self) -> int:
+        """ Returns the timestamp of the last record (or 0 for an empty ledger) """
+        if not self._count:
+            return 0
+        with open(self._path, 'rb') as ledger_file:
+            ledger_file.seek((self._count - 1) * RECORD_SIZE)
+            return int.from_bytes(ledger_file.read(8), 'little', signed=True)
+
+    def __len__(self):
+        return self._count
+
+    def attach(self, store_obj: object):
+        """ Records the sales of a store from now on """
+        self._store = store_obj
+        store_obj._ledger = self
+
+    def detach(self):
+        """ Stops recording the sales of the store """
+        if self._store is not None:
+            self._store._ledger = None
+            self._store = None
+
+    def record(self, lines, when: float = None):
+        """
+        Appends sales to the ledger.
+        :param lines: (product key, quantity, amount charged, promotion) lines,
+        the promotion being a Promotion object or None
+        :param when: time of the sales (seconds), by default the time of the clock.
+        Records stay in time order: a time before the last record counts as the
+        time of the last record
+        """
+        timestamp = int((self._clock() if when is None else when) * MICROSECONDS)
+        records = bytearray()
+        pack = _RECORD.pack
+        with self._lock:
+            timestamp = max(timestamp, self._last_timestamp)
+            named = False
+            for key, quantity, amount, promotion in lines:
+                index = self._products.get(key)
+                if index is None:
+                    index = self._add_name('product', key)
+                    self._names_file.write(json.dumps(['product', key]) + "\n")
+                    named = True
+                name = getattr(promotion, 'name', None)
+                code = self._promotions.get(name)
+                if code is None:
+                    code = self._add_name('promotion', name)
+                    self._names_file.write(json.dumps(['promotion', name]) + "\n")
+                    named = True
+                records += pack(timestamp, quantity, amount, index, code)
+            if named:
+                # The names reach the disk before any record that uses them
+                self._names_file.flush()
+                os.fsync(self._names_file.fileno())
+            self._file.write(records)
+            self._count += len(records) // RECORD_SIZE
+            self._last_timestamp = timestamp
+
+    def flush(self):
+        """ Writes the buffered records (and names) to the files """
+        with self._lock:
+            self._names_file.flush()
+            self._file.flush()
+
+    def close(self):
+        """ Detaches the ledger from its store and closes the files """
+        self.detach()
+        with self._lock:
+            self._names_file.close()
+            self._file.close()
+            # Every record has a name, the names being written first
+            self._save_marks(len(self._product_keys), len(self._promotion_names))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _columns(self, start: float = None, end: float = None, first_record: int = 0):
+        """
+        Generator of the records from start (included) to end (excluded), a chunk
+        at a time, as typed columns of the mapped file (memoryview objects, no
+        copies): timestamps, quantities, amounts, product indexes and promotion
+        codes. The columns are released after every chunk, so they must not be
+        kept. The records before first_record are left out.
+        """
+        self.flush()
+        size = self._count * RECORD_SIZE
+        if first_record >= self._count:
+            return
+        with open(self._path, 'rb') as ledger_file, \
+                mmap.mmap(ledger_file.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+            buffer = memoryview(mapped)
+            views = [buffer]
+            try:
+                first, last = first_record, self._count
+                if start is not None or end is not None:
+                    words = buffer.cast('q')
+                    timestamps = words[0::4]
+                    views += [words, timestamps]
+                    if start is not None:
+                        first = bisect.bisect_left(timestamps,
+                                                   int(start * MICROSECONDS), first)
+                    if end is not None:
+                        last = bisect.bisect_left(timestamps, int(end * MICROSECONDS))
+                for chunk_start in range(first, last, CHUNK_RECORDS):
+                    chunk = buffer[chunk_start * RECORD_SIZE:
+                                   min(last, chunk_start + CHUNK_RECORDS) * RECORD_SIZE]
+                    words, reals = chunk.cast('q'), chunk.cast('d')
+                    integers, shorts = chunk.cast('i'), chunk.cast('h')
+                    columns = (words[0::4], words[1::4], reals[2::4], integers[6::8],
+                               shorts[14::16])
+                    try:
+                        yield columns
+                    finally:
+                        for view in columns + (words, reals, integers, shorts, chunk):
+                            view.release()
+            finally:
+                for view in reversed(views):
+                    view.release()
+
+    def _sum_by(self, group: int, column: int, names: list, start: float,
+                end: float) -> dict:
+        """
+        Adds up a column (1: quantities, 2: amounts) by the names of a group column
+        (3: product indexes, 4: promotion codes), in one pass over the records.
+        """
+        totals = [0] * len(names)
+        for columns in self._columns(start, end):
+            for index, value in zip(columns[group], columns[column]):
+                totals[index] += value
+        return {name: total for name, total in zip(names, totals) if total}
+
+    def revenue_by_product(self, start: float = None, end: float = None) -> dict:
+        """
+        Returns the amount charged (float) by product key, for the sales from
+        start (included) to end (excluded), in seconds; a missing bound is not
+        checked.
+        """
+        return self._sum_by(3, 2, self._product_keys, start, end)
+
+    def units_by_product(self, start: float = None, end: float = None) -> dict:
+        """
+        Returns the units sold (int) by product key, for the sales from start
+        (included) to end (excluded), see revenue_by_product. Divided by the
+        length of the period, it is the sales velocity of the products.
+        """
+        return self._sum_by(3, 1, self._product_keys, start, end)
+
+    def revenue_by_promotion(self, start: float = None, end: float = None) -> dict:
+        """
+        Returns the amount charged (float) by promotion name (None for the sales
+        without a promotion), for the sales from start (included) to end
+        (excluded).
+        """
+        return self._sum_by(4, 2, self._promotion_names, start, end)
+
+    def revenue_by_bucket(self, width: float, start: float = None,
+                          end: float = None) -> dict:
+        """
+        Returns the amount charged (float) by time bucket: the start of the bucket
+        (seconds, a multiple of width) for the sales from start (included) to end
+        (excluded). The records are in time order, so every bucket is a slice of
+        the columns, found by bisection and added up at once.
+        """
+        if width <= 0:
+            raise ValueError("The bucket width must be greater than 0")
+        step = int(width * MICROSECONDS)
+        totals = {}
+        for columns in self._columns(start, end):
+            timestamps, amounts = columns[0], columns[2]
+            low = 0
+            while low < len(timestamps):
+                bucket = timestamps[low] // step * step
+                high = bisect.bisect_left(timestamps, bucket + step, low)
+                key = bucket / MICROSECONDS
+                totals[key] = totals.get(key, 0.0) + sum(amounts[low:high])
+                low = high
+        return totals
+
+    def total_revenue(self, start: float = None, end: float = None) -> float:
+        """ Returns the amount charged (float) for the sales from start to end """
+        return sum(sum(columns[2]) for columns in self._columns(start, end))
+
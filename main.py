@@ -1,3 +1,15 @@
+import argparse
+import cProfile
+import io
+import json
+import pstats
+import shlex
+import sys
+import tracemalloc
+
+import catalog
+import metrics
+import persistence
 import products
 import store
 import promotions
@@ -8,18 +20,17 @@ MENU = """
 1. List all products in store
 2. Show total amount in store
 3. Make an order
+5. Search products
 4. Quit
 please choose a number: 
 """
 
-USER_CHOICE_DICT = {
-    1: 'list_all_products',
-    2: 'show_total_amount',
-    3: 'make_order'
-}
-
 QUIT_STORE = 4
 ONE = 1
+# Number of products read from the store at a time when listing
+PAGE_SIZE = 100
+# Number of lines of every part of the --profile report
+PROFILE_TOP = 30
 
 
 def get_user_choice() -> int:
@@ -53,7 +64,7 @@ def is_valid(user_choice, validate_order=True) -> bool:
     elif not user_choice.isdigit():
         print(f"Error with your choice '{user_choice}'. Try again!")
         return False
-    elif int(user_choice) not in [1, 2, 3, 4]:
+    elif int(user_choice) not in [1, 2, 3, 4, 5]:
         print(f"Error with your choice '{user_choice}'. Try again!")
         return False
     return True
@@ -91,7 +102,7 @@ def start(store_obj: object):
     """
     user_choice = get_user_choice()
     while user_choice != QUIT_STORE:
-        dispatcher = eval(USER_CHOICE_DICT[user_choice])
+        dispatcher = DISPATCHERS[user_choice]
         dispatcher(store_obj)
         user_choice = get_user_choice()
     print("Thanks for shopping! Bye!")
@@ -100,18 +111,74 @@ def start(store_obj: object):
 def list_all_products(store_obj):
     """
     Gets the Object parameter, gets all the products in the store. Prints the list of
-    available products to the screen. Returns a list of product objects
+    available products to the screen. Returns a list of product objects.
+    The products are read and printed a page at a time, so the first ones show up
+    right away in a large store, and each product line is rendered only once until
+    the product changes.
     :param store_obj (store object)
     :return: list[product object, ... ]
     """
-    all_products = store_obj.all_products
+    all_products = []
     print("-------------------------------")
-    for index, product in enumerate(all_products):
-        print(f"{index + ONE}. {product}")
+    for page in store_obj.pages(PAGE_SIZE):
+        print("\n".join(f"{len(all_products) + index + ONE}. {product}"
+                        for index, product in enumerate(page)))
+        all_products.extend(page)
     print("-------------------------------")
     return all_products
 
 
+def search_products(store_obj: object) -> list:
+    """
+    Gets the Store Object as parameter. Prompts user for the start of the product
+    name and a price range (empty text for any), and prints the active products
+    that match, using the search indexes of the store. Returns the list of products
+    :param store_obj: store object
+    :return: list[product object, ... ]
+    """
+    prefix = input('Product name starts with: ').strip()
+    lowest_price = input('Lowest price: ').strip()
+    highest_price = input('Highest price: ').strip()
+    try:
+        found_products = find_products(store_obj, prefix, lowest_price, highest_price)
+    except ValueError as e:
+        print(f"{e}. Try again!\n")
+        return []
+
+    print("-------------------------------")
+    for index, product in enumerate(found_products):
+        print(f"{index + ONE}. {product}")
+    if not found_products:
+        print("No products found")
+    print("-------------------------------")
+    return found_products
+
+
+def find_products(store_obj: object, prefix: str = '', lowest_price: str = '',
+                  highest_price: str = '') -> list:
+    """
+    Returns the active products whose name starts with the prefix and whose price
+    is in the range, using the search indexes of the store.
+    :param store_obj: store object
+    :param prefix: start of the product name (empty text for any)
+    :param lowest_price: lowest price (empty text for any)
+    :param highest_price: highest price (empty text for any)
+    :return: list[product object, ... ]
+    """
+    try:
+        low = float(lowest_price) if lowest_price else None
+        high = float(highest_price) if highest_price else None
+    except ValueError:
+        raise ValueError("Error: The price must be a number") from None
+
+    found_products = store_obj.products_in_price_range(low, high)
+    if prefix:
+        matching_keys = {product.key for product in store_obj.search(prefix)}
+        found_products = [product for product in found_products
+                          if product.key in matching_keys]
+    return found_products
+
+
 def show_total_amount(store_obj: object):
     """
     Gets the Store Object as parameter. Uses the object to fetch the total
@@ -167,40 +234,263 @@ def make_order(store_obj: object):
                 print("Error adding product. Try again!\n")
 
 
+# Functions of the menu choices, by choice
+DISPATCHERS = {1: list_all_products,
+               2: show_total_amount,
+               3: make_order,
+               5: search_products}
+
+
+def script_list(store_obj: object, arguments: list) -> dict:
+    """ Script command 1: the lines of the active products, read a page at a time """
+    return {'products': [str(product) for page in store_obj.pages(PAGE_SIZE)
+                         for product in page]}
+
+
+def script_total(store_obj: object, arguments: list) -> dict:
+    """ Script command 2: the total quantity of the store """
+    return {'total_quantity': store_obj.total_quantity}
+
+
+def script_order(store_obj: object, arguments: list) -> dict:
+    """
+    Script command 3: one order, as product key and quantity pairs, for example
+    3 "MacBook Air M2" 2 Shipping 1
+    """
+    if not arguments or len(arguments) % 2:
+        raise ValueError("An order needs a product key and a quantity for every "
+                         "product")
+    shopping_list = []
+    for key, quantity in zip(arguments[::2], arguments[1::2]):
+        if not quantity.isdigit():
+            raise ValueError(f"Quantity '{quantity}' of '{key}' is not a number")
+        shopping_list.append((store_obj.get_product(key), int(quantity)))
+    total_price, total_item_received = store_obj.order(shopping_list)
+    return {'total_price': total_price, 'total_items_received': total_item_received}
+
+
+def script_search(store_obj: object, arguments: list) -> dict:
+    """
+    Script command 5: search by start of the name and price range, for example
+    5 google 100 500 (any argument may be left out, or given as "" for any)
+    """
+    if len(arguments) > 3:
+        raise ValueError("A search takes a name prefix, a lowest and a highest price")
+    return {'products': [str(product)
+                         for product in find_products(store_obj, *arguments)]}
+
+
+# Functions of the script commands, by menu choice
+SCRIPT_DISPATCHERS = {1: script_list,
+                      2: script_total,
+                      3: script_order,
+                      5: script_search}
+
+
+def run_script(store_obj: object, lines, output) -> int:
+    """
+    Runs menu commands without prompts: every line is a menu choice followed by
+    its arguments (see the script_ functions), split like a shell command line.
+    Empty lines and lines starting with # are skipped, and 4 (Quit) ends the
+    script. Every command writes one JSON line to the output, with the line
+    number, the choice and the result, or the error if it failed.
+    :param store_obj: store object
+    :param lines: lines of the script (a file object or a list of str)
+    :param output: file object the results are written to
+    :return: number of commands that failed (int)
+    """
+    failed = 0
+    for line_number, line in enumerate(lines, start=ONE):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        result = {'line': line_number}
+        try:
+            choice, *arguments = shlex.split(line)
+            if not choice.isdigit() or int(choice) not in [1, 2, 3, 4, 5]:
+                raise ValueError(f"Error with your choice '{choice}'")
+            result['choice'] = int(choice)
+            if int(choice) == QUIT_STORE:
+                break
+            result.update(SCRIPT_DISPATCHERS[int(choice)](store_obj, arguments))
+        except ValueError as e:
+            result['error'] = str(e)
+            failed += 1
+        output.write(json.dumps(result) + "\n")
+    return failed
+
+
+def profile_run(function, report_path: str, *arguments):
+    """
+    Calls a function with cProfile and tracemalloc on, and writes a report with
+    the functions that took the most time and the lines that allocated the most
+    memory. Returns what the function returns.
+    :param function: function to call
+    :param report_path: text file the report is written to
+    :param arguments: arguments of the function
+    """
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(function, *arguments)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats_text = io.StringIO()
+        pstats.Stats(profiler, stream=stats_text).sort_stats('cumulative') \
+            .print_stats(PROFILE_TOP)
+        with open(report_path, 'w') as report_file:
+            report_file.write(f"Memory: {current / 1024:.1f} KiB allocated at the "
+                              f"end, {peak / 1024:.1f} KiB at the peak\n\n")
+            report_file.write(f"Top {PROFILE_TOP} allocations by line:\n")
+            for statistic in snapshot.statistics('lineno')[:PROFILE_TOP]:
+                report_file.write(f"{statistic}\n")
+            report_file.write(f"\nTop {PROFILE_TOP} functions by cumulative time:\n")
+            report_file.write(stats_text.getvalue())
+    return result
+
+
+def write_metrics(metrics_path: str):
+    """
+    Writes what the instrumentation recorded (see metrics.py) to a file: as
+    Prometheus text if its name ends with .prom, otherwise as a JSON snapshot.
+    :param metrics_path: file the metrics are written to
+    """
+    with open(metrics_path, 'w') as metrics_file:
+        if metrics_path.endswith('.prom'):
+            metrics_file.write(metrics.REGISTRY.to_prometheus())
+        else:
+            metrics_file.write(metrics.REGISTRY.to_json())
+
+
+def run_script_files(store_obj: object, script_path: str, output_path: str = None) -> int:
+    """
+    Runs a script file (- for the standard input) and writes the results to a file
+    (None for the standard output). See run_script.
+    :return: number of commands that failed (int)
+    """
+    script_file = sys.stdin if script_path == '-' else open(script_path)
+    output = sys.stdout if output_path is None else open(output_path, 'w')
+    try:
+        return run_script(store_obj, script_file, output)
+    finally:
+        if script_file is not sys.stdin:
+            script_file.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+def create_promotions() -> dict:
+    """ Creates the promotion catalog. Returns the promotions (Promotion objects) by
+    name """
+    promotion_list = [promotions.SecondHalfPrice("Second Half price!"),
+                      promotions.ThirdOneFree("Third One Free!"),
+                      promotions.PercentDiscount("30% off!", percent=30),
+                      promotions.PercentDiscount("10% off!", percent=10)]
+    return {promotion.name: promotion for promotion in promotion_list}
+
+
+def create_store(catalog_path: str = None, workers: int = 1) -> store.Store:
+    """ Sets up the initial stock of inventory (list of products) and the promotion
+    catalog. Returns the store object (Store object)
+    :param catalog_path: CSV or JSONL catalog file to load the products from (see
+    catalog.py), instead of the built-in list of products
+    :param workers: number of processes that read the catalog file """
+    # Create promotion catalog
+    promotion_catalog = create_promotions()
+    if catalog_path is not None:
+        return catalog.load_store(catalog_path, promotion_catalog, workers)
+
+    # setup initial stock of inventory
+    product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
+                    products.Product("Bose QuietComfort Earbuds", price=250,
+                                     quantity=500),
+                    products.Product("Google Pixel 7", price=500, quantity=250),
+                    products.NonStockedProduct("Windows License", price=125),
+                    products.LimitedProduct("Shipping", price=10, quantity=250,
+                                            maximum=1)
+                    ]
+
+    # Add promotions to products
+    product_list[0].promotion = promotion_catalog["Second Half price!"]
+    product_list[1].promotion = promotion_catalog["10% off!"]
+    product_list[2].promotion = promotion_catalog["Third One Free!"]
+    product_list[3].promotion = promotion_catalog["30% off!"]
+
+    return store.Store(product_list)
+
+
+def open_journal(store_obj: object, directory: str,
+                 synchronous: bool = False) -> persistence.InventoryJournal:
+    """ Recovers the store from its journal directory (see persistence.py) and
+    starts logging its changes. Returns the journal (InventoryJournal object)
+    :param store_obj: store object
+    :param directory: directory of the snapshot and log files
+    :param synchronous: if True, every change is fsynced before it returns """
+    journal = persistence.InventoryJournal(directory, synchronous=synchronous)
+    journal.open(store_obj, create_promotions())
+    return journal
+
+
 def main():
     """ Sets up intial stock of delivery (list of products). Initializes the store
-    object and calls the start function. Prints error message to the screen if any"""
+    object and calls the start function, or runs a script of menu commands without
+    prompts. Prints error message to the screen if any"""
+    parser = argparse.ArgumentParser(description="Store menu")
+    parser.add_argument('--catalog', help="CSV or JSONL catalog file of the products")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes that read the catalog file")
+    parser.add_argument('--script', help="file of menu commands to run without "
+                                         "prompts, or - for the standard input")
+    parser.add_argument('--output', help="file the results of the script are "
+                                         "written to (JSON lines), instead of the "
+                                         "standard output")
+    parser.add_argument('--profile', help="profile the run (cProfile and "
+                                          "tracemalloc) and write the report to "
+                                          "this file")
+    parser.add_argument('--journal', help="directory of the journal that keeps the "
+                                          "inventory across restarts")
+    parser.add_argument('--sync', action='store_true',
+                        help="fsync every change of the journal before it returns")
+    parser.add_argument('--metrics', help="turn the instrumentation on and write "
+                                          "what it recorded to this file at the "
+                                          "end (Prometheus text if it ends with "
+                                          ".prom, JSON otherwise)")
+    arguments = parser.parse_args()
+
+    def session():
+        if arguments.metrics:
+            metrics.enable()
+        best_buy = create_store(arguments.catalog, arguments.workers)
+        journal = None
+        if arguments.journal:
+            journal = open_journal(best_buy, arguments.journal, arguments.sync)
+        try:
+            if arguments.script is None:
+                return start(best_buy)
+            return run_script_files(best_buy, arguments.script, arguments.output)
+        finally:
+            if journal is not None:
+                journal.close()
+            if arguments.metrics:
+                write_metrics(arguments.metrics)
+
     try:
-        # setup initial stock of inventory
-        product_list = [products.Product("MacBook Air M2", price=1450, quantity=100),
-                        products.Product("Bose QuietComfort Earbuds", price=250,
-                                         quantity=500),
-                        products.Product("Google Pixel 7", price=500, quantity=250),
-                        products.NonStockedProduct("Windows License", price=125),
-                        products.LimitedProduct("Shipping", price=10, quantity=250,
-                                                maximum=1)
-                        ]
-
-        # Create promotion catalog
-        second_half_price = promotions.SecondHalfPrice("Second Half price!")
-        third_one_free = promotions.ThirdOneFree("Third One Free!")
-        thirty_percent = promotions.PercentDiscount("30% off!", percent=30)
-        ten_percent = promotions.PercentDiscount("10% off!", percent=10)
-
-        # Add promotions to products
-        product_list[0].promotion = second_half_price
-        product_list[1].promotion = ten_percent
-        product_list[2].promotion = third_one_free
-        product_list[3].promotion = thirty_percent
-
-        best_buy = store.Store(product_list)
-        start(best_buy)
+        if arguments.profile:
+            failed = profile_run(session, arguments.profile)
+        else:
+            failed = session()
     except NameError as e:
         print(e)
     except ValueError as e:
         print(e)
     except TypeError as e:
         print(e)
+    except OSError as e:
+        print(e)
+    else:
+        if failed:
+            sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,465 @@
+import bisect
+import functools
+import itertools
+import json
+import math
+import threading
+import time
+
+import products
+import promotions
+from reservations import ReservationManager
+from sharding import ShardedStore
+from store import Store, StoreView
+
+# Upper bounds (seconds) of the latency histogram buckets, from 1 us to 1 s
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3,
+           2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+# Only one call in SAMPLE_EVERY of the operations that run for every order
+# (Store.order, StoreView.order and Product.buy) is timed
+SAMPLE_EVERY = 64
+
+# Rejection reasons, by a piece of the message of the ValueError raised
+REJECTIONS = (('above the quantity', 'over_stock'),
+              ('per order is allowed', 'over_maximum'),
+              ('Quantity must be', 'invalid_quantity'),
+              ('There is no product', 'unknown_product'))
+
+
+def rejection_category(error: Exception) -> str:
+    """ Returns the reason (str) of the ValueError that rejected an order """
+    message = str(error)
+    for piece, category in REJECTIONS:
+        if piece in message:
+            return category
+    return 'other'
+
+
+class Histogram:
+    """
+    The Histogram class counts latencies in the buckets of BUCKETS (plus one for
+    the slower ones), and keeps their count and sum, like a Prometheus histogram.
+    The latencies are first appended to the pending list, which is cheap enough
+    for the hot path (list.append is atomic, so no lock is taken), and counted by
+    fold in one go.
+    Every call ticks the ticks counter (next() is atomic too), timed or not, so
+    calls counts all the calls while count only counts the timed ones.
+    """
+    __slots__ = ('counts', 'count', 'sum', 'pending', 'ticks', 'calls', '_reads',
+                 '_calls_at_reset')
+
+    def __init__(self):
+        """ Constructor of the Histogram class """
+        self.pending = []
+        self.ticks = itertools.count()
+        self._reads = 0
+        self._calls_at_reset = 0
+        self.calls = 0
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def _ticked(self) -> int:
+        """ Returns how many calls ticked so far (reading the counter ticks it) """
+        ticked = next(self.ticks) - self._reads
+        self._reads += 1
+        return ticked
+
+    def reset(self):
+        """
+        Forgets every latency and call. The pending list and the ticks counter
+        stay the same objects, since the instrumented functions use them.
+        """
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.pending.clear()
+        self._calls_at_reset = self._ticked()
+        self.calls = 0
+
+    def fold(self):
+        """ Counts the pending latencies. The caller holds the lock of the metrics """
+        pending = self.pending
+        latencies = sorted(pending[:])
+        # Only the copied latencies go: other threads may have appended more
+        del pending[:len(latencies)]
+        start = 0
+        for bucket, bound in enumerate(BUCKETS):
+            end = bisect.bisect_right(latencies, bound, start)
+            self.counts[bucket] += end - start
+            start = end
+        self.counts[-1] += len(latencies) - start
+        self.count += len(latencies)
+        self.sum += math.fsum(latencies)
+        self.calls = self._ticked() - self._calls_at_reset
+
+
+class Metrics:
+    """
+    The Metrics class holds what the instrumentation records: a latency histogram
+    (with the call count) per operation, the rejections per operation and reason,
+    and the units sold per product key. It exports them as a JSON snapshot or as
+    Prometheus text.
+    Recording a call only appends to lists; the calls are counted every FOLD_SIZE
+    timed calls of an operation, and before a snapshot. The units sold are added
+    up when the metrics are read (or once MAX_PENDING_SALES lists of sold lines
+    are pending): adding them up line by line as the orders are bought would cost
+    more than the rest of the instrumentation.
+    """
+    FOLD_SIZE = 4096
+    MAX_PENDING_SALES = 1 << 16
+
+    def __init__(self):
+        """ Constructor of the Metrics class """
+        self._lock = threading.Lock()
+        self._latencies = {}
+        # Pending (operation, reason) rejections and lists of sold lines
+        self._rejected = []
+        self._sold = []
+        self._rejections = {}
+        self._units_sold = {}
+
+    def reset(self):
+        """ Forgets everything recorded so far """
+        with self._lock:
+            for histogram in self._latencies.values():
+                histogram.reset()
+            self._rejected.clear()
+            self._sold.clear()
+            self._rejections = {}
+            self._units_sold = {}
+
+    def histogram(self, operation: str) -> Histogram:
+        """ Returns the latency histogram of an operation """
+        histogram = self._latencies.get(operation)
+        if histogram is None:
+            with self._lock:
+                histogram = self._latencies.setdefault(operation, Histogram())
+        return histogram
+
+    def observe(self, operation: str, seconds: float, error: Exception = None,
+                lines=()):
+        """
+        Records a call.
+        :param operation: name of the operation
+        :param seconds: latency of the call
+        :param error: the ValueError that rejected the call, if it was rejected
+        :param lines: (product, quantity) lines sold by the call
+        """
+        histogram = self.histogram(operation)
+        next(histogram.ticks)
+        pending = histogram.pending
+        pending.append(seconds)
+        if error is not None:
+            self._rejected.append((operation, rejection_category(error)))
+        elif lines:
+            self._sold.append(lines)
+        if len(pending) >= self.FOLD_SIZE:
+            self.fold()
+
+    def fold(self):
+        """ Counts the pending calls """
+        with self._lock:
+            for histogram in self._latencies.values():
+                histogram.fold()
+            rejected = self._rejected[:]
+            del self._rejected[:len(rejected)]
+            for reason in rejected:
+                self._rejections[reason] = self._rejections.get(reason, 0) + 1
+            sold = self._sold[:]
+            del self._sold[:len(sold)]
+            # By product, not by key: the keys are looked up by the snapshot
+            units_sold = self._units_sold
+            for lines in sold:
+                for product, quantity in lines:
+                    units_sold[product] = units_sold.get(product, 0) + quantity
+
+    def snapshot(self) -> dict:
+        """
+        Returns everything recorded so far (dict, ready for JSON): calls, timed
+        calls, latency histogram of the timed calls (bucket upper bounds and
+        counts, sum), rejections by reason of every operation, and units sold by
+        product key.
+        """
+        self.fold()
+        with self._lock:
+            operations = {}
+            for operation, histogram in self._latencies.items():
+                operations[operation] = {
+                    'calls': histogram.calls,
+                    'timed_calls': histogram.count,
+                    'latency_seconds_sum': histogram.sum,
+                    'latency_buckets': dict(zip([str(bound) for bound in BUCKETS] +
+                                                ['+Inf'], histogram.counts)),
+                    'rejections': {}}
+            for (operation, reason), count in self._rejections.items():
+                operations[operation]['rejections'][reason] = count
+            units_sold = {}
+            for product, units in self._units_sold.items():
+                # The orders of a ShardedStore may give the product keys
+                key = getattr(product, 'key', product)
+                units_sold[key] = units_sold.get(key, 0) + units
+            return {'operations': operations, 'units_sold': units_sold}
+
+    def to_json(self) -> str:
+        """ Returns the snapshot as JSON text """
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        """ Returns everything recorded so far in the Prometheus text format """
+        snapshot = self.snapshot()
+        lines = ["# TYPE store_latency_seconds histogram"]
+        for operation, recorded in snapshot['operations'].items():
+            label = f'operation="{_escape(operation)}"'
+            cumulative = 0
+            for bound, count in recorded['latency_buckets'].items():
+                cumulative += count
+                lines.append(f'store_latency_seconds_bucket{{{label},le="{bound}"}} '
+                             f'{cumulative}')
+            lines.append(f"store_latency_seconds_sum{{{label}}} "
+                         f"{recorded['latency_seconds_sum']}")
+            lines.append(f"store_latency_seconds_count{{{label}}} "
+                         f"{recorded['timed_calls']}")
+        lines.append("# TYPE store_calls_total counter")
+        for operation, recorded in snapshot['operations'].items():
+            lines.append(f'store_calls_total{{operation="{_escape(operation)}"}} '
+                         f"{recorded['calls']}")
+        lines.append("# TYPE store_rejections_total counter")
+        for operation, recorded in snapshot['operations'].items():
+            for reason, count in recorded['rejections'].items():
+                lines.append(f'store_rejections_total{{operation="{_escape(operation)}",'
+                             f'reason="{reason}"}} {count}')
+        lines.append("# TYPE store_units_sold_total counter")
+        for key, units in snapshot['units_sold'].items():
+            lines.append(f'store_units_sold_total{{product="{_escape(key)}"}} {units}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """ Escapes a Prometheus label value """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = Metrics()
+
+# Original attributes replaced by the instrumentation: (class, name) -> attribute
+_originals = {}
+
+
+def _timed(operation: str, function, registry: Metrics, sold=None,
+           sample: int = 1):
+    """
+    Wraps a function to record its calls, its latency, its rejections (ValueError)
+    and, when it succeeds, the lines it sold. The wrapper takes positional
+    arguments only, which is how the instrumented methods are called.
+    :param sold: function of the tuple of the call arguments returning the sold
+    (product, quantity) lines. The lines are only read when the calls are
+    counted, so the caller must not change them (the shopping list of an order)
+    afterwards.
+    :param sample: only one call in sample is timed, the others are only counted
+    (with their rejections and sold lines), which saves the clock calls
+    """
+    clock = time.perf_counter
+    histogram = registry.histogram(operation)
+    pending, ticks = histogram.pending, histogram.ticks
+    rejected, sold_lines = registry._rejected, registry._sold
+    fold_size, max_pending_sales = registry.FOLD_SIZE, registry.MAX_PENDING_SALES
+
+    @functools.wraps(function)
+    def timed(*arguments):
+        if next(ticks) % sample:
+            try:
+                result = function(*arguments)
+            except ValueError as error:
+                rejected.append((operation, rejection_category(error)))
+                raise
+            if sold is not None:
+                sold_lines.append(sold(arguments))
+            return result
+        started = clock()
+        try:
+            result = function(*arguments)
+        except ValueError as error:
+            pending.append(clock() - started)
+            rejected.append((operation, rejection_category(error)))
+            raise
+        pending.append(clock() - started)
+        if sold is not None:
+            sold_lines.append(sold(arguments))
+        if len(pending) >= fold_size or len(sold_lines) >= max_pending_sales:
+            registry.fold()
+        return result
+    return timed
+
+
+def _timed_order(operation: str, function, registry: Metrics):
+    """
+    Wraps an order(store, shopping_list) method like _timed, with the shopping
+    list as the sold lines and one call in SAMPLE_EVERY timed. It is written out
+    for the two arguments of an order, since it runs for every order.
+    """
+    clock = time.perf_counter
+    histogram = registry.histogram(operation)
+    pending, ticks = histogram.pending, histogram.ticks
+    rejected, sold_lines = registry._rejected, registry._sold
+    fold_size, max_pending_sales = registry.FOLD_SIZE, registry.MAX_PENDING_SALES
+
+    @functools.wraps(function)
+    def timed(store_obj, shopping_list):
+        if next(ticks) % SAMPLE_EVERY:
+            try:
+                result = function(store_obj, shopping_list)
+            except ValueError as error:
+                rejected.append((operation, rejection_category(error)))
+                raise
+            sold_lines.append(shopping_list)
+            return result
+        started = clock()
+        try:
+            result = function(store_obj, shopping_list)
+        except ValueError as error:
+            pending.append(clock() - started)
+            rejected.append((operation, rejection_category(error)))
+            raise
+        pending.append(clock() - started)
+        sold_lines.append(shopping_list)
+        if len(pending) >= fold_size or len(sold_lines) >= max_pending_sales:
+            registry.fold()
+        return result
+    return timed
+
+
+def _timed_batch(operation: str, function, registry: Metrics):
+    """
+    Wraps Store.order_many to record every batch as one call, with its latency,
+    the rejections of its rejected orders and the lines of its accepted orders.
+    The accepted orders are picked all at once, so recording costs the same for
+    a batch of any size.
+    """
+    clock = time.perf_counter
+    histogram = registry.histogram(operation)
+    pending, ticks = histogram.pending, histogram.ticks
+    rejected, sold_lines = registry._rejected, registry._sold
+    fold_size, max_pending_sales = registry.FOLD_SIZE, registry.MAX_PENDING_SALES
+
+    @functools.wraps(function)
+    def timed(store_obj, shopping_lists, errors=None):
+        next(ticks)
+        batch_errors = []
+        started = clock()
+        results = function(store_obj, shopping_lists, batch_errors)
+        pending.append(clock() - started)
+        rejected.extend((operation, rejection_category(error))
+                        for index, error in batch_errors)
+        # The results of the rejected orders are None
+        sold_lines.extend(itertools.compress(shopping_lists, results))
+        if errors is not None:
+            errors.extend(batch_errors)
+        if len(pending) >= fold_size or len(sold_lines) >= max_pending_sales:
+            registry.fold()
+        return results
+    return timed
+
+
+def _timed_confirm(operation: str, function, registry: Metrics):
+    """
+    Wraps ReservationManager.confirm like _timed, with the lines of the hold as
+    the sold lines. They are looked up before the call, which drops the hold.
+    """
+    clock = time.perf_counter
+    histogram = registry.histogram(operation)
+    pending, ticks = histogram.pending, histogram.ticks
+    rejected, sold_lines = registry._rejected, registry._sold
+    fold_size, max_pending_sales = registry.FOLD_SIZE, registry.MAX_PENDING_SALES
+
+    @functools.wraps(function)
+    def timed(manager, hold_id):
+        next(ticks)
+        hold = manager._holds.get(hold_id)
+        started = clock()
+        try:
+            result = function(manager, hold_id)
+        except ValueError as error:
+            pending.append(clock() - started)
+            rejected.append((operation, rejection_category(error)))
+            raise
+        pending.append(clock() - started)
+        if hold is not None:
+            sold_lines.append(hold[0])
+        if len(pending) >= fold_size or len(sold_lines) >= max_pending_sales:
+            registry.fold()
+        return result
+    return timed
+
+
+def _buy_lines(arguments: tuple) -> tuple:
+    """ Returns the line sold by Product.buy(product, buyer, quantity) """
+    return ((arguments[0], arguments[2]),)
+
+
+def _replace(owner, name: str, attribute):
+    """
+    Replaces an attribute of a class (or module), keeping the original to restore
+    it
+    """
+    _originals.setdefault((owner, name), owner.__dict__[name])
+    setattr(owner, name, attribute)
+
+
+def _promotion_classes(cls=promotions.Promotion):
+    """ Returns all the subclasses of a class, at any depth """
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _promotion_classes(subclass)
+
+
+def enable(registry: Metrics = REGISTRY):
+    """
+    Turns the instrumentation on: wraps Store.order, StoreView.order,
+    Store.order_many, ShardedStore.order_many, ReservationManager.confirm,
+    Product.buy, the apply_promotion_batch method of every promotion class, and
+    the Store.all_products and Store.total_quantity properties.
+    While it is off nothing is wrapped, so it costs nothing. A batch of orders is
+    recorded as one call, and the pricing of a batch as one call per promotion
+    class of its lines. Orders and buys are only timed once every SAMPLE_EVERY
+    calls, and counted every time. The pricing functions the products resolve
+    from their promotion (Promotion.price) are not wrapped: a wrapper per line
+    would cost more than the pricing itself, so the pricing of a single order is
+    part of its latency.
+    """
+    if _originals:
+        disable()
+    _replace(Store, 'order', _timed_order('store_order', Store.order, registry))
+    _replace(StoreView, 'order', _timed_order('store_view_order', StoreView.order,
+                                              registry))
+    _replace(Store, 'order_many', _timed_batch('store_order_many', Store.order_many,
+                                               registry))
+    # The orders of the shards are bought in the shard processes: they are
+    # recorded here, confirmed holds of the orders that span shards included
+    _replace(ShardedStore, 'order_many', _timed_batch(
+        'sharded_order_many', ShardedStore.order_many, registry))
+    _replace(ReservationManager, 'confirm', _timed_confirm(
+        'reservations_confirm', ReservationManager.confirm, registry))
+    _replace(products.Product, 'buy', _timed('product_buy', products.Product.buy,
+                                             registry, _buy_lines, SAMPLE_EVERY))
+    for name in ('all_products', 'total_quantity'):
+        getter = Store.__dict__[name].fget
+        _replace(Store, name, property(_timed(f"store_{name}", getter, registry),
+                                       doc=getter.__doc__))
+    for cls in _promotion_classes():
+        if 'apply_promotion_batch' in cls.__dict__:
+            _replace(cls, 'apply_promotion_batch', _timed(
+                f"{cls.__name__}.apply_promotion_batch",
+                cls.__dict__['apply_promotion_batch'], registry))
+
+
+def disable():
+    """ Turns the instrumentation off, putting back the original methods """
+    while _originals:
+        (owner, name), attribute = _originals.popitem()
+        setattr(owner, name, attribute)
+
+
+def enabled() -> bool:
+    """ Returns True if the instrumentation is on """
+    return bool(_originals)
@@ -0,0 +1,345 @@
+import json
+import os
+import struct
+import threading
+
+import inventory
+import products
+
+# Types of the log records
+ADD = 1
+REMOVE = 2
+UPDATE = 4
+
+# Every record is a header (record type, payload length) followed by the payload.
+# UPDATE payloads are the quantity, active flag, price and length of the promotion
+# name, followed by the promotion name and the product key. ADD payloads are the
+# product described as JSON, REMOVE payloads are the key.
+_HEADER = struct.Struct('<BI')
+_UPDATE = struct.Struct('<qBdH')
+
+SNAPSHOT_FILE = 'snapshot.json'
+SEGMENT_FILE = 'wal-{:08d}.log'
+
+
+def describe_product(product: object) -> dict:
+    """
+    Returns a description (dict) of a product with everything needed to create it
+    again: kind, name, price, quantity, maximum, active flag and promotion name.
+    """
+    # Rows of an InventoryTable tell their kind with a kind code
+    kind_code = getattr(product, 'kind', None)
+    if isinstance(product, products.NonStockedProduct) or \
+            kind_code == inventory.NON_STOCKED:
+        kind = 'non_stocked'
+    elif isinstance(product, products.LimitedProduct) or kind_code == inventory.LIMITED:
+        kind = 'limited'
+    else:
+        kind = 'product'
+    description = {'kind': kind, 'name': product.key, 'price': product.price,
+                   'quantity': product.quantity, 'active': bool(product._active),
+                   'promotion': getattr(product.promotion, 'name', None)}
+    if kind == 'limited':
+        description['maximum'] = product._max_purchase
+    return description
+
+
+def build_product(description: dict, promotion_catalog: dict = None):
+    """
+    Creates a product (Product object) from its description.
+    :param description: description (dict) made by describe_product
+    :param promotion_catalog: promotions (Promotion objects) by name
+    :return: Product, NonStockedProduct or LimitedProduct object
+    """
+    kind = description['kind']
+    if kind == 'non_stocked':
+        product = products.NonStockedProduct(description['name'], description['price'])
+    elif kind == 'limited':
+        product = products.LimitedProduct(description['name'], description['price'],
+                                          description['quantity'],
+                                          description['maximum'])
+    elif kind == 'product':
+        product = products.Product(description['name'], description['price'],
+                                   description['quantity'])
+    else:
+        raise ValueError(f"Unknown product kind '{kind}'")
+    promotion = description.get('promotion')
+    if promotion is not None and promotion_catalog and promotion in promotion_catalog:
+        product.promotion = promotion_catalog[promotion]
+    if not description.get('active', True):
+        product.deactivate()
+    return product
+
+
+def _read_records(path: str):
+    """
+    Reads the records of a log segment. Stops at the first incomplete record (the
+    tail of a write that was cut short by a crash).
+    :return: generator of (record type, payload) tuples
+    """
+    with open(path, 'rb') as log_file:
+        data = log_file.read()
+    offset = 0
+    while offset + _HEADER.size <= len(data):
+        record_type, length = _HEADER.unpack_from(data, offset)
+        offset += _HEADER.size
+        if offset + length > len(data):
+            break
+        yield record_type, data[offset:offset + length]
+        offset += length
+
+
+class InventoryJournal:
+    """
+    The InventoryJournal class makes the inventory of a store durable.
+    Every product added or removed, and every change of quantity, active state,
+    price or promotion (orders included) is appended to a write-ahead log. A
+    record holds the new state of the product, not the change, so replaying a
+    record twice is harmless.
+    The log is fsynced in groups: after group_size records, or group_delay seconds
+    after the first record that was not yet synced. Every snapshot_every records a
+    snapshot of the whole inventory is written and a new log segment is started,
+    so recovery only replays the log written after the last snapshot.
+    In synchronous mode every record is fsynced before the change that wrote it
+    returns, so an order that returned is never lost.
+    """
+
+    def __init__(self, directory: str, group_size: int = 256, group_delay: float = 0.005,
+                 snapshot_every: int = 100_000, synchronous: bool = False):
+        """
+        Constructor of the InventoryJournal class.
+        :param directory: directory of the snapshot and log files
+        :param group_size: number of records written between two fsyncs
+        :param group_delay: longest time a record waits for its fsync (seconds)
+        :param snapshot_every: number of records written between two snapshots
+        :param synchronous: if True, every record is fsynced as it is written
+        """
+        self._directory = directory
+        self._group_size = 1 if synchronous else group_size
+        self._group_delay = group_delay
+        self._snapshot_every = snapshot_every
+        self._store = None
+        self._fd = None
+        self._segment = 0
+        self._unsynced = 0
+        self._since_snapshot = 0
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def _segments(self) -> list:
+        """ Returns the numbers of the log segments on disk, in order """
+        segments = []
+        for name in os.listdir(self._directory):
+            if name.startswith('wal-') and name.endswith('.log'):
+                segments.append(int(name[4:-4]))
+        return sorted(segments)
+
+    def open(self, store_obj: object, promotion_catalog: dict = None) -> int:
+        """
+        Recovers the store from the last snapshot and the log written after it
+        (if there are any), then starts logging the changes of the store.
+        Products of the store that were removed are removed, products that were
+        added are created again, the others get their saved quantity and state.
+        :param store_obj: store object
+        :param promotion_catalog: promotions (Promotion objects) by name, used to
+        set the promotion of the products created again
+        :return: number of log records replayed (int)
+        """
+        os.makedirs(self._directory, exist_ok=True)
+        state, replayed = self._load(store_obj)
+        if state is not None:
+            self._restore(store_obj, state, promotion_catalog)
+
+        segments = self._segments()
+        self._segment = segments[-1] if segments else 1
+        if not os.path.exists(self._path(SNAPSHOT_FILE)):
+            # Saves the starting inventory, which is not in the log, before the
+            # first record is written, so the log always has a snapshot under it
+            if segments:
+                self._segment += 1
+            self._write_snapshot(self._segment, list(store_obj._products.values()))
+        self._fd = os.open(self._path(SEGMENT_FILE.format(self._segment)),
+                           os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._store = store_obj
+        store_obj._journal = self
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+        return replayed
+
+    def _load(self, store_obj: object) -> tuple:
+        """
+        Reads the last snapshot and replays the log after it. A log without a
+        snapshot is replayed over the products the store has now.
+        :param store_obj: store object
+        :return: the saved products (dict of descriptions by key, or None if there
+        is nothing saved) and the number of log records replayed (tuple)
+        """
+        state, first_segment = None, 0
+        snapshot_path = self._path(SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            state = {description['name']: description
+                     for description in snapshot['products']}
+            first_segment = snapshot['segment']
+
+        replayed = 0
+        for segment in self._segments():
+            if segment < first_segment:
+                continue
+            if state is None:
+                state = {product.key: describe_product(product)
+                         for product in store_obj._products.values()}
+            for record_type, payload in _read_records(
+                    self._path(SEGMENT_FILE.format(segment))):
+                replayed += 1
+                if record_type == ADD:
+                    description = json.loads(payload)
+                    state[description['name']] = description
+                elif record_type == REMOVE:
+                    state.pop(payload.decode(), None)
+                elif record_type == UPDATE:
+                    quantity, active, price, length = _UPDATE.unpack_from(payload)
+                    promotion = payload[_UPDATE.size:_UPDATE.size + length].decode()
+                    description = state.get(payload[_UPDATE.size + length:].decode())
+                    if description is not None:
+                        # Whole prices were given as int (the log keeps a double)
+                        description.update(quantity=quantity, active=bool(active),
+                                           price=int(price) if price.is_integer()
+                                           else price, promotion=promotion or None)
+        return state, replayed
+
+    @staticmethod
+    def _restore(store_obj: object, state: dict, promotion_catalog: dict):
+        """
+        Brings the products of the store in line with the saved products.
+        """
+        for product in list(store_obj._products.values()):
+            if product.key not in state:
+                store_obj.remove_product(product)
+        for key, description in state.items():
+            if key not in store_obj:
+                store_obj.add_product(build_product(description, promotion_catalog))
+                continue
+            product = store_obj.get_product(key)
+            if product.price != description['price']:
+                product.price = description['price']
+            promotion = description.get('promotion')
+            if getattr(product.promotion, 'name', None) != promotion:
+                if promotion is None:
+                    product.promotion = None
+                elif promotion_catalog and promotion in promotion_catalog:
+                    product.promotion = promotion_catalog[promotion]
+            with products.lock_for(product):
+                # Puts back (or takes out) the difference with the saved quantity
+                product._release_stock(description['quantity'] - product.quantity)
+            if description['active'] and not product._active:
+                product.activate()
+            elif not description['active'] and product._active:
+                product.deactivate()
+
+    def _write(self, record_type: int, payload: bytes):
+        """ Appends a record to the log, and fsyncs it if the group is full """
+        record = _HEADER.pack(record_type, len(payload)) + payload
+        with self._lock:
+            if self._fd is None:
+                return
+            os.write(self._fd, record)
+            self._unsynced += 1
+            self._since_snapshot += 1
+            sync = self._unsynced >= self._group_size
+            if sync:
+                self._unsynced = 0
+                fd = self._fd
+        if sync:
+            os.fsync(fd)
+
+    def record_add(self, product: object):
+        """ Logs that a product was added to the store """
+        self._write(ADD, json.dumps(describe_product(product)).encode())
+
+    def record_remove(self, product: object):
+        """ Logs that a product was removed from the store """
+        self._write(REMOVE, product.key.encode())
+
+    def record_change(self, product: object):
+        """ Logs the new quantity, active state, price and promotion of a product """
+        promotion = getattr(product.promotion, 'name', None) or ''
+        promotion = promotion.encode()
+        self._write(UPDATE, _UPDATE.pack(product.quantity, bool(product._active),
+                                         product.price, len(promotion)) +
+                    promotion + product.key.encode())
+
+    def sync(self):
+        """ fsyncs the records written so far """
+        with self._lock:
+            fd, self._unsynced = self._fd, 0
+        if fd is not None:
+            os.fsync(fd)
+
+    def _flush_periodically(self):
+        """ Background thread: fsyncs and takes snapshots when they are due """
+        while not self._stop.wait(self._group_delay):
+            if self._unsynced:
+                self.sync()
+            if self._since_snapshot >= self._snapshot_every:
+                self.snapshot()
+
+    def snapshot(self):
+        """
+        Writes a snapshot of the whole inventory and starts a new log segment.
+        The log segments before the snapshot are deleted.
+        """
+        with self._snapshot_lock:
+            store_obj = self._store
+            with self._lock:
+                old_fd = self._fd
+                self._segment += 1
+                self._fd = os.open(self._path(SEGMENT_FILE.format(self._segment)),
+                                   os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self._unsynced = self._since_snapshot = 0
+                segment = self._segment
+                with store_obj._lock:
+                    product_list = list(store_obj._products.values())
+            os.fsync(old_fd)
+            os.close(old_fd)
+
+            # Changes made from now on are in the new segment, and replaying them
+            # over this snapshot gives the same state
+            self._write_snapshot(segment, product_list)
+
+    def _write_snapshot(self, segment: int, product_list: list):
+        """
+        Writes the snapshot of the given products atomically, then deletes the log
+        segments before the given segment.
+        """
+        snapshot = {'segment': segment,
+                    'products': [describe_product(product) for product in product_list]}
+        temporary_path = self._path(SNAPSHOT_FILE + '.tmp')
+        with open(temporary_path, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temporary_path, self._path(SNAPSHOT_FILE))
+        for old_segment in self._segments():
+            if old_segment < segment:
+                os.remove(self._path(SEGMENT_FILE.format(old_segment)))
+
+    def close(self):
+        """ Stops logging: fsyncs the log and detaches from the store """
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._store is not None:
+            self._store._journal = None
+        with self._lock:
+            fd, self._fd = self._fd, None
+        if fd is not None:
+            os.fsync(fd)
+            os.close(fd)
@@ -1,3 +1,61 @@
+import threading
+from contextlib import contextmanager
+
+import promotions
+
+# Products are guarded by a fixed pool of re-entrant locks, picked by product key,
+# so every product has its own lock (shared with a few others) without a lock
+# object per product.
+LOCK_STRIPES = 1024
+_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+
+
+def lock_for(product: object):
+    """
+    Returns the lock (RLock object) that guards the quantity of the product.
+    """
+    return _locks[hash(product.key) % LOCK_STRIPES]
+
+
+@contextmanager
+def locked(product_list):
+    """
+    Context manager that holds the locks of all the given products.
+    The locks are always taken in the same (stripe) order, so two orders that share
+    products cannot deadlock, whatever the order of their lines.
+    """
+    stripes = sorted({hash(product.key) % LOCK_STRIPES for product in product_list})
+    for stripe in stripes:
+        _locks[stripe].acquire()
+    try:
+        yield
+    finally:
+        for stripe in reversed(stripes):
+            _locks[stripe].release()
+
+
+def validate_product(name: str, price: float, quantity: int):
+    """
+    Validates the arguments used to create a product. If something is invalid
+    (empty name / negative price or quantity), raises an exception.
+    """
+    if not name:
+        raise NameError("The argument: 'name' cannot be empty")
+    if isinstance(name, int):
+        raise NameError("The argument: 'name' must be a string")
+    else:
+        if name.isdigit():
+            raise NameError("The argument: 'name' must be string")
+    if isinstance(price, str):
+        raise ValueError("The argument: 'price' must be a number")
+    elif price <= 0:
+        raise ValueError("The argument: 'price' must be greater than 0")
+    if isinstance(quantity, str):
+        raise ValueError("The argument: 'price' must be an integer")
+    elif quantity < 0:
+        raise ValueError("The argument: 'quantity' must be greater than 0")
+
+
 class Product:
     """
     The Product class represents a specific type of product available in the store
@@ -6,8 +64,14 @@ class Product:
     It includes an attribute to keep track of the total quantity of items of that
     product currently available in the store. When someone will purchase it,
     the amount will be modified accordingly.
+    Products use slots instead of an instance dictionary, to keep them small in
+    large catalogs.
     """
-    promotion_obj = object()
+    __slots__ = ('_key', '_price', '_quantity', '_active', '_total_price',
+                 '_promotion', '_pricer', '_observers', '_rendered')
+    # Buying the product takes the items out of its quantity
+    _tracks_stock = True
+    _non_stocked_product = False
 
     def __init__(self, name: str, price: float, quantity: int):
         """
@@ -16,28 +80,51 @@ class Product:
         raises an exception.
         """
 
-        if not name:
-            raise NameError("The argument: 'name' cannot be empty")
-        if isinstance(name, int):
-            raise NameError("The argument: 'name' must be a string")
-        else:
-            if name.isdigit():
-                raise NameError("The argument: 'name' must be string")
-        if isinstance(price, str):
-            raise ValueError("The argument: 'price' must be a number")
-        elif price <= 0:
-            raise ValueError("The argument: 'price' must be greater than 0")
-        if isinstance(quantity, str):
-            raise ValueError("The argument: 'price' must be an integer")
-        elif quantity < 0:
-            raise ValueError("The argument: 'quantity' must be greater than 0")
+        validate_product(name, price, quantity)
 
-        self._product_name = name
+        self._key = name
         self._price = price
         self._quantity = quantity
         self._active = True
-        self._non_stocked_product = False
         self._total_price = 0
+        # No promotion is set on the product
+        self._promotion = None
+        # Pricing function of the product, resolved when the promotion is set
+        self._pricer = promotions.full_price
+        # Callbacks (e.g. of the stores holding the product) notified on every change.
+        # A tuple, so that the many products without observers share the empty one
+        self._observers = ()
+        # Line shown by __str__, rendered again after the product changes
+        self._rendered = None
+
+    def _notify(self, quantity_delta: int = 0):
+        """
+        Notifies the observers of the product that the product has changed, and
+        drops the rendered line of the product.
+        :param quantity_delta: change of the quantity of the product (int)
+        """
+        self._rendered = None
+        for observer in self._observers:
+            observer(self, quantity_delta)
+
+    @property
+    def key(self) -> str:
+        """
+        Getter function for key. Returns the stable key (str) of the product, which
+        is the name it was created with. Unlike the name, the key does not change
+        when the product is deactivated.
+        """
+        return self._key
+
+    @property
+    def _product_name(self) -> str:
+        """
+        Returns the name of the product as it is shown, which is the key with
+        " (deactivated)" appended if the product is deactivated.
+        """
+        if self._active:
+            return self._key
+        return self._key + ' (deactivated)'
 
     @property
     def price(self) -> float:
@@ -49,7 +136,9 @@ class Product:
         """ Setter function for price. """
         if new_price <= 0:
             raise ValueError("Price must be greater than 0")
-        self._price = new_price
+        with lock_for(self):
+            self._price = new_price
+            self._notify()
 
     @property
     def total_price(self) -> float:
@@ -63,16 +152,22 @@ class Product:
 
     @property
     def promotion(self):
-        """ Getter function for the promotion object (class variable).
-        Returns the promotion object"""
-        return self.promotion_obj
+        """ Getter function for the promotion object.
+        Returns the promotion object, or None if no promotion is set"""
+        return self._promotion
 
     @promotion.setter
     def promotion(self, promotion_objt: object):
         """
-         Setter function for the promotion object (class variable).
+         Setter function for the promotion object (None removes the promotion).
         """
-        self.promotion_obj = promotion_objt
+        with lock_for(self):
+            self._promotion = promotion_objt
+            if promotion_objt is None:
+                self._pricer = promotions.full_price
+            else:
+                self._pricer = promotion_objt.price
+            self._notify()
 
     @property
     def quantity(self) -> float:
@@ -89,23 +184,25 @@ class Product:
         """
         if isinstance(quantity, str):
             raise ValueError("The argument: 'quantity' must be an integer")
-        self._quantity += quantity
+        with lock_for(self):
+            old_quantity = self._quantity
+            self._quantity += quantity
 
-        # Deactivates product if product quantity is 0 (i.e., it is out of stock)
-        if self._quantity <= 0:
-            self._quantity = 0
-            self.deactivate()
+            # Deactivates product if product quantity is 0 (i.e., it is out of stock)
+            if self._quantity <= 0:
+                self._quantity = 0
+                self.deactivate()
+            self._notify(self._quantity - old_quantity)
 
     @property
     def is_active(self) -> bool:
         """
         Getter function for active.
         Returns True if the product is active, otherwise False.
+        A product that is out of stock is not active.
         :return: True or False (bool)
         """
-        if self._quantity <= 0:
-            self._active = False
-        return self._active
+        return self._active and self._quantity > 0
 
     def is_non_stocked_product(self):
         """
@@ -119,15 +216,17 @@ class Product:
         """
         Activates the product.
         """
-        self._active = True
-        self._product_name = self._product_name.removesuffix(' (deactivated)').strip()
+        with lock_for(self):
+            self._active = True
+            self._notify()
 
     def deactivate(self):
         """
         Deactivates the product
         """
-        self._active = False
-        self._product_name += ' (deactivated)'
+        with lock_for(self):
+            self._active = False
+            self._notify()
 
     def __len__(self):
         return self._price
@@ -136,6 +235,19 @@ class Product:
         return len(self) > len(other)
 
     def __str__(self):
+        """
+        Returns a string that represents the product (see _render). The string is
+        rendered once and cached until the product changes. It is rendered holding
+        the lock of the product, which every change of the product also holds, so a
+        string rendered before a change can't be cached after it.
+        """
+        rendered = self._rendered
+        if rendered is None:
+            with lock_for(self):
+                rendered = self._rendered = self._render()
+        return rendered
+
+    def _render(self):
         """
         Returns a string that represents the product, for example:
         "MacBook Air M2, Price: 1450, Quantity: 100, Promotion: 30% off"
@@ -145,37 +257,72 @@ class Product:
             try:
                 return f"{self._product_name}, Price: {self._price}, " \
                        f"Quantity: {self._quantity}, Promotion: " \
-                       f"{self.promotion_obj.name}"
+                       f"{self._promotion.name}"
             except AttributeError:
                 # if there is no promotion
                 return f"{self._product_name}, Price: {self._price}, " \
                        f"Quantity: {self._quantity}, Promotion: None"
 
-    def buy(self, product: object, quantity: int) -> float:
+    def _check_quantity(self, quantity: int, allocated: int = 0):
         """
-        Gets a product object and given quantity of the product.
-        If promotion is set on the product, it applies promotion on the product.
-        Returns the total price (float) of the purchase or the discounted price
-        Updates the quantity of the product.
+        Checks that the given quantity of the product can be bought. If it cannot,
+        raises an exception.
+        :param quantity: order quantity
+        :param allocated: items of the product already taken by earlier order lines
         """
-        if isinstance(quantity, str) or isinstance(quantity, float):
+        if not isinstance(quantity, int):
             raise ValueError("Quantity must be an integer")
         if quantity <= 0:
             raise ValueError("Quantity must be greater than 0")
-        if quantity > self._quantity:
+        if quantity > self._quantity - allocated:
             raise ValueError(f"The quantity {quantity} entered is above the quantity of "
                              "product in the store")
 
+    def _take_stock(self, quantity: int):
+        """
+        Takes the given quantity of items out of the quantity of the product.
+        """
+        self._quantity -= quantity
+        self._notify(-quantity)
+
+    def _release_stock(self, quantity: int):
+        """
+        Puts the given quantity of items back into the quantity of the product
+        (for example, when an order fails after its stock was taken).
+        """
+        self._quantity += quantity
+        self._notify(quantity)
+
+    def _price_purchase(self, quantity: int) -> tuple:
+        """
+        Gets the order quantity. If promotion is set on the product, it applies
+        promotion on the product. Returns the total price of the purchase (or the
+        discounted price) and the total items received (tuple).
+        Does not change the quantity of the product.
+        """
         # Gets the total price for the product [price * quantity]
         self._total_price = self._price * quantity
-        # check if there is promotion for the product
-        if type(self.promotion) != object:
-            discount_price = product.promotion.apply_promotion(product, quantity)
-            self._quantity -= quantity
-            return discount_price
-        else:
-            self._quantity -= quantity
-            return self._total_price
+        return self._pricer(self._price, quantity)
+
+    def buy(self, product: object, quantity: int) -> float:
+        """
+        Gets a product object and given quantity of the product.
+        If promotion is set on the product, it applies promotion on the product.
+        Returns the total price (float) of the purchase or the discounted price
+        Updates the quantity of the product (Non Stocked and Limited Products do
+        not keep track of their quantity).
+        The check and the update of the quantity are done holding the lock of the
+        product, so concurrent buyers cannot oversell it.
+        """
+        with lock_for(self):
+            self._check_quantity(quantity)
+            total_price, total_items_received = self._price_purchase(quantity)
+            if self._tracks_stock:
+                self._take_stock(quantity)
+            # Promotions that give free items return the price and the items
+            if total_items_received:
+                return total_price, total_items_received
+            return total_price
 
 
 class NonStockedProduct(Product):
@@ -184,15 +331,14 @@ class NonStockedProduct(Product):
     of their quantity. for example - a Microsoft Windows license.
     On these products, the quantity is always set to zero and stays that way.
     """
+    __slots__ = ()
+    _tracks_stock = False
+    _non_stocked_product = True
 
     def __init__(self, name: str, price: float):
         """ Initiator (constructor) method. Creates the instance variables for
         NonStockedProduct class  """
         super().__init__(name, price, quantity=0)
-        self._name = name
-        self._price = price
-        self._quantity = 0
-        self._non_stocked_product = True
 
     @property
     def is_active(self) -> bool:
@@ -212,7 +358,7 @@ class NonStockedProduct(Product):
         """
         return self._non_stocked_product
 
-    def __str__(self):
+    def _render(self):
         """
         Returns a string that represents the product, for example:
         "MacBook Air M2, Price: 1450, Quantity: 100, Promotion: Second Half Price"
@@ -220,35 +366,24 @@ class NonStockedProduct(Product):
         """
         try:
             product = f"{self._product_name}, Price: {self._price}, Quantity: Unlimited, " \
-                      f"Promotion: {self.promotion_obj.name}"
+                      f"Promotion: {self._promotion.name}"
         except AttributeError:
             product = f"{self._product_name}, Price: {self._price}, Quantity: Unlimited, " \
                       f"Promotion: None"
         return product
 
-    def buy(self, product: object, quantity: int) -> float:
+    def _check_quantity(self, quantity: int, allocated: int = 0):
         """
-        Gets a product object and given quantity of the product.
-        If promotion is set on the product, it applies promotion on the product.
-        Returns the total price (float) of the purchase or the discounted price
-        Updates the quantity of the product.
-        Quantity in store for Non Stocked Product is unlimited (always zero)
+        Checks that the given quantity of the product can be bought. If it cannot,
+        raises an exception. Non Stocked Product has unlimited quantity.
+        :param quantity: order quantity
+        :param allocated: items of the product already taken by earlier order lines
         """
-        if isinstance(quantity, str) or isinstance(quantity, float):
+        if not isinstance(quantity, int):
             raise ValueError("Quantity must be an integer")
         if quantity <= 0:
             raise ValueError("Quantity must be greater than 0")
 
-        # Gets the total price for the product [price * quantity]
-        self._total_price = self._price * quantity
-
-        # check if there is promotion for the product
-        if type(self.promotion) != object:
-            discount_price = product.promotion.apply_promotion(product, quantity)
-            return discount_price
-
-        return self._total_price
-
 
 class LimitedProduct(Product):
     """
@@ -256,16 +391,16 @@ class LimitedProduct(Product):
     If an order is attempted with quantity larger than the maximum X- number, it
     refuses with an exception.
     """
+    __slots__ = ('_max_purchase',)
+    # The quantity of a Limited Product is not reduced when it is bought
+    _tracks_stock = False
 
     def __init__(self, name: str, price: float, quantity: int, maximum: int):
         """Constructor method. Creates the instance variables for LimitedProduct Class"""
         super().__init__(name, price, quantity)
-        self._product_name = name
-        self._price = price
-        self._quantity = quantity
         self._max_purchase = maximum
 
-    def __str__(self):
+    def _render(self):
         """
         Returns a string that represents the product, for example:
         "MacBook Air M2, Price: 1450, Quantity: 100, Promotion: Second Half Price"
@@ -274,34 +409,24 @@ class LimitedProduct(Product):
         try:
             product = f"{self._product_name}, Price: {self._price}, " \
                       f"Limited to {self._max_purchase} per order!, " \
-                      f"Promotion: {self.promotion_obj.name}"
+                      f"Promotion: {self._promotion.name}"
         except AttributeError:
             product = f"{self._product_name}, Price: {self._price}, " \
                       f"Limited to {self._max_purchase} per order!, " \
                       f"Promotion: None"
         return product
 
-    def buy(self, product: object, quantity: int) -> float:
+    def _check_quantity(self, quantity: int, allocated: int = 0):
         """
-        Gets a product object and given quantity of the product.
-        If promotion is set on the product, it applies promotion on the product.
-        Returns the total price (float) of the purchase or the discounted price
-        Updates the quantity of the product.
+        Checks that the given quantity of the product can be bought in one order
+        line. If it cannot, raises an exception.
+        :param quantity: order quantity
+        :param allocated: items of the product already taken by earlier order lines
         """
-        if isinstance(quantity, str) or isinstance(quantity, float):
+        if not isinstance(quantity, int):
             raise ValueError("Quantity must be an integer")
         if quantity <= 0:
             raise ValueError("Quantity must be greater than 0")
         if quantity > self._max_purchase:
             raise ValueError(f"Error: Only maximum quantity of {self._max_purchase} per "
                              "order is allowed!")
-
-        # Gets the total price for the product [price * quantity]
-        self._total_price = self._price * quantity
-
-        # check if there is promotion for the product
-        if type(self.promotion) != object:
-            discount_price = product.promotion.apply_promotion(product, quantity)
-            return discount_price
-
-        return self._total_price
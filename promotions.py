@@ -1,7 +1,18 @@
 import math
+import operator
 from abc import ABC, abstractmethod
 
 
+def full_price(price: float, quantity: int) -> tuple:
+    """
+    Pricing function of the products without promotion. Gets the price of the
+    product and the order quantity and returns the price of the line.
+    Every pricing function returns the same (total price, total items received)
+    tuple, the total items received is 0 when no free items are given.
+    """
+    return price * quantity, 0
+
+
 class Promotion(ABC):
     """
     The Promotion Class is an Abstract Class that applies discounts and promotions to
@@ -11,11 +22,26 @@ class Promotion(ABC):
         Second item at half price
         Buy 2, get 1 free
     """
+    __slots__ = ('_name',)
 
     def __init__(self, name):
         """ Constructor of the Promotion Class"""
         self._name = name
 
+    def __init_subclass__(cls, **kwargs):
+        """
+        Orders are priced by the price method, and batches of orders by the
+        apply_promotion_batch method. A subclass that overrides apply_promotion
+        but not these gets versions of them that call its apply_promotion, so the
+        override is used on every order.
+        """
+        super().__init_subclass__(**kwargs)
+        if 'apply_promotion' in cls.__dict__:
+            if 'price' not in cls.__dict__:
+                cls.price = Promotion._price_by_apply_promotion
+            if 'apply_promotion_batch' not in cls.__dict__:
+                cls.apply_promotion_batch = Promotion._batch_by_apply_promotion
+
     @property
     def name(self):
         """ Getter method for the name attribute"""
@@ -38,11 +64,65 @@ class Promotion(ABC):
         """
         pass
 
+    @abstractmethod
+    def apply_promotion_batch(self, prices, quantities) -> tuple:
+        """
+        Abstract Method. To be overwritten and implemented by Promotion subclasses.
+        Gets the prices and the order quantities of many order lines and returns the
+        discounted prices and the total items received of every line. Does not read
+        or change any product. The total items received is 0 for the lines of a
+        promotion that gives no free items, as in Store.order.
+        :param prices: product prices (sequence of numbers)
+        :param quantities: order quantities (sequence of int)
+        :return: list of discount prices and list of total items received (tuple)
+        """
+        pass
+
+    def price(self, price: float, quantity: int) -> tuple:
+        """
+        Pricing function of the products with the promotion. Gets the price of the
+        product and the order quantity and returns the price and the total items
+        received of the line (tuple), as full_price does. Does not read or change
+        any product. Subclasses override it with a faster version for a single line.
+        """
+        total_prices, total_items_received = self.apply_promotion_batch((price,),
+                                                                        (quantity,))
+        return total_prices[0], total_items_received[0]
+
+    def _price_by_apply_promotion(self, price: float, quantity: int) -> tuple:
+        """
+        Pricing function that calls apply_promotion with a stand-in product of the
+        given price, and returns the price and the total items received of the
+        line (tuple), as full_price does.
+        """
+        result = self.apply_promotion(_PricedItem(price), quantity)
+        return result if isinstance(result, tuple) else (result, 0)
+
+    def _batch_by_apply_promotion(self, prices, quantities) -> tuple:
+        """
+        Batch pricing function that prices the lines one by one with
+        apply_promotion (see _price_by_apply_promotion).
+        :return: list of discount prices and list of total items received (tuple)
+        """
+        lines = [self._price_by_apply_promotion(price, quantity)
+                 for price, quantity in zip(prices, quantities)]
+        return [total for total, items in lines], [items for total, items in lines]
+
+
+class _PricedItem:
+    """ Stand-in product given to apply_promotion: only has the price """
+    __slots__ = ('price',)
+
+    def __init__(self, price: float):
+        self.price = price
+
 
 class PercentDiscount(Promotion):
     """
     Gets name of promotion and percent to be discounted
     """
+    __slots__ = ('_percent',)
+
     def __init__(self, name: str, percent: int):
         """ constructor for the PercentDiscount subclass"""
         super().__init__(name)
@@ -56,19 +136,41 @@ class PercentDiscount(Promotion):
         :param quantity: order quantity
         :return: discount price (float)
         """
-        total_price_per_order = product.total_price
+        total_price_per_order = product.price * quantity
         discount_price = total_price_per_order - (total_price_per_order *
                                                   self._percent * 0.01)
         return discount_price
 
+    def apply_promotion_batch(self, prices, quantities) -> tuple:
+        """
+        Gets the prices and the order quantities of many order lines and returns the
+        discounted prices and the total items received (always 0) of every line.
+        :param prices: product prices (sequence of numbers)
+        :param quantities: order quantities (sequence of int)
+        :return: list of discount prices and list of total items received (tuple)
+        """
+        percent = self._percent
+        discount_prices = [total_price - (total_price * percent * 0.01)
+                           for total_price in map(operator.mul, prices, quantities)]
+        return discount_prices, [0] * len(discount_prices)
+
+    def price(self, price: float, quantity: int) -> tuple:
+        """
+        Gets the price of the product and the order quantity and returns the
+        discounted price and the total items received (always 0) of the line (tuple).
+        """
+        total_price = price * quantity
+        return total_price - (total_price * self._percent * 0.01), 0
+
 
 class SecondHalfPrice(Promotion):
     """ Gets the name of the promotion: Second at Half Price. Applies promotion on
      the product"""
+    __slots__ = ()
+
     def __init__(self, name):
         """ constructor for the SecondHalfPrice subclass"""
         super().__init__(name)
-        self.name = name
 
     def apply_promotion(self, product, quantity) -> float:
         """
@@ -86,13 +188,36 @@ class SecondHalfPrice(Promotion):
                          (half_priced_items * half_of_regular_price)
         return discount_price
 
+    def apply_promotion_batch(self, prices, quantities) -> tuple:
+        """
+        Gets the prices and the order quantities of many order lines and returns the
+        discounted prices and the total items received (always 0) of every line.
+        :param prices: product prices (sequence of numbers)
+        :param quantities: order quantities (sequence of int)
+        :return: list of discount prices and list of total items received (tuple)
+        """
+        discount_prices = [((quantity - quantity // 2) * price) +
+                           ((quantity // 2) * (price / 2))
+                           for price, quantity in zip(prices, quantities)]
+        return discount_prices, [0] * len(discount_prices)
+
+    def price(self, price: float, quantity: int) -> tuple:
+        """
+        Gets the price of the product and the order quantity and returns the
+        discounted price and the total items received (always 0) of the line (tuple).
+        """
+        half_priced_items = quantity // 2
+        return ((quantity - half_priced_items) * price) + \
+               (half_priced_items * (price / 2)), 0
+
 
 class ThirdOneFree(Promotion):
     """ Gets the name of promotion: Buy 2, Get 1 Free. Apply promotion on product """
+    __slots__ = ()
+
     def __init__(self, name):
         """ constructor for the ThirdOneFree subclass"""
         super().__init__(name)
-        self.name = name
 
     def apply_promotion(self, product, quantity) -> tuple:
         """
@@ -106,3 +231,22 @@ class ThirdOneFree(Promotion):
         total_price = price * quantity
         total_item_received = quantity + (quantity // 2)
         return total_price, total_item_received
+
+    def apply_promotion_batch(self, prices, quantities) -> tuple:
+        """
+        Gets the prices and the order quantities of many order lines and returns the
+        prices and the total items received of every line.
+        :param prices: product prices (sequence of numbers)
+        :param quantities: order quantities (sequence of int)
+        :return: list of prices and list of total items received (tuple)
+        """
+        total_prices = list(map(operator.mul, prices, quantities))
+        total_items_received = [quantity + (quantity // 2) for quantity in quantities]
+        return total_prices, total_items_received
+
+    def price(self, price: float, quantity: int) -> tuple:
+        """
+        Gets the price of the product and the order quantity and returns the price
+        and the total items received of the line (tuple).
+        """
+        return price * quantity, quantity + (quantity // 2)
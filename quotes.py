@@ -0,0 +1,95 @@
+import threading
+from collections import OrderedDict
+
+
+class QuoteCache:
+    """
+    The QuoteCache class is a least-recently-used cache of order line prices.
+    A price is cached under the product key, the quantity, the product price and
+    the promotion object, so a new price or promotion never hits an old entry.
+    The entries of a product can also be dropped at once when its price or
+    promotion changes. Counts the hits, misses and evictions, to help size the cache.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        """
+        Constructor of the QuoteCache class.
+        :param max_size: maximum number of cached prices
+        """
+        if max_size <= 0:
+            raise ValueError("The size of the quote cache must be greater than 0")
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        # Cache keys of every product key, to drop the entries of a product
+        self._by_product = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, cache_key: tuple):
+        """
+        Returns the cached (total price, total items received) of an order line, or
+        None if it is not cached.
+        :param cache_key: (product key, quantity, price, promotion) tuple
+        """
+        with self._lock:
+            result = self._entries.get(cache_key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(cache_key)
+            return result
+
+    def put(self, cache_key: tuple, result: tuple):
+        """
+        Caches the (total price, total items received) of an order line. Evicts the
+        least recently used price if the cache is full.
+        :param cache_key: (product key, quantity, price, promotion) tuple
+        :param result: (total price, total items received) tuple
+        """
+        with self._lock:
+            self._entries[cache_key] = result
+            self._entries.move_to_end(cache_key)
+            self._by_product.setdefault(cache_key[0], set()).add(cache_key)
+            if len(self._entries) > self._max_size:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.evictions += 1
+
+    def _forget(self, cache_key: tuple):
+        """ Removes a cache key from the keys of its product """
+        keys = self._by_product[cache_key[0]]
+        keys.discard(cache_key)
+        if not keys:
+            del self._by_product[cache_key[0]]
+
+    def invalidate(self, product_key: str):
+        """
+        Drops all the cached prices of a product.
+        """
+        with self._lock:
+            for cache_key in self._by_product.pop(product_key, ()):
+                del self._entries[cache_key]
+                self.invalidations += 1
+
+    def clear(self):
+        """ Drops all the cached prices """
+        with self._lock:
+            self._entries.clear()
+            self._by_product.clear()
+
+    @property
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache (dict): size, max_size, hits, misses,
+        evictions and invalidations.
+        """
+        return {'size': len(self._entries), 'max_size': self._max_size,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'invalidations': self.invalidations}
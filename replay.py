@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+import catalog
+import main
+import persistence
+from metrics import rejection_category
+from service import percentile
+from sharding import shard_of
+from store import Store
+
+
+def read_orders(path: str) -> list:
+    """
+    Reads an order log: JSONL, one order per line, either a list of
+    [product key, quantity] items or an object with them under "items" (as sent to
+    the order service).
+    :return: list of orders (lists of (product key, quantity) tuples)
+    """
+    orders = []
+    with open(path) as log_file:
+        for line in log_file:
+            if not line.strip():
+                continue
+            order = json.loads(line)
+            if isinstance(order, dict):
+                order = order['items']
+            orders.append([(key, quantity) for key, quantity in order])
+    return orders
+
+
+def partition(orders: list, partitions: int) -> tuple:
+    """
+    Splits the orders in partitions by the keys of their items, with the routing
+    of sharding.py (see shard_of): an order whose products all belong to one
+    partition goes to that partition, so the orders of a product are replayed by
+    the process that owns it, in the order of the log.
+    :return: list of lists of orders, and list of the orders whose products span
+    partitions
+    """
+    parts = [[] for _ in range(partitions)]
+    spanning = []
+    for order in orders:
+        owners = {shard_of(key, partitions) for key, quantity in order}
+        if len(owners) > 1:
+            spanning.append(order)
+        else:
+            parts[owners.pop() if owners else 0].append(order)
+    return parts, spanning
+
+
+def load_partition(catalog_path: str, partition_number: int, partitions: int,
+                   keys=None) -> Store:
+    """
+    Creates a store with the products of the catalog that belong to a partition
+    (see partition), so the partitions share the stock out instead of each one
+    having all of it. The rows of the other partitions are skipped before they are
+    parsed, so a partition only builds its own products.
+    :param catalog_path: catalog file (see catalog.py), or None for the built-in
+    catalog
+    :param keys: if given, only the products with these keys are loaded
+    """
+    def keep(key):
+        return (shard_of(key, partitions) == partition_number
+                and (keys is None or key in keys))
+
+    promotion_catalog = main.create_promotions()
+    if catalog_path is None:
+        return Store([persistence.build_product(persistence.describe_product(product),
+                                                promotion_catalog)
+                      for key, product in main.create_store()._products.items()
+                      if keep(key)])
+    return Store(catalog.read_catalog(catalog_path, promotion_catalog, keep=keep))
+
+
+def replay_orders(store_obj: Store, orders: list, rate: float = None) -> dict:
+    """
+    Replays orders one after the other through Store.order.
+    :param store_obj: store object the orders are bought from
+    :param orders: list of orders (lists of (product key, quantity) tuples)
+    :param rate: orders per second, or None to replay at full speed. With a rate,
+    the latency of an order is counted from the time it was due, so an order that
+    waited for the ones before it counts its wait too.
+    :return: report (dict) with the seconds, latencies and rejections by category.
+    An order that cannot be bought is a rejection, whatever the exception, so a
+    malformed line of the log does not stop the replay.
+    """
+    latencies = []
+    rejections = {}
+    started = time.perf_counter()
+    for number, order in enumerate(orders):
+        due = time.perf_counter()
+        if rate is not None:
+            due = started + number / rate
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        try:
+            store_obj.order([(store_obj.get_product(key), quantity)
+                             for key, quantity in order])
+        except Exception as error:
+            category = rejection_category(error)
+            rejections[category] = rejections.get(category, 0) + 1
+        latencies.append(time.perf_counter() - due)
+    return {'seconds': time.perf_counter() - started, 'latencies': latencies,
+            'rejections': rejections}
+
+
+def _replay_partition(arguments: tuple) -> dict:
+    """
+    Worker process: loads the products of its partition and replays its orders.
+    The report also has the descriptions of the products with the given keys,
+    after the replay.
+    """
+    catalog_path, partition_number, partitions, orders, rate, keys = arguments
+    store_obj = load_partition(catalog_path, partition_number, partitions)
+    report = replay_orders(store_obj, orders, rate)
+    report['products'] = [persistence.describe_product(product)
+                          for key, product in store_obj._products.items() if key in keys]
+    return report
+
+
+def replay(orders: list, catalog_path: str = None, rate: float = None,
+           processes: int = 1, store_obj: Store = None) -> dict:
+    """
+    Replays an order log and reports the throughput, the latency percentiles per
+    order and the rejections by category.
+    With more than one process, the products and the orders are partitioned (see
+    partition) and every process replays the orders of its partition against a
+    store with the products of its partition, so the stock is not copied. The
+    orders whose products span partitions are replayed afterwards, against the
+    products they name as the processes left them. They are replayed after the
+    orders that came after them in the log, so when they compete with them for
+    the last items of a product, the rejections can differ from one process.
+    :param orders: list of orders (lists of (product key, quantity) tuples)
+    :param catalog_path: catalog file of the stores (see catalog.py), or None for
+    the built-in catalog
+    :param rate: orders per second in total, or None for full speed
+    :param processes: number of processes
+    :param store_obj: store to replay against, with one process only (by default,
+    a store loaded from the catalog)
+    :return: report (dict)
+    """
+    if store_obj is not None and processes > 1:
+        raise ValueError("A given store can only be replayed with one process")
+    if processes > 1:
+        parts, spanning = partition(orders, processes)
+        part_rate = None if rate is None else rate / processes
+        keys = {key for order in spanning for key, quantity in order}
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_replay_partition,
+                               [(catalog_path, number, processes, part, part_rate, keys)
+                                for number, part in enumerate(parts)])
+        seconds = max(result['seconds'] for result in results)
+        if spanning:
+            promotion_catalog = main.create_promotions()
+            spanning_store = Store([persistence.build_product(description,
+                                                              promotion_catalog)
+                                    for result in results
+                                    for description in result['products']])
+            results.append(replay_orders(spanning_store, spanning, rate))
+            seconds += results[-1]['seconds']
+    else:
+        if store_obj is None:
+            store_obj = main.create_store(catalog_path)
+        results = [replay_orders(store_obj, orders, rate)]
+        seconds = results[0]['seconds']
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    rejections = {}
+    for result in results:
+        for category, count in result['rejections'].items():
+            rejections[category] = rejections.get(category, 0) + count
+    return {'orders': len(latencies),
+            'rejected': sum(rejections.values()),
+            'rejections': rejections,
+            'processes': processes,
+            'seconds': seconds,
+            'orders_per_second': len(latencies) / seconds if seconds else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+def generate_orders(store_obj: Store, count: int, max_lines: int = 3,
+                    max_quantity: int = 3, seed: int = None) -> list:
+    """
+    Generates random orders over the products of a store, for load tests.
+    :return: list of orders (lists of [product key, quantity] items)
+    """
+    generator = random.Random(seed)
+    keys = list(store_obj._products)
+    return [[[generator.choice(keys), generator.randint(1, max_quantity)]
+             for _ in range(generator.randint(1, max_lines))]
+            for _ in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays an order log against a store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help="replay a JSONL order log")
+    replay_parser.add_argument('log', help="JSONL order log")
+    replay_parser.add_argument('--catalog', help="CSV or JSONL catalog of the store")
+    replay_parser.add_argument('--rate', type=float, help="orders per second")
+    replay_parser.add_argument('--processes', type=int, default=1)
+    generate_parser = commands.add_parser('generate', help="write a random order log")
+    generate_parser.add_argument('log', help="JSONL order log to write")
+    generate_parser.add_argument('--catalog', help="CSV or JSONL catalog of the store")
+    generate_parser.add_argument('--orders', type=int, default=100_000)
+    generate_parser.add_argument('--seed', type=int)
+    arguments = parser.parse_args()
+
+    if arguments.command == 'replay':
+        print(json.dumps(replay(read_orders(arguments.log), arguments.catalog,
+                                arguments.rate, arguments.processes), indent=2))
+    else:
+        with open(arguments.log, 'w') as log_file:
+            for order in generate_orders(main.create_store(arguments.catalog),
+                                         arguments.orders, seed=arguments.seed):
+                log_file.write(json.dumps(order) + '\n')
@@ -0,0 +1,211 @@
+import itertools
+import threading
+import time
+
+import products
+from store import Store
+
+
+class TimerWheel:
+    """
+    The TimerWheel class is a hierarchical timer wheel. Time is counted in ticks.
+    Level 0 has one slot per tick, and every next level has one slot per full turn
+    of the level below it. A timer is put in the lowest level that can tell its
+    deadline apart from the current tick, and moves down a level each time the
+    wheel reaches its slot. Scheduling and cancelling a timer are O(1), and
+    advancing the wheel expires a whole slot of timers at once.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4,
+                 start: float = 0.0):
+        """
+        Constructor of the TimerWheel class.
+        :param tick: length of a tick (seconds)
+        :param slots: number of slots of each level
+        :param levels: number of levels
+        :param start: current time (seconds)
+        """
+        self._tick = tick
+        self._slots = slots
+        self._levels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._current = int(start // tick)
+        # Level and slot of every timer, so that timers can be cancelled in O(1)
+        self._locations = {}
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, timer_id):
+        return timer_id in self._locations
+
+    def _place(self, timer_id, deadline: int):
+        """
+        Puts a timer in the slot of the lowest level that covers its deadline (tick).
+        """
+        slots = self._slots
+        span = 1
+        for level, wheel in enumerate(self._levels):
+            if deadline // span - self._current // span < slots:
+                index = (deadline // span) % slots
+                wheel[index][timer_id] = deadline
+                self._locations[timer_id] = (level, index)
+                return
+            span *= slots
+        raise ValueError(f"The deadline of timer '{timer_id}' is beyond the range of "
+                         "the timer wheel")
+
+    def schedule(self, timer_id, when: float):
+        """
+        Schedules a timer to expire at the given time (seconds).
+        If the timer is already scheduled, it is moved to the new time.
+        """
+        if timer_id in self._locations:
+            self.cancel(timer_id)
+        # The slot of the current tick has already expired, so the earliest a new
+        # timer can expire is the next tick
+        self._place(timer_id, max(int(when // self._tick), self._current + 1))
+
+    def cancel(self, timer_id):
+        """
+        Cancels a timer. Does nothing if the timer is not scheduled.
+        """
+        location = self._locations.pop(timer_id, None)
+        if location is not None:
+            level, index = location
+            del self._levels[level][index][timer_id]
+
+    def advance(self, now: float) -> list:
+        """
+        Moves the wheel to the given time (seconds).
+        :return: list of the ids of the timers that expired
+        """
+        target = int(now // self._tick)
+        expired = []
+        slots = self._slots
+        while self._current < target:
+            if not self._locations:
+                # Nothing scheduled, so there is nothing to expire on the way
+                self._current = target
+                break
+            self._current += 1
+            # Moves the timers of the higher levels down when their slot comes up
+            span = slots
+            for wheel in self._levels[1:]:
+                if self._current % span:
+                    break
+                index = (self._current // span) % slots
+                timers, wheel[index] = wheel[index], {}
+                for timer_id, deadline in timers.items():
+                    self._place(timer_id, deadline)
+                span *= slots
+            index = self._current % slots
+            timers, self._levels[0][index] = self._levels[0][index], {}
+            for timer_id in timers:
+                del self._locations[timer_id]
+            expired.extend(timers)
+        return expired
+
+
+class ReservationManager:
+    """
+    The ReservationManager class holds stock for shopping carts before the order is
+    confirmed. A hold takes the stock of its lines out of the quantity of the
+    products right away (so it is not shown by Store.all_products,
+    Store.total_quantity or offered to other shoppers) and gives it back when the
+    hold is released or expires. Expiry is driven by a TimerWheel, so it stays O(1)
+    per hold however many carts are outstanding.
+    """
+
+    def __init__(self, store_obj: Store, tick: float = 1.0, clock=time.monotonic):
+        """
+        Constructor of the ReservationManager class.
+        :param store_obj: store object the holds are placed on
+        :param tick: resolution of the expiry times (seconds)
+        :param clock: function returning the current time (seconds)
+        """
+        self._store = store_obj
+        self._clock = clock
+        self._wheel = TimerWheel(tick=tick, start=clock())
+        self._holds = {}
+        self._hold_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._holds)
+
+    def hold(self, shopping_list, ttl: float) -> int:
+        """
+        Gets a list of (product, quantity) tuples, as for Store.order, and holds the
+        stock for ttl seconds. The hold is all-or-nothing: if a line cannot be
+        bought, no stock is held and the exception is raised.
+        :param shopping_list: list of (product, quantity) tuples
+        :param ttl: how long the stock is held (seconds)
+        :return: id of the hold (int)
+        """
+        if ttl <= 0:
+            raise ValueError("The hold time must be greater than 0")
+        self.expire()
+        shopping_list = list(shopping_list)
+        with products.locked([product for product, quantity in shopping_list]):
+            reserved = self._store._reserve(shopping_list)
+        with self._lock:
+            hold_id = next(self._hold_ids)
+            try:
+                self._wheel.schedule(hold_id, self._clock() + ttl)
+            except ValueError:
+                with products.locked([product for product, quantity in reserved]):
+                    self._store._release(reserved)
+                raise
+            self._holds[hold_id] = (shopping_list, reserved)
+        return hold_id
+
+    def _pop(self, hold_id: int) -> tuple:
+        """
+        Removes a hold and its timer. If there is no such hold, raises an exception.
+        """
+        with self._lock:
+            try:
+                hold = self._holds.pop(hold_id)
+            except KeyError:
+                raise ValueError(f"There is no hold '{hold_id}', or it has "
+                                 "expired") from None
+            self._wheel.cancel(hold_id)
+        return hold
+
+    def confirm(self, hold_id: int) -> tuple:
+        """
+        Turns a hold into an order: prices its lines and keeps the held stock.
+        :param hold_id: id of the hold
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        self.expire()
+        shopping_list, reserved = self._pop(hold_id)
+        with products.locked([product for product, quantity in shopping_list]):
+            try:
+                return self._store._price_order(shopping_list)
+            except Exception:
+                self._store._release(reserved)
+                raise
+
+    def release(self, hold_id: int):
+        """
+        Cancels a hold and gives its stock back to the products.
+        :param hold_id: id of the hold
+        """
+        shopping_list, reserved = self._pop(hold_id)
+        with products.locked([product for product, quantity in reserved]):
+            self._store._release(reserved)
+
+    def expire(self, now: float = None) -> int:
+        """
+        Releases all the holds that have expired by now.
+        :param now: current time (seconds), by default the time of the clock
+        :return: number of holds released (int)
+        """
+        with self._lock:
+            expired = [self._holds.pop(hold_id) for hold_id in
+                       self._wheel.advance(self._clock() if now is None else now)]
+        for shopping_list, reserved in expired:
+            with products.locked([product for product, quantity in reserved]):
+                self._store._release(reserved)
+        return len(expired)
@@ -0,0 +1,170 @@
+import bisect
+import heapq
+import itertools
+import threading
+import time
+
+
+class PromotionSchedule:
+    """
+    The PromotionSchedule class holds the promotions of a store that run for a time
+    window, like flash sales. Every entry has a promotion, a start and end time
+    (the end is not included) and a priority, and is set on one product (by key)
+    or on the whole store. While an entry runs, its promotion is used instead of
+    the promotion of the product. When entries overlap, the one with the highest
+    priority wins, then the one set on the product, then the one added last.
+    The entries of every product (and the store-wide entries) are kept in an
+    interval index: the times where the winner changes, in order, with the winner
+    after each of them. The index is rebuilt when its entries change, and finding
+    the promotion of a product at a time is a binary search, O(log n).
+    """
+
+    def __init__(self, clock=time.time):
+        """
+        Constructor of the PromotionSchedule class.
+        :param clock: function returning the current time (seconds)
+        """
+        self._clock = clock
+        # Entry id -> (product key or None for the store, promotion, start, end,
+        # priority)
+        self._entries = {}
+        # Entry ids of every product key, None holds the store-wide entries
+        self._by_key = {}
+        # Interval index of every product key: (boundaries, winners) tuple
+        self._index = {}
+        self._entry_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def now(self) -> float:
+        """ Returns the current time of the clock of the schedule (seconds) """
+        return self._clock()
+
+    def add(self, promotion: object, start: float, end: float, priority: int = 0,
+            product_key: str = None) -> int:
+        """
+        Schedules a promotion to run from start to end (seconds, end not included).
+        :param promotion: promotion object
+        :param start: start time (seconds)
+        :param end: end time (seconds)
+        :param priority: priority over the other entries running at the same time
+        :param product_key: key of the product, or None for the whole store
+        :return: id of the entry (int)
+        """
+        if promotion is None:
+            raise ValueError("The scheduled promotion can't be None")
+        if start >= end:
+            raise ValueError("The start of a scheduled promotion must be before "
+                             "its end")
+        with self._lock:
+            entry_id = next(self._entry_ids)
+            self._entries[entry_id] = (product_key, promotion, start, end, priority)
+            self._by_key.setdefault(product_key, set()).add(entry_id)
+            self._index.pop(product_key, None)
+        return entry_id
+
+    def remove(self, entry_id: int):
+        """
+        Removes an entry from the schedule. If there is no such entry, raises an
+        exception.
+        """
+        with self._lock:
+            try:
+                product_key = self._entries.pop(entry_id)[0]
+            except KeyError:
+                raise ValueError(f"There is no scheduled promotion '{entry_id}'") \
+                    from None
+            entry_ids = self._by_key[product_key]
+            entry_ids.discard(entry_id)
+            if not entry_ids:
+                del self._by_key[product_key]
+            self._index.pop(product_key, None)
+
+    def _build(self, product_key) -> tuple:
+        """
+        Builds the interval index of a product key with a sweep over the start and
+        end times of its entries. A winner is a (priority, set on the product,
+        entry id, promotion) tuple, or None where no entry runs.
+        :return: list of boundaries and list of the winner after each (tuple)
+        """
+        events = []
+        for entry_id in self._by_key.get(product_key, ()):
+            key, promotion, start, end, priority = self._entries[entry_id]
+            rank = (priority, key is not None, entry_id, promotion)
+            events.append((start, entry_id, rank))
+            events.append((end, entry_id, None))
+        events.sort(key=lambda event: event[0])
+
+        boundaries, winners = [], []
+        running = []
+        ended = set()
+        for position, (when, entry_id, rank) in enumerate(events):
+            if rank is None:
+                ended.add(entry_id)
+            else:
+                heapq.heappush(running, (-rank[0], -rank[2], rank))
+            if position + 1 < len(events) and events[position + 1][0] == when:
+                # More events at the same time, the winner is known after them
+                continue
+            # Entries that ended stay in the heap until they reach the top
+            while running and -running[0][1] in ended:
+                heapq.heappop(running)
+            winner = running[0][2] if running else None
+            if winners and winners[-1] is winner:
+                continue
+            boundaries.append(when)
+            winners.append(winner)
+        return boundaries, winners
+
+    def _winner(self, product_key, when: float):
+        """ Returns the winning entry of a product key at a time, or None """
+        if product_key not in self._by_key:
+            return None
+        index = self._index.get(product_key)
+        if index is None:
+            with self._lock:
+                index = self._build(product_key)
+                self._index[product_key] = index
+        boundaries, winners = index
+        position = bisect.bisect_right(boundaries, when) - 1
+        if position < 0:
+            return None
+        return winners[position]
+
+    def promotion_for(self, product_key: str, when: float = None):
+        """
+        Returns the scheduled promotion (Promotion object) of a product at a time,
+        or None if no entry runs for the product at that time.
+        :param product_key: key of the product
+        :param when: time (seconds), by default the current time
+        """
+        if when is None:
+            when = self._clock()
+        winner = self._winner(product_key, when)
+        store_winner = self._winner(None, when)
+        if winner is None or (store_winner is not None and store_winner > winner):
+            winner = store_winner
+        return None if winner is None else winner[3]
+
+    def promotions_at(self, product_keys, when: float = None) -> dict:
+        """
+        Activates all the scheduled promotions at a time at once, for pricing
+        reports. The store-wide entries are looked up only once.
+        :param product_keys: keys of the products
+        :param when: time (seconds), by default the current time
+        :return: the scheduled promotion of every product that has one at that
+        time (dict of Promotion objects by product key)
+        """
+        if when is None:
+            when = self._clock()
+        store_winner = self._winner(None, when)
+        scheduled = {}
+        for product_key in product_keys:
+            winner = self._winner(product_key, when)
+            if winner is None or (store_winner is not None and store_winner > winner):
+                winner = store_winner
+            if winner is not None:
+                scheduled[product_key] = winner[3]
+        return scheduled
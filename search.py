@@ -0,0 +1,218 @@
+import bisect
+import itertools
+
+# Number of entries a block of a SortedBlocks list is split at
+BLOCK_SIZE = 2000
+
+
+class SortedBlocks:
+    """
+    The SortedBlocks class is a sorted list kept as a list of sorted blocks of at
+    most BLOCK_SIZE entries, with the last entry of every block in a separate
+    list. Adding or removing an entry is a binary search over the block ends, a
+    binary search in one block and an insert into (or delete from) that block
+    only, so it costs about the same for a catalog of any size, where a single
+    sorted list moves half of its entries on average.
+    """
+
+    def __init__(self, entries=()):
+        """
+        Constructor of the SortedBlocks class.
+        :param entries: entries of the list, in any order
+        """
+        self._blocks = []
+        self._ends = []
+        self._length = 0
+        self.reset(entries)
+
+    def reset(self, entries):
+        """ Replaces the entries of the list, with one sort """
+        entries = sorted(entries)
+        half = BLOCK_SIZE // 2
+        self._blocks = [entries[start:start + half]
+                        for start in range(0, len(entries), half)]
+        self._ends = [block[-1] for block in self._blocks]
+        self._length = len(entries)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks)
+
+    def __reversed__(self):
+        return itertools.chain.from_iterable(map(reversed, reversed(self._blocks)))
+
+    def __contains__(self, entry):
+        block = bisect.bisect_left(self._ends, entry)
+        if block == len(self._ends):
+            return False
+        entries = self._blocks[block]
+        return entries[bisect.bisect_left(entries, entry)] == entry
+
+    def add(self, entry):
+        """ Adds an entry to the list """
+        ends = self._ends
+        if not ends:
+            self._blocks.append([entry])
+            ends.append(entry)
+        else:
+            block = min(bisect.bisect_left(ends, entry), len(ends) - 1)
+            entries = self._blocks[block]
+            bisect.insort(entries, entry)
+            ends[block] = entries[-1]
+            if len(entries) > BLOCK_SIZE:
+                # Splits the full block in two halves
+                half = len(entries) // 2
+                self._blocks.insert(block + 1, entries[half:])
+                del entries[half:]
+                ends.insert(block, entries[-1])
+        self._length += 1
+
+    def remove(self, entry) -> bool:
+        """ Removes an entry from the list. Returns False if it is not there. """
+        block = bisect.bisect_left(self._ends, entry)
+        if block == len(self._ends):
+            return False
+        entries = self._blocks[block]
+        position = bisect.bisect_left(entries, entry)
+        if entries[position] != entry:
+            return False
+        del entries[position]
+        if entries:
+            self._ends[block] = entries[-1]
+        else:
+            del self._blocks[block]
+            del self._ends[block]
+        self._length -= 1
+        return True
+
+    def from_entry(self, entry):
+        """ Iterator of the entries from the first one not less than entry, in order """
+        block = bisect.bisect_left(self._ends, entry)
+        if block == len(self._ends):
+            return iter(())
+        entries = self._blocks[block]
+        return itertools.chain(
+            itertools.islice(entries, bisect.bisect_left(entries, entry), None),
+            itertools.chain.from_iterable(itertools.islice(self._blocks, block + 1,
+                                                           None)))
+
+
+class PriceIndex:
+    """
+    The PriceIndex class keeps product keys sorted by price, for price range and
+    cheapest / most expensive queries. Products with the same price are kept in
+    the order of a tie breaker (the catalog position of the product).
+    The entries are kept in a SortedBlocks list, so adding, moving and removing a
+    key costs about the same for a catalog of any size.
+    """
+
+    def __init__(self):
+        """ Constructor of the PriceIndex class """
+        # Sorted (price, tie breaker, key) tuples
+        self._entries = SortedBlocks()
+        # Entry of every key in the index
+        self._by_key = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def price_of(self, key: str):
+        """ Returns the price a key is indexed with, or None if it is not indexed """
+        entry = self._by_key.get(key)
+        return None if entry is None else entry[0]
+
+    def add(self, key: str, price: float, tie_breaker: int = 0):
+        """
+        Adds a key to the index, or moves it if it is indexed with another price.
+        """
+        entry = (price, tie_breaker, key)
+        if self._by_key.get(key) == entry:
+            return
+        self.remove(key)
+        self._entries.add(entry)
+        self._by_key[key] = entry
+
+    def add_many(self, items):
+        """
+        Adds many keys to the index at once, with one sort instead of an insert
+        per key.
+        :param items: (key, price, tie breaker) tuples
+        """
+        for key, price, tie_breaker in items:
+            self._by_key[key] = (price, tie_breaker, key)
+        self._entries.reset(self._by_key.values())
+
+    def remove(self, key: str):
+        """ Removes a key from the index. Does nothing if it is not indexed. """
+        entry = self._by_key.pop(key, None)
+        if entry is not None:
+            self._entries.remove(entry)
+
+    def in_range(self, low: float = None, high: float = None) -> list:
+        """
+        Returns the keys with a price from low to high (both included), cheapest
+        first. A missing bound is not checked.
+        """
+        entries = iter(self._entries) if low is None else self._entries.from_entry((low,))
+        if high is None:
+            return [key for price, tie_breaker, key in entries]
+        return [key for price, tie_breaker, key in
+                itertools.takewhile(lambda entry: entry[0] <= high, entries)]
+
+    def cheapest(self, count: int) -> list:
+        """ Returns the keys of the count cheapest products, cheapest first """
+        return [key for price, tie_breaker, key in
+                itertools.islice(self._entries, max(count, 0))]
+
+    def most_expensive(self, count: int) -> list:
+        """ Returns the keys of the count most expensive products, dearest first """
+        return [key for price, tie_breaker, key in
+                itertools.islice(reversed(self._entries), max(count, 0))]
+
+
+class PrefixIndex:
+    """
+    The PrefixIndex class keeps product keys sorted without regard to case, for
+    search-as-you-type. The keys that start with a prefix are next to each other,
+    so finding them is a binary search for the first one and a walk over the
+    matches only. A sorted list takes far less memory than a trie of a large
+    catalog, and it can be built for many keys at once with one sort. The entries
+    are kept in a SortedBlocks list, so adding and removing a key costs about the
+    same for a catalog of any size.
+    """
+
+    def __init__(self):
+        """ Constructor of the PrefixIndex class """
+        # Sorted (case folded key, key) tuples
+        self._entries = SortedBlocks()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key: str):
+        """ Adds a key to the index. Does nothing if it is already there. """
+        entry = (key.casefold(), key)
+        if entry not in self._entries:
+            self._entries.add(entry)
+
+    def add_many(self, keys):
+        """ Adds many keys to the index at once, with one sort """
+        entries = set(self._entries)
+        entries.update((key.casefold(), key) for key in keys)
+        self._entries.reset(entries)
+
+    def remove(self, key: str):
+        """ Removes a key from the index. Does nothing if it is not there. """
+        self._entries.remove((key.casefold(), key))
+
+    def starting_with(self, prefix: str) -> list:
+        """ Returns the keys that start with the prefix, without regard to case """
+        prefix = prefix.casefold()
+        return [key for folded, key in
+                itertools.takewhile(lambda entry: entry[0].startswith(prefix),
+                                    self._entries.from_entry((prefix,)))]
@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import json
+import time
+
+import main
+import metrics
+from store import Store
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Returns the value below which the given fraction (0 to 1) of the values fall.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def invalid_items(items) -> str:
+    """
+    Checks the items of an order request: a list of [product key, quantity] pairs,
+    with a str key and an int quantity greater than 0.
+    :return: what is wrong with the items (str), or None if they are valid
+    """
+    if not isinstance(items, list) or not items:
+        return "Bad request: 'items' must be a non-empty list of [key, quantity]"
+    for item in items:
+        if not isinstance(item, list) or len(item) != 2:
+            return f"Bad request: item {item!r} is not a [key, quantity] pair"
+        key, quantity = item
+        if not isinstance(key, str):
+            return f"Bad request: product key {key!r} is not a string"
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            return f"Bad request: quantity {quantity!r} of '{key}' is not an integer " \
+                   "greater than 0"
+    return None
+
+
+class OrderBatcher:
+    """
+    The OrderBatcher class collects the orders that arrive within a short window
+    (or until the batch is full) and buys them together with Store.order_many in a
+    worker thread. Each order gets its own result back.
+    """
+
+    def __init__(self, store_obj: Store, max_batch: int = 512, max_delay: float = 0.002):
+        """
+        Constructor of the OrderBatcher class.
+        :param store_obj: store object the orders are bought from
+        :param max_batch: maximum number of orders in a batch
+        :param max_delay: how long to wait for more orders to fill a batch (seconds)
+        """
+        self._store = store_obj
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        """ Starts the batching task on the running event loop """
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """ Stops the batching task """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def order(self, shopping_list: list) -> tuple:
+        """
+        Adds an order to the next batch and waits for its result.
+        :param shopping_list: list of (product, quantity) tuples
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((shopping_list, future))
+        return await future
+
+    async def _run(self):
+        """ Takes batches of orders from the queue and buys them """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._max_delay
+            while len(batch) < self._max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            shopping_lists = [shopping_list for shopping_list, future in batch]
+            errors = []
+            try:
+                results = await loop.run_in_executor(
+                    None, self._store.order_many, shopping_lists, errors)
+            except Exception as error:
+                # order_many put the stock back, so no order of the batch was
+                # bought: every order gets the exception
+                for shopping_list, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            errors = dict(errors)
+            for index, (shopping_list, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in errors:
+                    future.set_exception(errors[index])
+                else:
+                    future.set_result(results[index])
+
+
+class OrderService:
+    """
+    The OrderService class serves a store to many clients at once over TCP, so
+    shoppers are not served one at a time by the input() loop of main.start.
+    The protocol is one JSON object per line, in both directions:
+        {"command": "list"}
+        {"command": "total"}
+        {"command": "order", "items": [["MacBook Air M2", 2], ["Shipping", 1]]}
+        {"command": "metrics"}
+        {"command": "metrics", "format": "prometheus"}
+    The metrics are what the instrumentation recorded (see metrics.py), as a JSON
+    snapshot or as Prometheus text in "text". The instrumentation is off unless
+    the service is served with metrics turned on.
+    Order items that are not [str key, int quantity > 0] pairs get an error with
+    "status": 400 and never reach the store.
+    Orders are bought in batches by an OrderBatcher, in a worker thread, so the
+    event loop never blocks on the store.
+    Run "python service.py serve" to serve the store and "python service.py bench"
+    to measure latency and throughput with simulated clients.
+    """
+
+    def __init__(self, store_obj: Store, max_batch: int = 512, max_delay: float = 0.002):
+        """
+        Constructor of the OrderService class.
+        :param store_obj: store object to serve
+        :param max_batch: maximum number of orders bought together
+        :param max_delay: how long to wait for more orders to fill a batch (seconds)
+        """
+        self._store = store_obj
+        self._batcher = OrderBatcher(store_obj, max_batch, max_delay)
+        self._server = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> int:
+        """
+        Starts listening for clients.
+        :return: the port the service listens on (int)
+        """
+        self._batcher.start()
+        self._server = await asyncio.start_server(self._serve_client, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """ Stops listening and stops the batcher """
+        self._server.close()
+        await self._server.wait_closed()
+        await self._batcher.stop()
+
+    async def _serve_client(self, reader, writer):
+        """ Answers the requests of one client until it disconnects """
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.handle(json.loads(line))
+                except (ValueError, TypeError, KeyError, AttributeError) as error:
+                    response = {'error': str(error)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, request: dict) -> dict:
+        """
+        Answers one request.
+        :param request: request (dict) with a 'command' and its arguments
+        :return: response (dict)
+        """
+        loop = asyncio.get_running_loop()
+        command = request.get('command')
+        if command == 'list':
+            all_products = await loop.run_in_executor(
+                None, lambda: [str(product) for product in self._store.all_products])
+            return {'products': all_products}
+        if command == 'total':
+            return {'total_quantity': self._store.total_quantity}
+        if command == 'order':
+            problem = invalid_items(request.get('items'))
+            if problem is not None:
+                return {'error': problem, 'status': 400}
+            shopping_list = [(self._store.get_product(key), quantity)
+                             for key, quantity in request['items']]
+            total_price, total_items = await self._batcher.order(shopping_list)
+            return {'total_price': total_price, 'total_items_received': total_items}
+        if command == 'metrics':
+            if request.get('format') == 'prometheus':
+                return {'text': metrics.REGISTRY.to_prometheus()}
+            return metrics.REGISTRY.snapshot()
+        raise ValueError(f"Unknown command '{command}'")
+
+
+async def run_load(host: str, port: int, clients: int, orders_per_client: int,
+                   shopping_list: list) -> dict:
+    """
+    Load generator: simulated clients that each send orders one after the other.
+    :param host: host of the service
+    :param port: port of the service
+    :param clients: number of concurrent clients
+    :param orders_per_client: number of orders each client sends
+    :param shopping_list: list of [product key, quantity] sent as every order
+    :return: report (dict) with the throughput and the latency percentiles
+    """
+    latencies = []
+    rejected = 0
+    request = json.dumps({'command': 'order', 'items': shopping_list}).encode() + b'\n'
+
+    async def client():
+        nonlocal rejected
+        reader, writer = await asyncio.open_connection(host, port)
+        for _ in range(orders_per_client):
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - started)
+            rejected += 'error' in response
+        writer.close()
+        await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {'orders': len(latencies),
+            'rejected': rejected,
+            'seconds': elapsed,
+            'orders_per_second': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+async def serve(host: str, port: int, journal_directory: str = None,
+                synchronous: bool = False, with_metrics: bool = False):
+    """
+    Serves the default store until interrupted.
+    :param journal_directory: directory of the journal that keeps the inventory
+    across restarts (see persistence.py), or None for none
+    :param synchronous: if True, every change is fsynced before its order returns
+    :param with_metrics: if True, the instrumentation is turned on (see metrics.py)
+    and the metrics command returns what it records
+    """
+    if with_metrics:
+        metrics.enable()
+    best_buy = main.create_store()
+    journal = None
+    if journal_directory is not None:
+        journal = main.open_journal(best_buy, journal_directory, synchronous)
+    service = OrderService(best_buy)
+    port = await service.start(host, port)
+    print(f"Serving the store on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+        if journal is not None:
+            journal.close()
+
+
+async def bench(clients: int, orders_per_client: int) -> dict:
+    """ Runs the load generator against a service started on a free local port """
+    best_buy = main.create_store()
+    # Stocks up, so that the benchmark measures orders and not rejections
+    for product in best_buy.all_products:
+        product.quantity = clients * orders_per_client
+    service = OrderService(best_buy)
+    port = await service.start(DEFAULT_HOST, 0)
+    try:
+        return await run_load(DEFAULT_HOST, port, clients, orders_per_client,
+                              [["MacBook Air M2", 1], ["Google Pixel 7", 1]])
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="asyncio order service for the store")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="serve the store over TCP")
+    serve_parser.add_argument('--host', default=DEFAULT_HOST)
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument('--journal', help="directory of the journal that keeps "
+                                                "the inventory across restarts")
+    serve_parser.add_argument('--sync', action='store_true',
+                              help="fsync every change before its order returns")
+    serve_parser.add_argument('--metrics', action='store_true',
+                              help="turn the instrumentation on, for the metrics "
+                                   "command")
+    bench_parser = commands.add_parser('bench', help="measure latency and throughput")
+    bench_parser.add_argument('--clients', type=int, default=50)
+    bench_parser.add_argument('--orders', type=int, default=200)
+    arguments = parser.parse_args()
+
+    if arguments.command == 'serve':
+        try:
+            asyncio.run(serve(arguments.host, arguments.port, arguments.journal,
+                              arguments.sync, arguments.metrics))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(asyncio.run(bench(arguments.clients, arguments.orders)),
+                         indent=2))
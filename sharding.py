@@ -0,0 +1,389 @@
+import multiprocessing
+import os
+import threading
+import zlib
+
+import catalog
+import persistence
+from reservations import ReservationManager
+from store import Store
+
+# How long the parts of a multi-shard order are held between the two phases
+# (seconds). It only matters if the router dies between them.
+HOLD_TTL = 60.0
+
+
+def shard_of(key: str, shards: int) -> int:
+    """ Returns the shard (int) that owns the product with the given key """
+    return zlib.crc32(key.encode()) % shards
+
+
+def _resolve(store_obj: Store, order: list) -> list:
+    """ Turns (product key, quantity) lines into (product, quantity) lines """
+    return [(store_obj.get_product(key), quantity) for key, quantity in order]
+
+
+def _order_many(store_obj: Store, holds: ReservationManager, orders: list) -> tuple:
+    """
+    Shard command: buys orders that only have products of this shard.
+    :return: list of results (None for the rejected orders) and list of
+    (index, exception) for the rejected orders
+    """
+    errors = []
+    shopping_lists = []
+    for index, order in enumerate(orders):
+        try:
+            shopping_lists.append(_resolve(store_obj, order))
+        except Exception as error:
+            # An unknown product or a malformed line only rejects its own order
+            errors.append((index, error))
+            shopping_lists.append([])
+    unknown = {index for index, error in errors}
+    results = store_obj.order_many(shopping_lists, errors)
+    for index in unknown:
+        results[index] = None
+    errors.sort(key=lambda rejection: rejection[0])
+    return results, errors
+
+
+def _hold_many(store_obj: Store, holds: ReservationManager, orders: list) -> list:
+    """
+    Shard command: holds the stock of the parts of multi-shard orders that belong
+    to this shard.
+    :return: list of (hold id, None), or (None, exception) if a part was rejected
+    """
+    held = []
+    for order in orders:
+        try:
+            held.append((holds.hold(_resolve(store_obj, order), HOLD_TTL), None))
+        except Exception as error:
+            held.append((None, error))
+    return held
+
+
+def _finish(store_obj: Store, holds: ReservationManager, confirmed: list,
+            released: list) -> list:
+    """
+    Shard command: confirms the holds of the multi-shard orders that every shard
+    accepted, and releases the others. A hold that fails does not stop the
+    others.
+    :return: list of ((total price, total items received), None) for the
+    confirmed holds, or (None, exception) if a hold could not be confirmed
+    """
+    for hold_id in released:
+        try:
+            holds.release(hold_id)
+        except Exception:
+            # An expired hold has been released already
+            pass
+    finished = []
+    for hold_id in confirmed:
+        try:
+            finished.append((holds.confirm(hold_id), None))
+        except Exception as error:
+            finished.append((None, error))
+    return finished
+
+
+def _total_quantity(store_obj: Store, holds: ReservationManager) -> int:
+    """ Shard command: the total quantity of the shard """
+    return store_obj.total_quantity
+
+
+def _all_products(store_obj: Store, holds: ReservationManager) -> list:
+    """ Shard command: the descriptions of the active products of the shard """
+    return [persistence.describe_product(product) for product in store_obj.all_products]
+
+
+# Functions of the shard commands, by name
+COMMANDS = {'order_many': _order_many,
+            'hold_many': _hold_many,
+            'finish': _finish,
+            'total_quantity': _total_quantity,
+            'all_products': _all_products}
+
+
+def _run_shard(connection, shard: int, shards: int, product_list: list,
+               catalog_path: str, promotion_catalog: dict):
+    """
+    Shard process: creates the store of the shard, then answers the commands of
+    the router until it closes the connection. Every answer is (True, result) or
+    (False, exception).
+    """
+    if catalog_path is not None:
+        product_list = list(catalog.read_catalog(
+            catalog_path, promotion_catalog,
+            keep=lambda key: shard_of(key, shards) == shard))
+    else:
+        product_list = [persistence.build_product(description, promotion_catalog)
+                        for description in product_list]
+    store_obj = Store(product_list)
+    holds = ReservationManager(store_obj)
+    while True:
+        try:
+            command, arguments = connection.recv()
+        except EOFError:
+            break
+        if command == 'close':
+            break
+        try:
+            connection.send((True, COMMANDS[command](store_obj, holds, *arguments)))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
+
+
+class ShardedStore:
+    """
+    The ShardedStore class spreads the products of a store over shard processes,
+    each one owning a Store with the products whose key hashes to it (see
+    shard_of), so orders are bought on many cores at once.
+    Orders name the products by key (or by Product object, for its key). An order
+    whose products all belong to one shard is bought by that shard alone. An
+    order that spans shards is bought in two phases: every shard holds the stock
+    of its part, then, if every part was held, the holds are confirmed, and
+    otherwise they are released, so the order stays all-or-nothing.
+    The commands of a call are sent to all the shards before any answer is read,
+    so the shards work in parallel; order_many sends a whole batch of orders to
+    a shard in one message, which is what makes the throughput grow with the
+    number of shards.
+    """
+
+    def __init__(self, product_list: list = (), shards: int = None,
+                 catalog_path: str = None, promotion_catalog: dict = None):
+        """
+        Constructor of the ShardedStore class.
+        :param product_list: list of products (Product objects). They are copied
+        to the shards: the shards own the stock from now on
+        :param shards: number of shard processes (the number of CPUs by default)
+        :param catalog_path: CSV or JSONL catalog file that every shard loads its
+        products from (see catalog.py), instead of the list of products. A shard
+        skips the rows of the other shards before parsing them
+        :param promotion_catalog: promotions (Promotion objects) by name, for the
+        catalog file. The promotions of the products of the list are taken from
+        the products
+        """
+        self._shards = shards or os.cpu_count() or 1
+        promotion_catalog = dict(promotion_catalog or {})
+        parts = [[] for _ in range(self._shards)]
+        for product in product_list:
+            if product.promotion is not None:
+                promotion_catalog[product.promotion.name] = product.promotion
+            parts[shard_of(product.key, self._shards)].append(
+                persistence.describe_product(product))
+        self._promotion_catalog = promotion_catalog
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+        for shard, part in enumerate(parts):
+            connection, shard_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_run_shard, daemon=True,
+                args=(shard_connection, shard, self._shards, part, catalog_path,
+                      promotion_catalog))
+            process.start()
+            shard_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    @property
+    def shards(self) -> int:
+        """ Returns the number of shards """
+        return self._shards
+
+    def shard_of(self, key: str) -> int:
+        """ Returns the shard (int) that owns the product with the given key """
+        return shard_of(key, self._shards)
+
+    def _call_each(self, requests: dict) -> dict:
+        """
+        Sends a command to some shards, then reads their answers.
+        :param requests: (command, arguments) by shard
+        :return: (True, result) or (False, exception) by shard
+        """
+        with self._lock:
+            for shard, request in requests.items():
+                self._connections[shard].send(request)
+            return {shard: self._connections[shard].recv() for shard in requests}
+
+    def _call(self, requests: dict) -> dict:
+        """
+        Sends a command to some shards, then reads their answers.
+        :param requests: (command, arguments) by shard
+        :return: results by shard. If a shard failed, raises its exception once
+        every answer has been read
+        """
+        results = {}
+        for shard, (succeeded, result) in self._call_each(requests).items():
+            if not succeeded:
+                raise result
+            results[shard] = result
+        return results
+
+    def _call_all(self, command: str, *arguments) -> list:
+        """ Sends a command to every shard. Returns their results, by shard """
+        results = self._call({shard: (command, arguments)
+                              for shard in range(self._shards)})
+        return [results[shard] for shard in range(self._shards)]
+
+    @property
+    def total_quantity(self) -> int:
+        """ Returns how many items are in the store in total, over all the shards """
+        return sum(self._call_all('total_quantity'))
+
+    @property
+    def all_products(self) -> list:
+        """
+        Returns copies (Product objects) of the active products of all the shards,
+        shard after shard. Changing the copies does not change the store.
+        """
+        return [persistence.build_product(description, self._promotion_catalog)
+                for descriptions in self._call_all('all_products')
+                for description in descriptions]
+
+    def order(self, shopping_list) -> tuple:
+        """
+        Gets a list of (product key or Product object, quantity) tuples and buys
+        them, all-or-nothing, like Store.order.
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        errors = []
+        result = self.order_many([shopping_list], errors)[0]
+        if errors:
+            raise errors[0][1]
+        return result
+
+    def order_many(self, shopping_lists: list, errors: list = None) -> list:
+        """
+        Gets a list of shopping lists (each one a list of (product key or Product
+        object, quantity) tuples) and buys them, each one all-or-nothing. The
+        orders of one shard are bought by Store.order_many of the shard. The
+        orders that span shards are bought after them, in two phases.
+        A malformed order, or a shard that fails, only rejects the orders
+        concerned: the results of the other shards are kept, and the holds they
+        granted for a rejected order are released.
+        :param shopping_lists: list of shopping lists
+        :param errors: if a list is given, (index, exception) is appended to it
+        for every rejected order
+        :returns: list with the (total price, total items received) tuple of each
+        order, or None for the rejected orders
+        """
+        results = [None] * len(shopping_lists)
+        rejected = []
+        single = {}
+        multi = []
+        for index, shopping_list in enumerate(shopping_lists):
+            parts = {}
+            try:
+                for item, quantity in shopping_list:
+                    key = getattr(item, 'key', item)
+                    parts.setdefault(shard_of(key, self._shards), []).append(
+                        (key, quantity))
+            except (TypeError, ValueError, AttributeError) as error:
+                rejected.append((index, error))
+                continue
+            if len(parts) > 1:
+                multi.append((index, parts))
+            else:
+                shard, lines = parts.popitem() if parts else (0, [])
+                single.setdefault(shard, ([], []))
+                single[shard][0].append(index)
+                single[shard][1].append(lines)
+
+        answers = self._call_each({shard: ('order_many', (orders,))
+                                   for shard, (indexes, orders) in single.items()})
+        for shard, (succeeded, answer) in answers.items():
+            indexes = single[shard][0]
+            if not succeeded:
+                rejected.extend((index, answer) for index in indexes)
+                continue
+            shard_results, shard_errors = answer
+            for position, result in enumerate(shard_results):
+                results[indexes[position]] = result
+            rejected.extend((indexes[position], error)
+                            for position, error in shard_errors)
+
+        if multi:
+            self._order_across_shards(multi, results, rejected)
+        if errors is not None:
+            errors.extend(sorted(rejected, key=lambda rejection: rejection[0]))
+        return results
+
+    def _order_across_shards(self, multi: list, results: list, rejected: list):
+        """
+        Buys the orders that span shards: every shard holds the stock of its parts,
+        then the holds of the orders that were held in full are confirmed and the
+        others are released. If a shard fails to hold, its parts count as
+        rejected; if it fails to confirm, its orders are rejected, although
+        their parts confirmed by the other shards stay bought.
+        :param multi: list of (index, parts) of the orders, with the (product key,
+        quantity) lines of every part by shard
+        :param results: results of the orders, set for the confirmed orders
+        :param rejected: list the (index, exception) of the rejected orders are
+        appended to
+        """
+        requests = {}
+        for index, parts in multi:
+            for shard, lines in parts.items():
+                requests.setdefault(shard, []).append(lines)
+        held = {}
+        for shard, (succeeded, answer) in self._call_each(
+                {shard: ('hold_many', (orders,))
+                 for shard, orders in requests.items()}).items():
+            held[shard] = iter(answer if succeeded else
+                               [(None, answer)] * len(requests[shard]))
+
+        confirmed = {shard: [] for shard in requests}
+        released = {shard: [] for shard in requests}
+        accepted = []
+        for index, parts in multi:
+            holds = {shard: next(held[shard]) for shard in parts}
+            failed = [error for hold_id, error in holds.values() if error is not None]
+            for shard, (hold_id, error) in holds.items():
+                if hold_id is not None:
+                    (released if failed else confirmed)[shard].append(hold_id)
+            if failed:
+                rejected.append((index, failed[0]))
+            else:
+                accepted.append((index, list(parts)))
+
+        answers = {}
+        for shard, (succeeded, answer) in self._call_each(
+                {shard: ('finish', (confirmed[shard], released[shard]))
+                 for shard in requests}).items():
+            answers[shard] = iter(answer if succeeded else
+                                  [(None, answer)] * len(confirmed[shard]))
+        for index, shards in accepted:
+            total_price, total_items = 0, 0
+            failed = None
+            for shard in shards:
+                finished, error = next(answers[shard])
+                if error is not None:
+                    failed = failed or error
+                    continue
+                total_price += finished[0]
+                total_items += finished[1]
+            if failed is None:
+                results[index] = (total_price, total_items)
+            else:
+                rejected.append((index, failed))
+
+    def close(self):
+        """ Stops the shard processes """
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(('close', ()))
+                except OSError:
+                    pass
+                connection.close()
+            for process in self._processes:
+                process.join()
+            self._connections = []
+            self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,78 +1,850 @@
+import heapq
+import operator
+import threading
+
+import products
+import promotions
+from quotes import QuoteCache
+from search import PriceIndex, PrefixIndex
+
+
+def _price_lines(promotion: object, prices: list, quantities: list) -> tuple:
+    """
+    Prices a group of order lines that share the same promotion, without touching
+    the products. Gives the same results as buying the lines one by one.
+    :param promotion: promotion object of the lines (or None for no promotion)
+    :param prices: price of the product of each line
+    :param quantities: quantity of each line
+    :return: list of total prices and list of total items received (tuple)
+    """
+    if promotion is None:
+        return list(map(operator.mul, prices, quantities)), [0] * len(quantities)
+    return promotion.apply_promotion_batch(prices, quantities)
+
+
 class Store:
     """
     The Store Class holds all of the products, and allows the user to make a
     purchase of multiple products at once.
-    It contains one variable:  list of products that exist in the store.
+    It contains one variable: the catalog of products that exist in the store,
+    keyed by the product key and kept in insertion order.
+    The total quantity and the active products are kept up to date as the products
+    change, so reading them does not walk the whole catalog.
+    The active products are also indexed by price and by key prefix, for searches.
+    A promotion schedule (see schedule.py) can run promotions for a time window on
+    some products or the whole store, without changing the products.
     """
 
-    def __init__(self, product_list: list):
+    def __init__(self, product_list: list, debug: bool = False,
+                 quote_cache_size: int = 4096, schedule: object = None):
         """
         The constructor method for the Store class. Creates the instance variables.
         Sets the instance parameter: product list that holds multiple products.
         :param product_list:
+        :param debug: if True, the cached total quantity and active products are
+        checked against a full recompute every time they are read
+        :param quote_cache_size: maximum number of order line prices cached by quote
+        :param schedule: promotions that run for a time window (PromotionSchedule
+        object, see schedule.py), consulted at order time
         """
-        self._products = product_list
+        self._debug = debug
+        self._schedule = schedule
+        self._quotes = QuoteCache(quote_cache_size)
+        # Guards the cached aggregates, which products change from many threads
+        self._lock = threading.Lock()
+        self._products = {}
+        # Position of each product in the catalog, used to keep the listing order
+        self._positions = {}
+        # Products by catalog position (None where a product was removed), so pages
+        # of the catalog can be read from a position without walking it all
+        self._catalog = []
+        self._total_quantity = 0
+        self._active_products = {}
+        self._active_out_of_order = False
+        # Counts the products added and removed, so views of the store can tell
+        # when their cached catalog information is stale
+        self._changes = 0
+        # Search indexes of the active products, by price and by key prefix
+        self._price_index = PriceIndex()
+        self._name_index = PrefixIndex()
+        # Write-ahead log of the changes of the store (see persistence.py)
+        self._journal = None
+        # Low stock monitor of the store (see alerts.py)
+        self._monitor = None
+        # Sales ledger the sold lines are recorded in (see ledger.py)
+        self._ledger = None
+        for product in product_list:
+            self._add_product(product, index=False)
+        # Builds the search indexes at once, one sort instead of an insert per product
+        self._price_index.add_many((key, product.price, self._positions[key])
+                                   for key, product in self._active_products.items())
+        self._name_index.add_many(self._active_products)
 
     def add_product(self, product: object):
         """
-        Gets product and Adds product to store (product list)
+        Gets product and Adds product to store (product catalog).
+        Adding a product that is already in the store does nothing. If another
+        product with the same key is in the store, raises an exception.
         """
-        self._products.append(product)
+        self._add_product(product)
         return f"Product '{product}' successfully added to store"
 
+    def _add_product(self, product: object, index: bool = True):
+        """
+        Adds a product to the store (see add_product).
+        :param index: if False, the product is not added to the search indexes
+        """
+        current = self._products.get(product.key)
+        if current is not None and current is not product:
+            raise ValueError(f"A product with the key '{product.key}' is already in "
+                             "the store")
+        if current is None:
+            with self._lock:
+                self._products[product.key] = product
+                self._changes += 1
+                self._positions[product.key] = len(self._catalog)
+                self._catalog.append(product)
+                self._total_quantity += product.quantity
+                if product.is_active:
+                    self._active_products[product.key] = product
+                    if index:
+                        self._index_product(product)
+                if self._monitor is not None:
+                    self._monitor.record_change(product)
+            product._observers += (self._on_product_change,)
+            if self._journal is not None:
+                self._journal.record_add(product)
+
     def remove_product(self, product: object):
         """
-        Removes product from store ( product list)
+        Removes product from store (product catalog). If the product is not in the
+        store, raises an exception.
         """
-        self._products.remove(product)
+        if product not in self:
+            raise ValueError(f"Product '{product}' is not in the store")
+        product._observers = tuple(observer for observer in product._observers
+                                   if observer != self._on_product_change)
+        with self._lock:
+            del self._products[product.key]
+            self._changes += 1
+            self._catalog[self._positions.pop(product.key)] = None
+            self._total_quantity -= product.quantity
+            self._active_products.pop(product.key, None)
+            self._unindex_product(product)
+            if self._monitor is not None:
+                self._monitor.record_remove(product)
+        self._quotes.invalidate(product.key)
+        if self._journal is not None:
+            self._journal.record_remove(product)
         return f"Product '{product}' successfully removed from store"
 
+    def get_product(self, key: str):
+        """
+        Gets the key of a product and returns the product (Product object).
+        If there is no product with that key in the store, raises an exception.
+        """
+        try:
+            return self._products[key]
+        except KeyError:
+            raise ValueError(f"There is no product with the key '{key}' in the "
+                             "store") from None
+
+    def _on_product_change(self, product: object, quantity_delta: int):
+        """
+        Observer of the products in the store. Updates the total quantity and the
+        active products when a product changes.
+        :param product: the product that changed (Product object)
+        :param quantity_delta: change of the quantity of the product (int)
+        """
+        with self._lock:
+            self._total_quantity += quantity_delta
+            if product.is_active:
+                if product.key not in self._active_products:
+                    self._active_products[product.key] = product
+                    self._active_out_of_order = True
+                    self._index_product(product)
+                elif not quantity_delta:
+                    # The price may have changed, orders never change it
+                    self._price_index.add(product.key, product.price,
+                                          self._positions[product.key])
+            elif self._active_products.pop(product.key, None) is not None:
+                self._unindex_product(product)
+            if quantity_delta and self._monitor is not None:
+                self._monitor.record_change(product)
+        if not quantity_delta:
+            # The price, promotion or active state changed
+            self._quotes.invalidate(product.key)
+        if self._journal is not None:
+            self._journal.record_change(product)
+
+    def _index_product(self, product: object):
+        """ Adds an active product to the search indexes. The caller holds the lock """
+        self._price_index.add(product.key, product.price, self._positions[product.key])
+        self._name_index.add(product.key)
+
+    def _unindex_product(self, product: object):
+        """ Removes a product from the search indexes. The caller holds the lock """
+        self._price_index.remove(product.key)
+        self._name_index.remove(product.key)
+
+    def _check_aggregates(self):
+        """
+        Checks the cached total quantity and active products against a full
+        recompute. Raises an AssertionError if they differ.
+        """
+        total_quantity = 0
+        all_products = []
+        for product in self._products.values():
+            total_quantity += product.quantity
+            if product.is_active:
+                all_products.append(product)
+        if total_quantity != self._total_quantity:
+            raise AssertionError(f"Cached total quantity {self._total_quantity} "
+                                 f"differs from the actual {total_quantity}")
+        if all_products != self._sorted_active_products():
+            raise AssertionError("Cached active products differ from the actual "
+                                 "active products")
+        if len(self._price_index) != len(all_products) or \
+                len(self._name_index) != len(all_products) or \
+                any(self._price_index.price_of(product.key) != product.price
+                    for product in all_products):
+            raise AssertionError("Search indexes differ from the actual active "
+                                 "products")
+
+    def _sorted_active_products(self) -> list:
+        """
+        Returns the active products in catalog order. Products that became active
+        again were appended at the end, so they are put back in their place first.
+        """
+        if self._active_out_of_order:
+            positions = self._positions
+            self._active_products = dict(sorted(self._active_products.items(),
+                                                key=lambda item: positions[item[0]]))
+            self._active_out_of_order = False
+        return list(self._active_products.values())
+
     @property
     def total_quantity(self) -> int:
         """
         Returns how many items are in the store in total
         """
-        total_quantity = 0
-        for product in self._products:
-            total_quantity += product.quantity
-        return total_quantity
+        if self._debug:
+            self._check_aggregates()
+        return self._total_quantity
 
     @property
     def all_products(self):
         """
         Returns all products in the store that are active.
         """
-        all_products = []
-        for product in self._products:
-            if product.is_active:
-                all_products.append(product)
-        return all_products
+        if self._debug:
+            self._check_aggregates()
+        return self._sorted_active_products()
 
-    def order(self, shopping_list):
+    def page(self, cursor: int = 0, size: int = 50) -> tuple:
         """
-        Gets a list of tuples, where each tuple has 2 items:
-        Product (Product object) and quantity (int).
-        Buys the products.
+        Returns a page of the active products, in catalog order, starting at a
+        cursor. Only the products of the page (and the inactive or removed ones in
+        between) are read, so the first page comes right away however large the
+        store is. Products added later show up at the end.
+        :param cursor: position to start from, 0 or the cursor of the last page
+        :param size: largest number of products in the page
+        :return: list of products and the cursor of the next page, or None after
+        the last page (tuple)
+        """
+        if size <= 0:
+            raise ValueError("The page size must be greater than 0")
+        page_products = []
+        with self._lock:
+            catalog = self._catalog
+            position = cursor
+            while position < len(catalog) and len(page_products) < size:
+                product = catalog[position]
+                position += 1
+                if product is not None and product.is_active:
+                    page_products.append(product)
+            return page_products, position if position < len(catalog) else None
+
+    def pages(self, size: int = 50):
+        """
+        Generator of the pages (lists of products) of the active products, in
+        catalog order. Every page is read when it is needed, see page.
+        """
+        cursor = 0
+        while cursor is not None:
+            page_products, cursor = self.page(cursor, size)
+            if page_products:
+                yield page_products
+
+    def products_in_price_range(self, low: float = None, high: float = None) -> list:
+        """
+        Returns the active products with a price from low to high (both included),
+        cheapest first. A missing bound is not checked.
+        """
+        with self._lock:
+            return [self._products[key] for key in self._price_index.in_range(low, high)]
+
+    def cheapest(self, count: int) -> list:
+        """ Returns the count cheapest active products, cheapest first """
+        with self._lock:
+            return [self._products[key] for key in self._price_index.cheapest(count)]
+
+    def most_expensive(self, count: int) -> list:
+        """ Returns the count most expensive active products, most expensive first """
+        with self._lock:
+            return [self._products[key] for key in
+                    self._price_index.most_expensive(count)]
+
+    def search(self, prefix: str) -> list:
+        """
+        Returns the active products whose key starts with the prefix (without
+        regard to case), in catalog order.
+        """
+        with self._lock:
+            positions = self._positions
+            keys = sorted(self._name_index.starting_with(prefix),
+                          key=lambda key: positions[key])
+            return [self._products[key] for key in keys]
+
+    @property
+    def schedule(self):
+        """ Getter method for the promotion schedule (PromotionSchedule or None) """
+        return self._schedule
+
+    @schedule.setter
+    def schedule(self, schedule: object):
+        """ Setter method for the promotion schedule (PromotionSchedule or None) """
+        self._schedule = schedule
+
+    def _promotion_for(self, product: object, when: float):
+        """
+        Returns the promotion of a product at a time: the scheduled promotion if
+        one runs, otherwise the promotion of the product (Promotion object or None)
+        """
+        if self._schedule is not None:
+            promotion = self._schedule.promotion_for(product.key, when)
+            if promotion is not None:
+                return promotion
+        return product.promotion
+
+    def promotions_at(self, when: float = None) -> dict:
+        """
+        Evaluates the promotions of all the products at a time at once, with the
+        schedule applied, for pricing reports.
+        :param when: time (seconds), by default the current time of the schedule
+        :return: the promotion (Promotion object or None) of every product by key
+        """
+        all_promotions = {key: product.promotion
+                          for key, product in self._products.items()}
+        if self._schedule is not None:
+            all_promotions.update(self._schedule.promotions_at(all_promotions, when))
+        return all_promotions
+
+    @staticmethod
+    def _reserve(shopping_list) -> list:
+        """
+        Reserves the stock of every line of a shopping list, taking it out of the
+        quantity of the products. If a line fails, releases the stock reserved so
+        far and raises the exception. The caller holds the locks of the products.
+        :returns: list of the (product, quantity) reservations made
+        """
+        reserved = []
+        try:
+            for product, quantity in shopping_list:
+                product._check_quantity(quantity)
+                if product._tracks_stock:
+                    product._take_stock(quantity)
+                    reserved.append((product, quantity))
+        except Exception:
+            Store._release(reserved)
+            raise
+        return reserved
+
+    @staticmethod
+    def _release(reserved: list):
+        """
+        Puts the stock of the given (product, quantity) reservations back.
+        """
+        for product, quantity in reversed(reserved):
+            product._release_stock(quantity)
+
+    def _price_order(self, shopping_list, sales: list = None) -> tuple:
+        """
+        Prices every line of a shopping list, without changing the stock.
+        The promotions of the schedule that run now replace those of the products.
+        The lines are recorded in the sales ledger of the store (if it has one),
+        unless a list is given as sales: the (product key, quantity, amount
+        charged, promotion) lines for the ledger are then appended to it, for the
+        caller to record.
         :returns: the total price of the order and total items received (as tuple)
         """
         total_order_price: float = 0
         total_item_received: int = 0
-        for order in shopping_list:
-            product, quantity = order
-            # Total price of order per product
-            total_price = product.buy(product, quantity)
-
-            # if total price is tuple, then it has the buy 2, get 1 free promo
-            if type(total_price) == tuple:
-                total_price, total_item = total_price
+        ledger = self._ledger if sales is None else None
+        lines = [] if ledger is not None else sales
+        if self._schedule is None and lines is None:
+            for product, quantity in shopping_list:
+                # Price of the line, by the pricing function resolved for the product
+                total_price, total_items = product._price_purchase(quantity)
                 total_order_price += total_price
-                total_item_received += total_item
+                total_item_received += total_items
+            return total_order_price, total_item_received
+
+        now = None if self._schedule is None else self._schedule.now()
+        for product, quantity in shopping_list:
+            promotion = None if now is None else \
+                self._schedule.promotion_for(product.key, now)
+            if promotion is None:
+                promotion = product.promotion
+                total_price, total_items = product._price_purchase(quantity)
             else:
-                total_order_price += total_price
+                total_price, total_items = promotion.price(product.price, quantity)
+            if lines is not None:
+                lines.append((product.key, quantity, total_price, promotion))
+            total_order_price += total_price
+            total_item_received += total_items
+        if ledger is not None:
+            ledger.record(lines)
+        return total_order_price, total_item_received
+
+    def quote(self, shopping_list) -> tuple:
+        """
+        Gets a list of (product, quantity) tuples, as for order, and returns what
+        the order would cost, without buying anything. The lines are checked like
+        an order (an order that could not be bought raises the same exception).
+        The price of every line is cached, see quote_cache_stats.
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        total_order_price: float = 0
+        total_item_received: int = 0
+        wanted = {}
+        for product, quantity in shopping_list:
+            product._check_quantity(quantity, wanted.get(product, 0))
+            if product._tracks_stock:
+                wanted[product] = wanted.get(product, 0) + quantity
+
+        now = None if self._schedule is None else self._schedule.now()
+        for product, quantity in shopping_list:
+            promotion = self._promotion_for(product, now)
+            cache_key = (product.key, quantity, product.price, promotion)
+            result = self._quotes.get(cache_key)
+            if result is None:
+                if promotion is None:
+                    result = promotions.full_price(product.price, quantity)
+                else:
+                    result = promotion.price(product.price, quantity)
+                self._quotes.put(cache_key, result)
+            total_order_price += result[0]
+            total_item_received += result[1]
+        return total_order_price, total_item_received
+
+    @property
+    def quote_cache_stats(self) -> dict:
+        """
+        Returns the counters of the quote cache (dict): size, max_size, hits,
+        misses, evictions and invalidations.
+        """
+        return self._quotes.stats
+
+    def order(self, shopping_list):
+        """
+        Gets a list of tuples, where each tuple has 2 items:
+        Product (Product object) and quantity (int).
+        Buys the products. The order is all-or-nothing: first the stock of every
+        line is reserved, then the lines are priced. If any line fails, the stock
+        reserved so far is released and the exception is raised, so the order
+        can be retried without leaking stock.
+        The locks of the products in the order are held while buying, so orders
+        from many threads do not oversell, and orders that do not share products
+        do not block one another.
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        with products.locked([product for product, quantity in shopping_list]):
+            reserved = self._reserve(shopping_list)
+            try:
+                return self._price_order(shopping_list)
+            except Exception:
+                self._release(reserved)
+                raise
+
+    def order_many(self, shopping_lists: list, errors: list = None) -> list:
+        """
+        Gets a list of shopping lists (each one a list of (product, quantity)
+        tuples, as for order) and buys them all at once.
+        The stock is checked for all the orders first, in order, so every order
+        gets the stock that would be left for it by ordering them one by one. An
+        order that cannot be bought (invalid or malformed line, not enough stock,
+        over the maximum per order) is rejected as a whole and takes no stock, and
+        the other orders are bought.
+        The lines of the accepted orders are then priced in groups by promotion.
+        If pricing or recording the sales fails, the stock taken is put back and
+        the exception is raised.
+        :param shopping_lists: list of shopping lists
+        :param errors: if a list is given, (index, exception) is appended to it
+        for every rejected order
+        :returns: list with the (total price, total items received) tuple of each
+        order, or None for the rejected orders
+        """
+        results = [None] * len(shopping_lists)
+        allocated = {}
+        accepted_lines = []
+        rejected = []
+        # Splits the lines first, so a malformed order is rejected alone
+        orders = []
+        for index, shopping_list in enumerate(shopping_lists):
+            try:
+                lines = [(product, quantity) for product, quantity in shopping_list]
+                for product, quantity in lines:
+                    # The locks of the products are found by key
+                    product.key
+                orders.append((index, lines))
+            except (TypeError, ValueError, AttributeError) as error:
+                rejected.append((index, error))
+        # Holds the locks of all the products until their stock has been taken
+        with products.locked([product for index, shopping_list in orders
+                              for product, quantity in shopping_list]):
+            for index, shopping_list in orders:
+                wanted = {}
+                try:
+                    for product, quantity in shopping_list:
+                        product._check_quantity(quantity, allocated.get(product, 0) +
+                                                wanted.get(product, 0))
+                        if product._tracks_stock:
+                            wanted[product] = wanted.get(product, 0) + quantity
+                except Exception as error:
+                    # Nothing was taken yet: a malformed order is rejected alone
+                    rejected.append((index, error))
+                    continue
+                for product, quantity in wanted.items():
+                    allocated[product] = allocated.get(product, 0) + quantity
+                results[index] = (0, 0)
+                accepted_lines.extend((index, product, quantity)
+                                      for product, quantity in shopping_list)
+
+            for product, quantity in allocated.items():
+                product._take_stock(quantity)
+
+        try:
+            # Prices the lines in groups that share the same promotion
+            now = None if self._schedule is None else self._schedule.now()
+            groups = {}
+            for line_number, (index, product, quantity) in enumerate(accepted_lines):
+                promotion = self._promotion_for(product, now)
+                group = groups.setdefault(promotion, (promotion, [], [], []))
+                group[1].append(line_number)
+                group[2].append(product.price)
+                group[3].append(quantity)
+            line_prices = [0.0] * len(accepted_lines)
+            line_items = [0] * len(accepted_lines)
+            for promotion, line_numbers, prices, quantities in groups.values():
+                totals, items = _price_lines(promotion, prices, quantities)
+                for line_number, total, item in zip(line_numbers, totals, items):
+                    line_prices[line_number] = total
+                    line_items[line_number] = item
+
+            # Adds up the lines of each order, in the order of the lines
+            for line_number, (index, product, quantity) in enumerate(accepted_lines):
+                total_price, total_items = results[index]
+                results[index] = (total_price + line_prices[line_number],
+                                  total_items + line_items[line_number])
+            if self._ledger is not None:
+                self._ledger.record([(product.key, quantity, line_prices[line_number],
+                                      self._promotion_for(product, now))
+                                     for line_number, (index, product, quantity)
+                                     in enumerate(accepted_lines)])
+        except Exception:
+            # The stock of the accepted orders goes back: nothing was sold
+            with products.locked(list(allocated)):
+                Store._release(list(allocated.items()))
+            raise
+        if errors is not None:
+            errors.extend(sorted(rejected, key=lambda rejection: rejection[0]))
+        return results
+
+    def __contains__(self, item):
+        """
+        Checks if a product (Product object) or a product key (str) is in the store
+        """
+        if isinstance(item, str):
+            return item in self._products
+        return self._products.get(getattr(item, 'key', None)) is item
+
+    def __add__(self, other):
+        """
+        Returns a view of this store and the other store (or view) as one store,
+        without copying them (StoreView object)
+        """
+        return StoreView(self, other)
+
+
+class StoreView:
+    """
+    The StoreView class presents several stores as one, without copying them:
+    the view reads its member stores every time, so products added to or removed
+    from a member show up in the view right away.
+    A product in more than one member (the very same Product object) is counted
+    once, by its first member. Products of different members that only share a
+    key are different products, and both are in the view.
+    Orders are bought like Store.order, all-or-nothing over the lines of every
+    member, and every line is priced by the member that owns its product (with
+    the promotion schedule of that member).
+    The view answers the read queries of a Store (pages, searches, price ranges,
+    quotes) by asking its members and merging their answers. Products added to
+    the view go to its first member.
+    """
+
+    def __init__(self, *stores):
+        """
+        Constructor of the StoreView class.
+        :param stores: the member stores (Store or StoreView objects). The members
+        of a view are taken in its place, so views of views stay flat
+        """
+        members = []
+        for store_obj in stores:
+            members.extend(store_obj.members if isinstance(store_obj, StoreView)
+                           else (store_obj,))
+        self._members = tuple(members)
+        # Products in more than one member, and the changes of the members they
+        # were found at
+        self._duplicates = []
+        self._duplicates_changes = None
+
+    @property
+    def members(self) -> tuple:
+        """ Returns the member stores of the view (tuple of Store objects) """
+        return self._members
+
+    def _shared_products(self) -> list:
+        """
+        Returns the products that are also in an earlier member, once for every
+        extra member they are in. Only worked out again after products were added
+        to or removed from a member.
+        """
+        changes = tuple(member._changes for member in self._members)
+        if changes != self._duplicates_changes:
+            duplicates = []
+            earlier_keys = set()
+            for number, member in enumerate(self._members):
+                # Only products with a key seen before can be in an earlier member
+                for key in member._products.keys() & earlier_keys:
+                    product = member._products[key]
+                    if any(earlier._products.get(key) is product
+                           for earlier in self._members[:number]):
+                        duplicates.append(product)
+                earlier_keys.update(member._products)
+            self._duplicates = duplicates
+            self._duplicates_changes = changes
+        return self._duplicates
+
+    def owner_of(self, product: object):
+        """
+        Returns the member that owns a product: the first member it is in. If no
+        member has the product, raises an exception.
+        """
+        for member in self._members:
+            if member._products.get(product.key) is product:
+                return member
+        raise ValueError(f"Product '{product.key}' is not in the store")
+
+    @property
+    def total_quantity(self) -> int:
+        """
+        Returns how many items are in the stores in total, counting the products
+        in more than one member once
+        """
+        return sum(member.total_quantity for member in self._members) - \
+            sum(product.quantity for product in self._shared_products())
+
+    def _each_once(self, product_list) -> list:
+        """ Returns the products of a list without the repeats of shared products """
+        shared = {id(product) for product in self._shared_products()}
+        if not shared:
+            return list(product_list)
+        unique_products = []
+        listed = set()
+        for product in product_list:
+            if id(product) in shared:
+                if id(product) in listed:
+                    continue
+                listed.add(id(product))
+            unique_products.append(product)
+        return unique_products
+
+    @property
+    def all_products(self) -> list:
+        """
+        Returns the active products of all the members, member after member, each
+        product once.
+        """
+        return self._each_once(product for member in self._members
+                               for product in member.all_products)
+
+    def page(self, cursor: tuple = 0, size: int = 50) -> tuple:
+        """
+        Returns a page of the active products, member after member, each product
+        once (see Store.page).
+        :param cursor: 0 or the cursor of the last page
+        :param size: largest number of products in the page
+        :return: list of products and the cursor of the next page, or None after
+        the last page (tuple)
+        """
+        if size <= 0:
+            raise ValueError("The page size must be greater than 0")
+        number, position = cursor or (0, 0)
+        shared = {id(product) for product in self._shared_products()}
+        page_products = []
+        while number < len(self._members) and len(page_products) < size:
+            member = self._members[number]
+            member_products, position = member.page(position,
+                                                    size - len(page_products))
+            # A shared product is listed by its owner, the first member it is in
+            page_products.extend(product for product in member_products
+                                 if id(product) not in shared or
+                                 self.owner_of(product) is member)
+            if position is None:
+                number, position = number + 1, 0
+        next_cursor = (number, position) if number < len(self._members) else None
+        return page_products, next_cursor
+
+    def pages(self, size: int = 50):
+        """
+        Generator of the pages (lists of products) of the active products, member
+        after member. Every page is read when it is needed, see page.
+        """
+        cursor = 0
+        while cursor is not None:
+            page_products, cursor = self.page(cursor, size)
+            if page_products:
+                yield page_products
+
+    def products_in_price_range(self, low: float = None, high: float = None) -> list:
+        """
+        Returns the active products of the members with a price from low to high
+        (both included), cheapest first, each product once. A missing bound is not
+        checked.
+        """
+        return self._each_once(heapq.merge(
+            *(member.products_in_price_range(low, high) for member in self._members),
+            key=operator.attrgetter('price')))
+
+    def cheapest(self, count: int) -> list:
+        """ Returns the count cheapest active products, cheapest first """
+        # A shared product may take a place in every member it is in
+        wanted = count + len(self._shared_products())
+        return self._each_once(heapq.merge(
+            *(member.cheapest(wanted) for member in self._members),
+            key=operator.attrgetter('price')))[:max(count, 0)]
+
+    def most_expensive(self, count: int) -> list:
+        """ Returns the count most expensive active products, most expensive first """
+        wanted = count + len(self._shared_products())
+        return self._each_once(heapq.merge(
+            *(member.most_expensive(wanted) for member in self._members),
+            key=operator.attrgetter('price'), reverse=True))[:max(count, 0)]
+
+    def search(self, prefix: str) -> list:
+        """
+        Returns the active products whose key starts with the prefix (without
+        regard to case), member after member, each product once.
+        """
+        return self._each_once(product for member in self._members
+                               for product in member.search(prefix))
+
+    def get_product(self, key: str):
+        """
+        Gets the key of a product and returns the product (Product object) of the
+        first member that has one. If no member has it, raises an exception.
+        """
+        for member in self._members:
+            product = member._products.get(key)
+            if product is not None:
+                return product
+        raise ValueError(f"There is no product with the key '{key}' in the store")
+
+    def add_product(self, product: object):
+        """
+        Gets product and adds it to the first member, see Store.add_product.
+        Adding a product that is already in a member does nothing.
+        """
+        if any(member._products.get(product.key) is product for member in self._members):
+            return f"Product '{product}' successfully added to store"
+        return self._members[0].add_product(product)
+
+    def remove_product(self, product: object):
+        """
+        Removes a product from every member it is in. If no member has it, raises
+        an exception.
+        """
+        owners = [member for member in self._members
+                  if member._products.get(product.key) is product]
+        if not owners:
+            raise ValueError(f"Product '{product}' is not in the store")
+        # A member can be in the view more than once
+        for member in dict.fromkeys(owners):
+            member.remove_product(product)
+        return f"Product '{product}' successfully removed from store"
+
+    def _lines_by_member(self, shopping_list) -> dict:
+        """
+        Splits a list of (product, quantity) tuples into the lines of every member,
+        by the owner of the product. A product in no member raises an exception.
+        """
+        lines_by_member = {}
+        for product, quantity in shopping_list:
+            lines_by_member.setdefault(self.owner_of(product), []).append(
+                (product, quantity))
+        return lines_by_member
+
+    def quote(self, shopping_list) -> tuple:
+        """
+        Gets a list of (product, quantity) tuples, as for order, and returns what
+        the order would cost, without buying anything: the lines of every member
+        are quoted by that member (see Store.quote).
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        total_order_price, total_item_received = 0, 0
+        for member, lines in self._lines_by_member(shopping_list).items():
+            total_price, total_items = member.quote(lines)
+            total_order_price += total_price
+            total_item_received += total_items
+        return total_order_price, total_item_received
+
+    def order(self, shopping_list):
+        """
+        Gets a list of (product, quantity) tuples and buys the products, like
+        Store.order: the stock of every line is reserved first, then the lines of
+        every member are priced by that member. If any line fails (or its product
+        is in no member), nothing is bought and the exception is raised.
+        The lines of the members with a sales ledger are recorded once the whole
+        order is bought.
+        :returns: the total price of the order and total items received (as tuple)
+        """
+        lines_by_member = self._lines_by_member(shopping_list)
+        sales = []
+        with products.locked([product for product, quantity in shopping_list]):
+            reserved = Store._reserve(shopping_list)
+            try:
+                total_order_price, total_item_received = 0, 0
+                for member, lines in lines_by_member.items():
+                    ledger_lines = None if member._ledger is None else []
+                    total_price, total_items = member._price_order(lines, ledger_lines)
+                    if ledger_lines is not None:
+                        sales.append((member._ledger, ledger_lines))
+                    total_order_price += total_price
+                    total_item_received += total_items
+            except Exception:
+                Store._release(reserved)
+                raise
+        for ledger, ledger_lines in sales:
+            ledger.record(ledger_lines)
         return total_order_price, total_item_received
 
     def __contains__(self, item):
-        return item in self._products
+        """
+        Checks if a product (Product object) or a product key (str) is in a member
+        """
+        return any(item in member for member in self._members)
 
     def __add__(self, other):
-        return Store(self._products + other._products)
+        """ Returns a view of this view and the other store (or view) as one store """
+        return StoreView(self, other)
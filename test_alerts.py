@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+from alerts import LowStockMonitor, LOW_STOCK, RESTOCKED
+from products import Product, NonStockedProduct, LimitedProduct
+from store import Store
+
+
+def make_store():
+    """
+    Creates a small store used by the tests.
+    """
+    return Store([Product("MacBook Air M2", price=1450, quantity=100),
+                  Product("Google Pixel 7", price=500, quantity=8),
+                  NonStockedProduct("Windows License", price=125),
+                  LimitedProduct("Shipping", price=10, quantity=3, maximum=1)])
+
+
+def test_monitor_finds_low_stock_without_alerting_the_start():
+    """
+    Test that the products below the threshold and the next to run out are found,
+    and that non-stocked and limited products are not watched.
+    """
+    best_buy = make_store()
+    monitor = LowStockMonitor(best_buy, threshold=10)
+    assert monitor.below_threshold() == [("Google Pixel 7", 8)]
+    assert monitor.next_to_run_out(5) == [("Google Pixel 7", 8),
+                                          ("MacBook Air M2", 100)]
+    assert monitor.flush() == []
+
+
+def test_monitor_batches_alerts():
+    """
+    Test that orders and restocks are alerted in one batch on flush, one alert per
+    product, and that a product that drops and comes back sends nothing.
+    """
+    best_buy = make_store()
+    batches = []
+    monitor = LowStockMonitor(best_buy, threshold=10, callback=batches.append)
+    mac_book = best_buy.get_product("MacBook Air M2")
+    pixel = best_buy.get_product("Google Pixel 7")
+    best_buy.order([(mac_book, 95)])
+    best_buy.order([(mac_book, 2)])
+    pixel.quantity = 20
+    assert batches == []
+    monitor.flush()
+    assert batches == [[(LOW_STOCK, "MacBook Air M2", 3),
+                        (RESTOCKED, "Google Pixel 7", 28)]]
+    assert monitor.next_to_run_out(1) == [("MacBook Air M2", 3)]
+
+    best_buy.order([(pixel, 20)])
+    pixel.quantity = 20
+    best_buy.remove_product(mac_book)
+    assert monitor.flush() == []
+    assert monitor.below_threshold() == []
+    monitor.close()
+    best_buy.order([(pixel, 25)])
+    assert monitor.flush() == []
+
+
+def test_monitor_flushes_in_the_background():
+    """
+    Test that the background thread sends the alerts.
+    """
+    best_buy = make_store()
+    flushed = threading.Event()
+    monitor = LowStockMonitor(best_buy, threshold=10,
+                              callback=lambda alerts: flushed.set())
+    monitor.start(interval=0.001)
+    best_buy.order([(best_buy.get_product("MacBook Air M2"), 100)])
+    assert flushed.wait(5)
+    monitor.close()
+    with pytest.raises(ValueError):
+        LowStockMonitor(best_buy, threshold=0)
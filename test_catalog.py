@@ -0,0 +1,60 @@
+import json
+
+import pytest
+import catalog
+import main
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_load_store_from_csv():
+    """
+    Test that the CSV catalog of the repository gives the same store as the
+    hard-coded catalog.
+    """
+    best_buy = catalog.load_store("catalog.csv", main.create_promotions())
+    assert [str(product) for product in best_buy.all_products] == [
+        str(product) for product in main.create_store().all_products]
+
+
+def test_load_store_from_jsonl_with_workers(tmp_path):
+    """
+    Test that a JSONL catalog read by worker processes keeps the order of the rows
+    and shares the promotion objects.
+    """
+    promotion_catalog = main.create_promotions()
+    rows = [{'kind': 'product', 'name': f"Product {number}", 'price': 10,
+             'quantity': number + 1, 'promotion': "30% off!"} for number in range(50)]
+    path = write(tmp_path / "catalog.jsonl",
+                 "\n".join(json.dumps(row) for row in rows) + "\n")
+    best_buy = catalog.load_store(path, promotion_catalog, workers=2, chunk_size=7)
+    assert [product.key for product in best_buy.all_products] == [
+        row['name'] for row in rows]
+    assert best_buy.total_quantity == sum(range(1, 51))
+    assert all(product.promotion is promotion_catalog["30% off!"]
+               for product in best_buy.all_products)
+
+
+def test_invalid_rows_are_reported(tmp_path):
+    """
+    Test that rows are validated like the Product constructor, with the line number
+    of every invalid row.
+    """
+    path = write(tmp_path / "catalog.csv",
+                 "kind,name,price,quantity,maximum,promotion\n"
+                 "product,MacBook Air M2,1450,100,,\n"
+                 "product,,1450,100,,\n"
+                 "product,Google Pixel 7,-5,100,,\n"
+                 "limited,Shipping,10,250,,\n"
+                 "product,Bose,250,500,,Unknown\n"
+                 "gadget,Bose,250,500,,\n")
+    errors = []
+    best_buy = catalog.load_store(path, main.create_promotions(), errors=errors)
+    assert [product.key for product in best_buy.all_products] == ["MacBook Air M2"]
+    assert [line_number for line_number, error in errors] == [3, 4, 5, 6, 7]
+    assert errors[0][1].startswith("NameError")
+    with pytest.raises(ValueError, match="line 3"):
+        catalog.load_store(path, main.create_promotions())
@@ -0,0 +1,81 @@
+import pytest
+import inventory
+import promotions
+from products import Product, NonStockedProduct, LimitedProduct
+from store import Store
+
+
+def make_table():
+    """
+    Creates a small inventory table with one product of each kind.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    mac_book.promotion = promotions.SecondHalfPrice("Second Half price!")
+    return inventory.InventoryTable.from_products([
+        mac_book,
+        NonStockedProduct("Windows License", price=125),
+        LimitedProduct("Shipping", price=10, quantity=250, maximum=1)])
+
+
+def test_views_print_like_products():
+    """
+    Test that the views print the same as the products they were created from.
+    """
+    table = make_table()
+    assert [str(view) for view in table.views()] == [
+        "MacBook Air M2, Price: 1450, Quantity: 100, Promotion: Second Half price!",
+        "Windows License, Price: 125, Quantity: Unlimited, Promotion: None",
+        "Shipping, Price: 10, Limited to 1 per order!, Promotion: None"]
+
+
+def test_append_validates_like_product():
+    """
+    Test that invalid rows invoke the same exceptions as the Product constructor.
+    """
+    table = inventory.InventoryTable()
+    with pytest.raises(NameError):
+        table.append("", price=10, quantity=1)
+    with pytest.raises(ValueError):
+        table.append("Google Pixel 7", price=0, quantity=1)
+
+
+def test_store_over_table():
+    """
+    Test that a store built from the views keeps the table and the store totals
+    in line when ordering.
+    """
+    table = make_table()
+    best_buy = Store(table.views(), debug=True)
+    mac_book = table.view("MacBook Air M2")
+    assert best_buy.order([(mac_book, 3)]) == (3625, 0)
+    assert best_buy.total_quantity == table.total_quantity == 347
+
+    with pytest.raises(ValueError):
+        best_buy.order([(table.view("Shipping"), 2)])
+
+    best_buy.order([(mac_book, 97)])
+    assert table.active_rows() == [1, 2]
+    assert best_buy.all_products == table.active_products()
+
+
+def test_in_stock():
+    """
+    Test the batch stock check over the table columns.
+    """
+    table = make_table()
+    assert table.in_stock([0, 0, 1, 2], [100, 101, 10 ** 6, 500]) == [
+        True, False, True, True]
+
+
+def test_views_reject_quantities_that_are_not_integers():
+    """
+    Test that views reject the quantities that are not integers, like products.
+    """
+    table = make_table()
+    mac_book = table.view("MacBook Air M2")
+    for quantity in (None, "2", 2.0, [2]):
+        with pytest.raises(ValueError, match="Quantity must be an integer"):
+            mac_book._check_quantity(quantity)
+    with pytest.raises(ValueError, match="Quantity must be an integer"):
+        Store(table.views()).order([(mac_book, None)])
+    assert mac_book.quantity == 100
@@ -0,0 +1,146 @@
+import pytest
+
+import promotions
+from ledger import SalesLedger
+from products import Product, NonStockedProduct
+from store import Store
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ledger_aggregates_by_product_promotion_and_time(tmp_path):
+    """
+    Test that the queries add up the recorded sales by product, promotion and
+    time bucket, over the whole ledger and over a time range.
+    """
+    ledger = SalesLedger(str(tmp_path / 'sales.ledger'))
+    discount = promotions.PercentDiscount("30% off!", percent=30)
+    ledger.record([("MacBook Air M2", 2, 2900.0, None),
+                   ("Windows License", 1, 87.5, discount)], when=1000.0)
+    ledger.record([("Windows License", 3, 262.5, discount)], when=1010.5)
+    ledger.record([("MacBook Air M2", 1, 1450.0, None)], when=1065.0)
+    # A time before the last record counts as the time of the last record
+    ledger.record([("Shipping", 1, 10.0, None)], when=1020.0)
+
+    assert len(ledger) == 5
+    assert ledger.revenue_by_product() == {"MacBook Air M2": 4350.0,
+                                           "Windows License": 350.0,
+                                           "Shipping": 10.0}
+    assert ledger.units_by_product(end=1065.0) == {"MacBook Air M2": 2,
+                                                   "Windows License": 4}
+    assert ledger.revenue_by_promotion() == {None: 4360.0, "30% off!": 350.0}
+    assert ledger.revenue_by_bucket(60) == {960.0: 3250.0, 1020.0: 1460.0}
+    assert ledger.total_revenue(start=1010.0, end=1065.0) == 262.5
+    ledger.close()
+
+    reopened = SalesLedger(str(tmp_path / 'sales.ledger'))
+    reopened.record([("Windows License", 1, 87.5, discount)], when=0.0)
+    assert reopened.revenue_by_promotion() == {None: 4360.0, "30% off!": 437.5}
+    assert reopened.revenue_by_bucket(60, start=1065.0) == {1020.0: 1547.5}
+    reopened.close()
+
+
+def test_attached_ledger_records_the_store_sales(tmp_path):
+    """
+    Test that a ledger attached to a store records the lines of orders and of
+    batches of orders, and nothing for rejected orders.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    mac_book.promotion = promotions.SecondHalfPrice("Second Half price!")
+    windows = NonStockedProduct("Windows License", price=125)
+    best_buy = Store([mac_book, windows])
+    with SalesLedger(str(tmp_path / 'sales.ledger'), clock=FakeClock()) as ledger:
+        ledger.attach(best_buy)
+        total_price, total_items = best_buy.order([(mac_book, 2), (windows, 1)])
+        with pytest.raises(ValueError):
+            best_buy.order([(windows, 1), (mac_book, 1000)])
+        results = best_buy.order_many([[(windows, 2)], [(mac_book, 1000)]])
+        assert ledger.total_revenue() == total_price + results[0][0]
+        assert ledger.units_by_product() == {"MacBook Air M2": 2,
+                                             "Windows License": 3}
+        assert ledger.revenue_by_promotion() == {None: 375,
+                                                 "Second Half price!": 2175.0}
+    assert best_buy._ledger is None
+
+
+def test_ledger_checks_its_names_on_open(tmp_path):
+    """
+    Test that a name cut short by a crash is dropped, and that records whose
+    product has no name make the ledger refuse to open.
+    """
+    path = str(tmp_path / 'sales.ledger')
+    with SalesLedger(path) as ledger:
+        ledger.record([("MacBook Air M2", 2, 2900.0, None)], when=1000.0)
+    with open(path + '.names', 'a') as names_file:
+        names_file.write('["product", "Wind')
+    with SalesLedger(path) as ledger:
+        ledger.record([("Windows License", 1, 125.0, None)], when=1001.0)
+        assert ledger.units_by_product() == {"MacBook Air M2": 2, "Windows License": 1}
+
+    with open(path + '.names') as names_file:
+        names = names_file.readlines()
+    with open(path + '.names', 'w') as names_file:
+        names_file.writelines(names[:-1])
+    with pytest.raises(ValueError, match="missing from its names file"):
+        SalesLedger(path)
+
+
+def test_ledger_checks_only_the_records_after_its_marks(tmp_path, monkeypatch):
+    """
+    Test that opening a ledger only reads the records written after the marks of
+    the last open or close, and still finds names missing from the names file.
+    """
+    path = str(tmp_path / 'sales.ledger')
+    with SalesLedger(path) as ledger:
+        ledger.record([("MacBook Air M2", 2, 2900.0, None)] * 3, when=1000.0)
+    read_from = []
+    columns = SalesLedger._columns
+
+    def spy(ledger, start=None, end=None, first_record=0):
+        read_from.append(first_record)
+        return columns(ledger, start, end, first_record)
+
+    monkeypatch.setattr(SalesLedger, '_columns', spy)
+    ledger = SalesLedger(path)
+    ledger.record([("Windows License", 1, 125.0, None)], when=1001.0)
+    # Not closed: the marks are those of the open
+    SalesLedger(path).close()
+    assert read_from == [3, 3]
+    assert ledger.units_by_product() == {"MacBook Air M2": 6, "Windows License": 1}
+    ledger.close()
+
+    with open(path + '.names', 'w') as names_file:
+        names_file.write('["product", "MacBook Air M2"]\n')
+    with pytest.raises(ValueError, match="missing from its names file"):
+        SalesLedger(path)
+
+
+class FailingPromotion(promotions.PercentDiscount):
+    """ Promotion that cannot price anything """
+    def price(self, price: float, quantity: int) -> tuple:
+        raise RuntimeError("Pricing failed")
+
+
+def test_store_view_records_only_bought_orders(tmp_path):
+    """
+    Test that an order of a view is recorded in the ledgers of its members only
+    once the whole order is bought.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+    pixel.promotion = FailingPromotion("Broken", percent=10)
+    windows = NonStockedProduct("Windows License", price=125)
+    east, west = Store([mac_book]), Store([pixel, windows])
+    with SalesLedger(str(tmp_path / 'sales.ledger')) as ledger:
+        ledger.attach(east)
+        with pytest.raises(RuntimeError):
+            (east + west).order([(mac_book, 1), (pixel, 1)])
+        assert len(ledger) == 0 and mac_book.quantity == 100
+        assert (east + west).order([(mac_book, 1), (windows, 1)]) == (1575, 0)
+        assert ledger.units_by_product() == {"MacBook Air M2": 1}
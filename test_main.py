@@ -0,0 +1,64 @@
+import io
+import json
+import sys
+
+import main
+import metrics
+
+
+def test_run_script_writes_a_result_per_command():
+    """
+    Test that a script runs orders, searches and totals without prompts, reports
+    the failed commands and stops at Quit.
+    """
+    best_buy = main.create_store()
+    script = ['# a session',
+              '3 "MacBook Air M2" 2 Shipping 1',
+              '3 Shipping 2',
+              '',
+              '5 google 100 500',
+              '2',
+              '9',
+              '4',
+              '2']
+    output = io.StringIO()
+    assert main.run_script(best_buy, script, output) == 2
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [result['line'] for result in results] == [2, 3, 5, 6, 7]
+    assert results[0]['total_items_received'] == 0
+    assert 'per order is allowed' in results[1]['error']
+    assert results[2]['products'] == [
+        "Google Pixel 7, Price: 500, Quantity: 250, Promotion: Third One Free!"]
+    assert results[3]['total_quantity'] == 1098
+    assert results[4]['error'] == "Error with your choice '9'"
+
+
+def test_profile_run_writes_a_report(tmp_path):
+    """
+    Test that a profiled run returns the result of the function and writes the
+    time and memory report.
+    """
+    report_path = tmp_path / 'profile.txt'
+    assert main.profile_run(sum, str(report_path), [1, 2, 3]) == 6
+    report = report_path.read_text()
+    assert 'allocations by line' in report and 'cumulative time' in report
+
+
+def test_main_writes_the_metrics(tmp_path, monkeypatch):
+    """
+    Test that --metrics turns the instrumentation on for the run and writes what
+    it recorded as Prometheus text.
+    """
+    script_path, metrics_path = tmp_path / 'script.txt', tmp_path / 'metrics.prom'
+    script_path.write_text('3 "MacBook Air M2" 2\n4\n')
+    monkeypatch.setattr(sys, 'argv', ['main.py', '--script', str(script_path),
+                                      '--output', str(tmp_path / 'out.jsonl'),
+                                      '--metrics', str(metrics_path)])
+    metrics.REGISTRY.reset()
+    try:
+        main.main()
+    finally:
+        metrics.disable()
+        metrics.REGISTRY.reset()
+    assert 'store_units_sold_total{product="MacBook Air M2"} 2' in \
+        metrics_path.read_text()
@@ -0,0 +1,123 @@
+import pytest
+import metrics
+import promotions
+from products import Product, LimitedProduct
+from reservations import ReservationManager
+from sharding import ShardedStore
+from store import Store
+
+
+@pytest.fixture
+def registry():
+    """ Turns the instrumentation on for a test, with its own metrics """
+    registry = metrics.Metrics()
+    metrics.enable(registry)
+    yield registry
+    metrics.disable()
+
+
+def test_disabled_instrumentation_leaves_the_methods_alone():
+    """
+    Test that turning the instrumentation off puts back the very same methods.
+    """
+    order, buy = Store.order, Product.buy
+    metrics.enable(metrics.Metrics())
+    assert metrics.enabled() and Store.order is not order
+    metrics.disable()
+    assert not metrics.enabled()
+    assert Store.order is order and Product.buy is buy
+
+
+def test_metrics_record_calls_rejections_and_units(registry):
+    """
+    Test that orders, batches of orders, buys, the pricing of batches by
+    promotion class and the store properties are counted, with the rejections by
+    reason and the units sold by product.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    mac_book.promotion = promotions.PercentDiscount("10% off!", percent=10)
+    shipping = LimitedProduct("Shipping", price=10, quantity=250, maximum=1)
+    best_buy = Store([mac_book, shipping])
+    best_buy.order([(mac_book, 2), (shipping, 1)])
+    mac_book.buy(mac_book, 3)
+    with pytest.raises(ValueError):
+        best_buy.order([(shipping, 2)])
+    with pytest.raises(ValueError):
+        best_buy.order([(mac_book, 1000)])
+    errors = []
+    assert best_buy.order_many([[(mac_book, 4)], [(shipping, 5)]], errors)[1] is None
+    assert len(errors) == 1
+    best_buy.all_products
+    best_buy.total_quantity
+
+    snapshot = registry.snapshot()
+    operations = snapshot['operations']
+    assert operations['store_order']['calls'] == 3
+    assert operations['store_order']['rejections'] == {'over_maximum': 1,
+                                                       'over_stock': 1}
+    assert operations['store_order_many']['calls'] == 1
+    assert operations['store_order_many']['rejections'] == {'over_maximum': 1}
+    assert operations['PercentDiscount.apply_promotion_batch']['calls'] == 1
+    assert operations['PercentDiscount.apply_promotion_batch']['timed_calls'] == 1
+    assert operations['product_buy']['calls'] == 1
+    assert operations['store_all_products']['calls'] == 1
+    assert operations['store_total_quantity']['calls'] == 1
+    # Only the first of every SAMPLE_EVERY orders is timed
+    assert operations['store_order']['timed_calls'] == 1
+    assert sum(operations['store_order']['latency_buckets'].values()) == 1
+    assert snapshot['units_sold'] == {"MacBook Air M2": 9, "Shipping": 1}
+
+    text = registry.to_prometheus()
+    assert 'store_calls_total{operation="store_order"} 3' in text
+    assert 'store_latency_seconds_count{operation="store_order"} 1' in text
+    assert 'store_latency_seconds_bucket{operation="store_order",le="+Inf"} 1' in text
+    assert 'store_rejections_total{operation="store_order",reason="over_stock"} 1' \
+        in text
+    assert 'store_units_sold_total{product="MacBook Air M2"} 9' in text
+
+
+def test_metrics_reset_keeps_recording(registry):
+    """
+    Test that the instrumentation keeps recording after the metrics are reset,
+    and that the pending calls are counted once MAX_PENDING_SALES lists of sold
+    lines are pending, although only one buy in SAMPLE_EVERY is timed.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=10 ** 6)
+    buys = registry.MAX_PENDING_SALES + 1
+    for _ in range(buys):
+        mac_book.buy(mac_book, 1)
+    assert registry.histogram('product_buy').calls == buys
+    assert registry.histogram('product_buy').count == \
+        registry.MAX_PENDING_SALES // metrics.SAMPLE_EVERY + 1
+    assert registry._units_sold == {mac_book: buys}
+    registry.reset()
+    mac_book.buy(mac_book, 2)
+    snapshot = registry.snapshot()
+    assert snapshot['operations']['product_buy']['calls'] == 1
+    assert snapshot['units_sold'] == {"MacBook Air M2": 2}
+
+
+def test_metrics_count_the_units_of_views_holds_and_shards(registry):
+    """
+    Test that the units sold by the orders of a view of stores, by confirmed
+    holds and by the orders of a sharded store are counted, the released holds
+    left out.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    east, west = Store([mac_book]), Store([earbuds])
+    (east + west).order([(mac_book, 2), (earbuds, 3)])
+    holds = ReservationManager(east)
+    holds.confirm(holds.hold([(mac_book, 4)], ttl=60))
+    holds.release(holds.hold([(mac_book, 5)], ttl=60))
+    with ShardedStore([mac_book, earbuds], shards=2) as sharded:
+        sharded.order_many([[("MacBook Air M2", 1), ("Bose QuietComfort Earbuds", 1)],
+                            [("Bose QuietComfort Earbuds", 10 ** 6)]])
+
+    snapshot = registry.snapshot()
+    operations = snapshot['operations']
+    assert operations['store_view_order']['calls'] == 1
+    assert operations['reservations_confirm']['calls'] == 1
+    assert operations['sharded_order_many']['rejections'] == {'over_stock': 1}
+    assert snapshot['units_sold'] == {"MacBook Air M2": 7,
+                                      "Bose QuietComfort Earbuds": 4}
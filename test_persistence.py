@@ -0,0 +1,99 @@
+import os
+
+import main
+from persistence import InventoryJournal, SEGMENT_FILE
+from products import Product
+
+
+def test_recovers_orders_and_catalog_changes(tmp_path):
+    """
+    Test that orders, quantity changes, added and removed products survive a
+    restart.
+    """
+    best_buy = main.create_store()
+    journal = InventoryJournal(str(tmp_path))
+    assert journal.open(best_buy) == 0
+    best_buy.order([(best_buy.get_product("MacBook Air M2"), 10),
+                    (best_buy.get_product("Google Pixel 7"), 4)])
+    best_buy.get_product("Bose QuietComfort Earbuds").quantity = 20
+    best_buy.remove_product(best_buy.get_product("Shipping"))
+    best_buy.add_product(Product("iPhone 14", price=900, quantity=30))
+    journal.close()
+
+    restarted = main.create_store()
+    journal = InventoryJournal(str(tmp_path))
+    assert journal.open(restarted) == 5
+    journal.close()
+    assert [str(product) for product in restarted.all_products] == \
+        [str(product) for product in best_buy.all_products]
+    assert restarted.total_quantity == best_buy.total_quantity == 886
+
+
+def test_recovery_after_snapshot_and_torn_record(tmp_path):
+    """
+    Test that recovery starts from the last snapshot, and ignores a record that
+    was cut short by a crash.
+    """
+    best_buy = main.create_store()
+    journal = InventoryJournal(str(tmp_path))
+    journal.open(best_buy)
+    mac_book = best_buy.get_product("MacBook Air M2")
+    best_buy.order([(mac_book, 30)])
+    journal.snapshot()
+    best_buy.order([(mac_book, 5)])
+    journal.sync()
+    segment = max(int(name[4:-4]) for name in os.listdir(tmp_path)
+                  if name.endswith('.log'))
+    with open(tmp_path / SEGMENT_FILE.format(segment), 'ab') as log_file:
+        log_file.write(b'\x03\x20\x00')
+
+    restarted = main.create_store()
+    recovering = InventoryJournal(str(tmp_path))
+    assert recovering.open(restarted) == 1
+    recovering.close()
+    journal.close()
+    assert restarted.get_product("MacBook Air M2").quantity == 65
+
+
+def test_recovers_price_and_promotion_changes(tmp_path):
+    """
+    Test that price and promotion changes survive a restart, in synchronous mode,
+    and that the main CLI keeps its inventory in a journal.
+    """
+    best_buy = main.create_store()
+    journal = main.open_journal(best_buy, str(tmp_path), synchronous=True)
+    mac_book = best_buy.get_product("MacBook Air M2")
+    mac_book.price = 999
+    mac_book.promotion = None
+    best_buy.get_product("Google Pixel 7").promotion = \
+        main.create_promotions()["30% off!"]
+    best_buy.order([(mac_book, 1)])
+    journal.close()
+
+    restarted = main.create_store()
+    main.open_journal(restarted, str(tmp_path)).close()
+    assert [str(product) for product in restarted.all_products] == \
+        [str(product) for product in best_buy.all_products]
+    assert restarted.get_product("MacBook Air M2").price == 999
+
+
+def test_log_without_snapshot_keeps_the_catalog(tmp_path):
+    """
+    Test that the snapshot is written before the log, and that a log found without
+    a snapshot is replayed over the catalog of the store instead of emptying it.
+    """
+    best_buy = main.create_store()
+    journal = InventoryJournal(str(tmp_path))
+    journal.open(best_buy)
+    assert os.path.exists(tmp_path / 'snapshot.json')
+    best_buy.order([(best_buy.get_product("MacBook Air M2"), 10)])
+    journal.close()
+    os.remove(tmp_path / 'snapshot.json')
+
+    restarted = main.create_store()
+    recovering = InventoryJournal(str(tmp_path))
+    assert recovering.open(restarted) == 1
+    recovering.close()
+    assert [str(product) for product in restarted.all_products] == \
+        [str(product) for product in best_buy.all_products]
+    assert os.path.exists(tmp_path / 'snapshot.json')
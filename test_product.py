@@ -1,5 +1,6 @@
 import pytest
-from products import Product
+from products import Product, NonStockedProduct, LimitedProduct
+from promotions import PercentDiscount
 
 
 def test_creating_products():
@@ -64,3 +65,46 @@ def test_buy_too_much():
     with pytest.raises(ValueError):
         mac_book = Product("MacBook Air M2", price=1450, quantity=100)
         mac_book.buy(mac_book, 400)
+
+
+def test_products_and_promotions_use_slots():
+    """
+    Test that products and promotions have no instance dictionary, and that a new
+    product has no promotion.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    for instance in (mac_book, NonStockedProduct("Windows License", price=125),
+                     LimitedProduct("Shipping", price=10, quantity=250, maximum=1),
+                     PercentDiscount("30% off!", percent=30)):
+        assert not hasattr(instance, '__dict__')
+    assert mac_book.promotion is None
+
+
+def test_deactivated_product_name():
+    """
+    Test that a deactivated product shows it in its name, and loses it again when
+    it is activated.
+    """
+    windows = NonStockedProduct("Windows License", price=125)
+    windows.deactivate()
+    assert str(windows).startswith("Windows License (deactivated), ")
+    windows.activate()
+    assert str(windows).startswith("Windows License, ")
+
+
+def test_rendered_line_is_cached_until_the_product_changes():
+    """
+    Test that the line of a product is rendered once, and again after its price,
+    quantity, promotion or active state changes.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    assert str(mac_book) is str(mac_book)
+    mac_book.price = 1400
+    assert str(mac_book) == "MacBook Air M2, Price: 1400, Quantity: 100, Promotion: None"
+    mac_book.buy(mac_book, 10)
+    mac_book.promotion = PercentDiscount("30% off!", percent=30)
+    assert str(mac_book) == "MacBook Air M2, Price: 1400, Quantity: 90, " \
+                            "Promotion: 30% off!"
+    mac_book.deactivate()
+    # A deactivated product is not shown
+    assert mac_book.__str__() is None
@@ -0,0 +1,86 @@
+import random
+
+import promotions
+from products import Product
+from store import Store
+
+PROMOTIONS = [promotions.PercentDiscount("30% off!", percent=30),
+              promotions.SecondHalfPrice("Second Half price!"),
+              promotions.ThirdOneFree("Third One Free!")]
+
+
+def test_batch_pricing_matches_single_pricing():
+    """
+    Test that pricing many lines at once gives the same prices and items received as
+    pricing them one by one with apply_promotion.
+    """
+    prices = [random.choice([10, 125, 1450, 19.99, 0.5]) for _ in range(200)]
+    quantities = [random.randrange(1, 50) for _ in range(200)]
+    for promotion in PROMOTIONS:
+        expected_prices, expected_items = [], []
+        for price, quantity in zip(prices, quantities):
+            result = promotion.apply_promotion(Product("Item", price, 100), quantity)
+            if type(result) == tuple:
+                result, items = result
+            else:
+                items = 0
+            expected_prices.append(result)
+            expected_items.append(items)
+        assert promotion.apply_promotion_batch(prices, quantities) == (
+            expected_prices, expected_items)
+
+
+def test_percent_discount_does_not_need_a_purchase():
+    """
+    Test that a percent discount prices a product that was never bought.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    assert PROMOTIONS[0].apply_promotion(mac_book, 2) == 2030
+    assert mac_book.total_price == 0
+
+
+def test_pricing_function_is_resolved_when_the_promotion_is_set():
+    """
+    Test that every pricing function returns a (total price, total items received)
+    tuple, and that a product uses the pricing function of its promotion.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    assert mac_book._price_purchase(3) == (4350, 0)
+    for promotion in PROMOTIONS:
+        mac_book.promotion = promotion
+        expected_prices, expected_items = promotion.apply_promotion_batch([1450], [3])
+        assert mac_book._price_purchase(3) == (expected_prices[0], expected_items[0])
+    mac_book.promotion = None
+    assert mac_book._price_purchase(3) == promotions.full_price(1450, 3)
+
+
+def test_orders_use_an_overridden_apply_promotion():
+    """
+    Test that a promotion subclass that only overrides apply_promotion is used to
+    price the purchases.
+    """
+    class FlatDiscount(promotions.PercentDiscount):
+        def apply_promotion(self, product, quantity) -> float:
+            return product.price * quantity - 50
+
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    mac_book.promotion = FlatDiscount("50 off!", percent=0)
+    assert mac_book._price_purchase(2) == (2850, 0)
+    assert mac_book.buy(mac_book, 2) == 2850
+
+
+def test_batches_use_an_overridden_apply_promotion():
+    """
+    Test that a batch of orders costs the same as the orders one by one for a
+    promotion subclass that only overrides apply_promotion.
+    """
+    class FlatDiscount(promotions.PercentDiscount):
+        def apply_promotion(self, product, quantity) -> float:
+            return product.price * quantity - 50
+
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    mac_book.promotion = FlatDiscount("50 off!", percent=10)
+    best_buy = Store([mac_book])
+    assert best_buy.order_many([[(mac_book, 2)], [(mac_book, 3)]]) == [
+        best_buy.order([(mac_book, 2)]), best_buy.order([(mac_book, 3)])]
+    assert mac_book.quantity == 90
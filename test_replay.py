@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+import main
+import replay
+
+
+def test_replay_counts_rejections_by_category(tmp_path):
+    """
+    Test that a replayed log buys the orders and counts the rejected ones by the
+    ValueError that rejected them.
+    """
+    log_path = tmp_path / "orders.jsonl"
+    log_path.write_text("\n".join(json.dumps(order) for order in [
+        [["MacBook Air M2", 2], ["Windows License", 1]],
+        {"items": [["Google Pixel 7", 1]]},
+        [["Google Pixel 7", 1000]],
+        [["Shipping", 2]],
+        [["MacBook Air M2", 0]],
+        [["iPhone 14", 1]]]) + "\n")
+    best_buy = main.create_store()
+    report = replay.replay(replay.read_orders(str(log_path)), store_obj=best_buy)
+    assert report['orders'] == 6
+    assert report['rejections'] == {'over_stock': 1, 'over_maximum': 1,
+                                    'invalid_quantity': 1, 'unknown_product': 1}
+    assert best_buy.get_product("MacBook Air M2").quantity == 98
+    assert report['p99_ms'] >= report['p50_ms'] > 0
+
+
+def test_replay_across_processes_keeps_every_order():
+    """
+    Test that a log split across processes replays every order, and that a target
+    rate spaces the orders out.
+    """
+    orders = replay.generate_orders(main.create_store(), 40, seed=1)
+    report = replay.replay(orders, processes=2)
+    assert report['orders'] == 40
+    parts, spanning = replay.partition(orders, 3)
+    assert sum(len(part) for part in parts) + len(spanning) == 40
+    assert replay.replay(orders[:5], rate=100)['seconds'] >= 0.04
+
+
+def test_replay_across_processes_matches_one_process(tmp_path):
+    """
+    Test that a log replayed by many processes, each one with its part of the
+    catalog, reports the same orders and rejections as one process, and that
+    every process only loads the products of its partition.
+    """
+    catalog_path = tmp_path / "catalog.jsonl"
+    catalog_path.write_text("\n".join(json.dumps(
+        {"name": f"Product {number}", "price": 10, "quantity": 40})
+        for number in range(30)) + "\n")
+    orders = replay.generate_orders(main.create_store(str(catalog_path)), 300,
+                                    max_lines=1, max_quantity=5, seed=3)
+    orders += [[["Product 1", 1], ["Product 2", 1], ["Product 3", 1]],
+               [["Product 4", 1000], ["Product 5", 1]],
+               [["iPhone 14", 1]]]
+    assert replay.partition(orders, 3)[1]
+    one = replay.replay(orders, str(catalog_path))
+    many = replay.replay(orders, str(catalog_path), processes=3)
+    assert one['rejections'].get('over_stock')
+    for field in ('orders', 'rejected', 'rejections'):
+        assert many[field] == one[field]
+    stores = [replay.load_partition(str(catalog_path), number, 3) for number in range(3)]
+    assert sum(len(store_obj._products) for store_obj in stores) == 30
+
+
+def test_partitions_build_only_their_products(tmp_path, monkeypatch):
+    """
+    Test that a partition only builds the products it owns, from the catalog file
+    or the built-in catalog.
+    """
+    catalog_path = tmp_path / "catalog.csv"
+    catalog_path.write_text("name,price,quantity\n" + "".join(
+        f"Product {number},10,40\n" for number in range(30)))
+    built = []
+    build_product = replay.persistence.build_product
+    monkeypatch.setattr(replay.persistence, 'build_product',
+                        lambda *arguments: built.append(arguments) or
+                        build_product(*arguments))
+    stores = [replay.load_partition(str(catalog_path), number, 3) for number in range(3)]
+    assert len(built) == 30
+    assert sorted(key for store_obj in stores for key in store_obj._products) == \
+        sorted(f"Product {number}" for number in range(30))
+    built.clear()
+    stores = [replay.load_partition(None, number, 2) for number in range(2)]
+    assert len(built) == sum(len(store_obj._products) for store_obj in stores) == 5
+
+
+def test_replay_rejects_malformed_orders():
+    """
+    Test that malformed orders count as rejections instead of stopping the replay,
+    and that a given store cannot be replayed by many processes.
+    """
+    best_buy = main.create_store()
+    report = replay.replay([[["iPhone 14"]], [[["MacBook Air M2"], 1]], [None],
+                            [["MacBook Air M2", "2"]], [["MacBook Air M2", 1]]],
+                           store_obj=best_buy)
+    assert report['orders'] == 5
+    assert report['rejected'] == 4
+    assert best_buy.get_product("MacBook Air M2").quantity == 99
+    with pytest.raises(ValueError):
+        replay.replay([], store_obj=best_buy, processes=2)
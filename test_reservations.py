@@ -0,0 +1,93 @@
+import random
+
+import pytest
+from products import Product, LimitedProduct
+from reservations import ReservationManager, TimerWheel
+from store import Store
+
+
+class FakeClock:
+    """
+    Clock that only moves when the test moves it.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store():
+    """
+    Creates a small store used by the tests.
+    """
+    return Store([Product("MacBook Air M2", price=1450, quantity=100),
+                  LimitedProduct("Shipping", price=10, quantity=250, maximum=1)])
+
+
+def test_timer_wheel_expires_on_time():
+    """
+    Test that timers on every level of the wheel expire at their deadline, and
+    cancelled timers never expire.
+    """
+    wheel = TimerWheel(tick=1.0, slots=8, levels=4)
+    deadlines = {timer_id: random.randrange(1, 8 ** 4 - 8) for timer_id in range(500)}
+    for timer_id, deadline in deadlines.items():
+        wheel.schedule(timer_id, deadline)
+    for timer_id in range(0, 500, 5):
+        wheel.cancel(timer_id)
+        del deadlines[timer_id]
+
+    for now in range(1, 8 ** 4):
+        for timer_id in wheel.advance(now):
+            assert deadlines.pop(timer_id) == now
+    assert not deadlines and not len(wheel)
+
+
+def test_hold_reduces_quantity_until_expiry():
+    """
+    Test that a hold takes the stock away until it expires.
+    """
+    clock = FakeClock()
+    best_buy = make_store()
+    manager = ReservationManager(best_buy, clock=clock)
+    mac_book = best_buy.get_product("MacBook Air M2")
+
+    manager.hold([(mac_book, 100)], ttl=600)
+    assert mac_book.quantity == 0
+    assert mac_book not in best_buy.all_products
+    assert best_buy.total_quantity == 250
+
+    clock.now = 599
+    assert manager.expire() == 0
+    clock.now = 600
+    assert manager.expire() == 1
+    assert mac_book.quantity == 100 and mac_book in best_buy.all_products
+
+
+def test_confirm_and_release():
+    """
+    Test that a confirmed hold keeps the stock and is priced like an order, and a
+    released or failed hold gives all its stock back.
+    """
+    clock = FakeClock()
+    best_buy = make_store()
+    manager = ReservationManager(best_buy, clock=clock)
+    mac_book = best_buy.get_product("MacBook Air M2")
+    shipping = best_buy.get_product("Shipping")
+
+    hold_id = manager.hold([(mac_book, 2), (shipping, 1)], ttl=60)
+    assert manager.confirm(hold_id) == (2910, 0)
+    assert mac_book.quantity == 98
+    with pytest.raises(ValueError):
+        manager.confirm(hold_id)
+
+    manager.release(manager.hold([(mac_book, 8)], ttl=60))
+    with pytest.raises(ValueError):
+        manager.hold([(mac_book, 8), (shipping, 2)], ttl=60)
+    assert mac_book.quantity == 98 and not len(manager)
+
+    hold_id = manager.hold([(mac_book, 1)], ttl=60)
+    clock.now = 61
+    with pytest.raises(ValueError):
+        manager.confirm(hold_id)
@@ -0,0 +1,95 @@
+import random
+
+import pytest
+import promotions
+from products import Product, NonStockedProduct
+from schedule import PromotionSchedule
+from store import Store
+
+FLASH_SALE = promotions.PercentDiscount("Flash sale!", percent=50)
+TEN_PERCENT = promotions.PercentDiscount("10% off!", percent=10)
+THIRD_ONE_FREE = promotions.ThirdOneFree("Third One Free!")
+
+
+class Clock:
+    """ Clock of the tests, moved by hand """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_schedule_picks_the_promotion_running_at_a_time():
+    """
+    Test that a scheduled promotion only runs in its window (end not included), and
+    that the highest priority wins, then the entry set on the product.
+    """
+    schedule = PromotionSchedule()
+    schedule.add(TEN_PERCENT, 0, 100)
+    schedule.add(FLASH_SALE, 10, 20, product_key="MacBook Air M2")
+    schedule.add(THIRD_ONE_FREE, 15, 30, priority=1, product_key="MacBook Air M2")
+    assert schedule.promotion_for("MacBook Air M2", -1) is None
+    assert schedule.promotion_for("MacBook Air M2", 5) is TEN_PERCENT
+    assert schedule.promotion_for("MacBook Air M2", 10) is FLASH_SALE
+    assert schedule.promotion_for("MacBook Air M2", 15) is THIRD_ONE_FREE
+    assert schedule.promotion_for("MacBook Air M2", 30) is TEN_PERCENT
+    assert schedule.promotion_for("Google Pixel 7", 15) is TEN_PERCENT
+    assert schedule.promotion_for("Google Pixel 7", 100) is None
+    with pytest.raises(ValueError):
+        schedule.add(FLASH_SALE, 20, 20)
+
+
+def test_schedule_matches_a_linear_scan():
+    """
+    Test that the interval index finds the same promotion as checking every entry.
+    """
+    schedule = PromotionSchedule()
+    catalog = [FLASH_SALE, TEN_PERCENT, THIRD_ONE_FREE]
+    entries = []
+    for _ in range(300):
+        start = random.randrange(0, 1000)
+        entry = (random.choice(["A", "B", None]), random.choice(catalog), start,
+                 start + random.randrange(1, 200), random.randrange(0, 3))
+        entry_id = schedule.add(entry[1], entry[2], entry[3], entry[4], entry[0])
+        entries.append((entry_id, entry))
+    for entry_id, entry in random.sample(entries, 50):
+        schedule.remove(entry_id)
+        entries.remove((entry_id, entry))
+
+    for when in range(-10, 1210, 7):
+        for product_key in ["A", "B", "C"]:
+            running = [(priority, key is not None, entry_id, promotion)
+                       for entry_id, (key, promotion, start, end, priority) in entries
+                       if key in (product_key, None) and start <= when < end]
+            expected = max(running)[3] if running else None
+            assert schedule.promotion_for(product_key, when) is expected
+
+
+def test_store_prices_orders_with_the_schedule():
+    """
+    Test that orders, batch orders and quotes use the promotion running at order
+    time, and go back to the promotion of the product when it ends.
+    """
+    clock = Clock(0)
+    schedule = PromotionSchedule(clock)
+    mac_book = Product("MacBook Air M2", price=1000, quantity=100)
+    mac_book.promotion = TEN_PERCENT
+    best_buy = Store([mac_book, NonStockedProduct("Windows License", price=100)],
+                     schedule=schedule)
+    schedule.add(FLASH_SALE, 10, 20)
+    assert best_buy.order([(mac_book, 1)]) == (900, 0)
+    clock.now = 10
+    assert best_buy.order([(mac_book, 1)]) == (500, 0)
+    assert best_buy.quote([(mac_book, 2)]) == (1000, 0)
+    assert best_buy.order_many([[(mac_book, 1)],
+                                [(best_buy.get_product("Windows License"), 2)]]) == [
+        (500, 0), (100, 0)]
+    assert best_buy.promotions_at(15) == {"MacBook Air M2": FLASH_SALE,
+                                          "Windows License": FLASH_SALE}
+    clock.now = 20
+    assert best_buy.order([(mac_book, 1)]) == (900, 0)
+    assert best_buy.quote([(mac_book, 2)]) == (1800, 0)
+    assert best_buy.promotions_at() == {"MacBook Air M2": TEN_PERCENT,
+                                        "Windows License": None}
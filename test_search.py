@@ -0,0 +1,112 @@
+import random
+
+import search
+from products import Product, NonStockedProduct
+from search import PriceIndex, PrefixIndex, SortedBlocks
+from store import Store
+
+
+def make_store():
+    """
+    Creates a small store used by the tests.
+    """
+    return Store([Product("MacBook Air M2", price=1450, quantity=100),
+                  Product("Bose QuietComfort Earbuds", price=250, quantity=500),
+                  Product("Google Pixel 7", price=500, quantity=250),
+                  NonStockedProduct("Windows License", price=125),
+                  Product("Google Pixel 7a", price=500, quantity=10)], debug=True)
+
+
+def keys(product_list):
+    return [product.key for product in product_list]
+
+
+def test_price_index_matches_sorting():
+    """
+    Test that price range and top-k queries match sorting all the prices, after
+    keys are added, moved and removed.
+    """
+    index = PriceIndex()
+    prices = {}
+    for number in range(500):
+        key = f"Product {random.randrange(200)}"
+        if random.random() < 0.2:
+            index.remove(key)
+            prices.pop(key, None)
+        else:
+            prices[key] = random.randrange(1, 100)
+            index.add(key, prices[key], int(key.split()[1]))
+    ordered = sorted(prices, key=lambda key: (prices[key], int(key.split()[1])))
+    assert index.in_range() == ordered
+    assert index.in_range(20, 40) == [key for key in ordered if 20 <= prices[key] <= 40]
+    assert index.cheapest(5) == ordered[:5]
+    assert index.most_expensive(5) == ordered[::-1][:5]
+
+
+def test_sorted_blocks_match_a_sorted_list(monkeypatch):
+    """
+    Test that a sorted list of small blocks keeps the same entries in the same order
+    as a sorted list, while blocks are split and emptied.
+    """
+    monkeypatch.setattr(search, 'BLOCK_SIZE', 8)
+    blocks = SortedBlocks(random.sample(range(1000), 50))
+    expected = sorted(blocks)
+    for number in range(2000):
+        entry = random.randrange(1000)
+        if random.random() < 0.45:
+            assert blocks.remove(entry) == (entry in expected)
+            if entry in expected:
+                expected.remove(entry)
+        else:
+            blocks.add(entry)
+            expected.append(entry)
+            expected.sort()
+        assert len(blocks) == len(expected)
+    assert list(blocks) == expected
+    assert list(reversed(blocks)) == expected[::-1]
+    assert list(blocks.from_entry(500)) == [entry for entry in expected if entry >= 500]
+    assert all(entry in blocks for entry in expected)
+
+
+def test_prefix_index_finds_and_forgets_keys():
+    """
+    Test that the prefix index finds keys by prefix without regard to case, and
+    forgets removed keys.
+    """
+    index = PrefixIndex()
+    for key in ["Google Pixel 7", "Google Pixel 7a", "Bose", "GoPro"]:
+        index.add(key)
+    assert sorted(index.starting_with("go")) == ["GoPro", "Google Pixel 7",
+                                                 "Google Pixel 7a"]
+    index.remove("Google Pixel 7")
+    index.remove("GoPro")
+    index.remove("Nothing")
+    assert index.starting_with("go") == ["Google Pixel 7a"]
+    assert index.starting_with("GoP") == []
+    assert len(index) == 2
+
+
+def test_store_indexes_follow_the_products():
+    """
+    Test that the store indexes change with price changes, deactivation, running
+    out of stock and removal.
+    """
+    best_buy = make_store()
+    assert keys(best_buy.products_in_price_range(200, 500)) == [
+        "Bose QuietComfort Earbuds", "Google Pixel 7", "Google Pixel 7a"]
+    assert keys(best_buy.search("google")) == ["Google Pixel 7", "Google Pixel 7a"]
+    assert keys(best_buy.cheapest(1)) == ["Windows License"]
+
+    mac_book = best_buy.get_product("MacBook Air M2")
+    mac_book.price = 100
+    assert keys(best_buy.cheapest(2)) == ["MacBook Air M2", "Windows License"]
+    best_buy.get_product("Google Pixel 7").deactivate()
+    best_buy.order([(best_buy.get_product("Google Pixel 7a"), 10)])
+    assert keys(best_buy.search("google")) == []
+    assert keys(best_buy.most_expensive(1)) == ["Bose QuietComfort Earbuds"]
+
+    best_buy.get_product("Google Pixel 7").activate()
+    best_buy.remove_product(mac_book)
+    assert keys(best_buy.products_in_price_range(high=500)) == [
+        "Windows License", "Bose QuietComfort Earbuds", "Google Pixel 7"]
+    assert best_buy.total_quantity == 750
@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+import main
+import metrics
+from service import OrderBatcher, OrderService, run_load
+
+
+async def request(port: int, message: dict) -> dict:
+    """
+    Sends one request to the service and returns the response.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(json.dumps(message).encode() + b'\n')
+    response = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return response
+
+
+def test_service_commands():
+    """
+    Test that the service lists products, shows the total and makes orders.
+    """
+    async def scenario():
+        service = OrderService(main.create_store())
+        port = await service.start(port=0)
+        try:
+            listing = await request(port, {'command': 'list'})
+            order = await request(port, {'command': 'order',
+                                         'items': [["Google Pixel 7", 2]]})
+            too_much = await request(port, {'command': 'order',
+                                            'items': [["Shipping", 2]]})
+            total = await request(port, {'command': 'total'})
+        finally:
+            await service.stop()
+        return listing, order, too_much, total
+
+    listing, order, too_much, total = asyncio.run(scenario())
+    assert len(listing['products']) == 5
+    assert order == {'total_price': 1000, 'total_items_received': 3}
+    assert 'error' in too_much
+    assert total == {'total_quantity': 1098}
+
+
+def test_concurrent_clients_share_the_stock():
+    """
+    Test that orders from many concurrent clients never sell more than the stock.
+    """
+    async def scenario():
+        best_buy = main.create_store()
+        service = OrderService(best_buy)
+        port = await service.start(port=0)
+        try:
+            report = await run_load('127.0.0.1', port, clients=20,
+                                    orders_per_client=10,
+                                    shopping_list=[["MacBook Air M2", 1]])
+        finally:
+            await service.stop()
+        return best_buy, report
+
+    best_buy, report = asyncio.run(scenario())
+    assert report['orders'] == 200
+    assert report['rejected'] == 100
+    assert best_buy.get_product("MacBook Air M2").quantity == 0
+
+
+def test_bad_items_only_fail_their_own_request():
+    """
+    Test that an order with a malformed item is rejected with a 400 error, and
+    does not fail the valid orders batched with it.
+    """
+    async def scenario():
+        service = OrderService(main.create_store(), max_delay=0.05)
+        port = await service.start(port=0)
+        try:
+            return await asyncio.gather(
+                request(port, {'command': 'order', 'items': [["MacBook Air M2", None]]}),
+                request(port, {'command': 'order', 'items': [["Google Pixel 7", 1]]}),
+                request(port, {'command': 'order', 'items': [[7, 1]]}))
+        finally:
+            await service.stop()
+
+    bad_quantity, valid, bad_key = asyncio.run(scenario())
+    assert bad_quantity['status'] == 400 and bad_key['status'] == 400
+    assert valid == {'total_price': 500, 'total_items_received': 1}
+
+
+def test_batcher_fails_only_the_bad_order():
+    """
+    Test that a malformed order sent straight to the batcher fails alone.
+    """
+    async def scenario():
+        best_buy = main.create_store()
+        batcher = OrderBatcher(best_buy, max_delay=0.05)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.order([(best_buy.get_product("MacBook Air M2"), None)]),
+                batcher.order([(best_buy.get_product("Windows License"), 1)]),
+                return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    bad, valid = asyncio.run(scenario())
+    assert isinstance(bad, ValueError)
+    assert valid == (87.5, 0)
+
+
+def test_batcher_fails_the_batch_when_order_many_raises():
+    """
+    Test that when order_many raises, every order of the batch gets the exception
+    and no order is bought a second time.
+    """
+    class BrokenLedger:
+        def record(self, lines):
+            raise OSError("disk full")
+
+    async def scenario():
+        batcher = OrderBatcher(best_buy, max_delay=0.05)
+        batcher.start()
+        try:
+            return await asyncio.gather(
+                batcher.order([(mac_book, 2)]),
+                batcher.order([(mac_book, 3)]),
+                return_exceptions=True)
+        finally:
+            await batcher.stop()
+
+    best_buy = main.create_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    best_buy._ledger = BrokenLedger()
+    first, second = asyncio.run(scenario())
+    assert isinstance(first, OSError) and isinstance(second, OSError)
+    assert mac_book.quantity == 100
+
+
+def test_service_exports_the_metrics():
+    """
+    Test that with the instrumentation on, the metrics command returns the
+    recorded orders as a JSON snapshot and as Prometheus text.
+    """
+    async def scenario():
+        service = OrderService(main.create_store())
+        port = await service.start(port=0)
+        try:
+            await request(port, {'command': 'order', 'items': [["Google Pixel 7", 2]]})
+            return (await request(port, {'command': 'metrics'}),
+                    await request(port, {'command': 'metrics', 'format': 'prometheus'}))
+        finally:
+            await service.stop()
+
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    try:
+        snapshot, prometheus = asyncio.run(scenario())
+    finally:
+        metrics.disable()
+        metrics.REGISTRY.reset()
+    assert snapshot['operations']['store_order_many']['calls'] == 1
+    assert snapshot['units_sold'] == {"Google Pixel 7": 2}
+    assert 'store_units_sold_total{product="Google Pixel 7"} 2' in prometheus['text']
@@ -0,0 +1,105 @@
+import multiprocessing
+
+import pytest
+
+import main
+import sharding
+from sharding import ShardedStore
+
+
+@pytest.fixture
+def sharded_store():
+    """ A store of the built-in products, over 3 shards """
+    with ShardedStore(main.create_store().all_products, shards=3) as sharded:
+        yield sharded
+
+
+def test_sharded_store_aggregates_the_shards(sharded_store):
+    """
+    Test that the total quantity and the products of the shards add up to those
+    of the store.
+    """
+    best_buy = main.create_store()
+    assert sharded_store.total_quantity == best_buy.total_quantity
+    assert sorted(str(product) for product in sharded_store.all_products) == \
+        sorted(str(product) for product in best_buy.all_products)
+    assert len({sharded_store.shard_of(product.key)
+                for product in best_buy.all_products}) > 1
+
+
+def test_sharded_orders_match_the_store(sharded_store):
+    """
+    Test that orders within a shard and across shards cost what they cost in the
+    store, and that a rejected order takes no stock from any shard.
+    """
+    best_buy = main.create_store()
+    keys = [product.key for product in best_buy.all_products]
+    shopping_lists = [[(key, 1)] for key in keys] + \
+        [[(key, 2) for key in keys if key != "Shipping"],
+         [(key, 1) for key in keys] + [("MacBook Air M2", 1000)],
+         [("MacBook Air M2", 1), ("No such product", 1)]]
+    errors = []
+    results = sharded_store.order_many(shopping_lists, errors)
+    assert [index for index, error in errors] == [len(keys) + 1, len(keys) + 2]
+
+    expected = []
+    for shopping_list in shopping_lists[:-2]:
+        expected.append(best_buy.order([(best_buy.get_product(key), quantity)
+                                        for key, quantity in shopping_list]))
+    assert results == expected + [None, None]
+    assert sharded_store.total_quantity == best_buy.total_quantity
+    assert sharded_store.order([("MacBook Air M2", 1), ("Google Pixel 7", 3)]) == \
+        best_buy.order([(best_buy.get_product("MacBook Air M2"), 1),
+                        (best_buy.get_product("Google Pixel 7"), 3)])
+    with pytest.raises(ValueError, match="per order is allowed"):
+        sharded_store.order([("Google Pixel 7", 1), ("Shipping", 2)])
+    assert sharded_store.total_quantity == best_buy.total_quantity
+
+
+def test_malformed_orders_do_not_lose_the_other_shards(sharded_store):
+    """
+    Test that a malformed order is rejected alone: the orders of the other shards
+    are still bought, and the holds of the other parts of an order that spans
+    shards are released.
+    """
+    best_buy = main.create_store()
+    keys = [product.key for product in best_buy.all_products]
+    mac_book_shard = sharded_store.shard_of("MacBook Air M2")
+    other = next(key for key in keys if sharded_store.shard_of(key) != mac_book_shard)
+    errors = []
+    results = sharded_store.order_many([[("MacBook Air M2", 5)],
+                                        [(other, None)],
+                                        [("MacBook Air M2", 1), (other, None)],
+                                        [("MacBook Air M2", 1), (None, 1)],
+                                        [("MacBook Air M2",)]], errors)
+    assert results[0] == best_buy.order([(best_buy.get_product("MacBook Air M2"), 5)])
+    assert results[1:] == [None] * 4
+    assert [index for index, error in errors] == [1, 2, 3, 4]
+    assert sharded_store.total_quantity == best_buy.total_quantity
+
+
+def test_shards_build_only_their_products(tmp_path, monkeypatch):
+    """
+    Test that a shard started from a catalog file only builds the products it
+    owns, and that the shards of a catalog have all its products.
+    """
+    catalog_path = tmp_path / "catalog.jsonl"
+    catalog_path.write_text("".join(
+        f'{{"name": "Product {number}", "price": 10, "quantity": 2}}\n'
+        for number in range(30)))
+    built = []
+    build_product = sharding.persistence.build_product
+    monkeypatch.setattr(sharding.persistence, 'build_product',
+                        lambda *arguments: built.append(arguments) or
+                        build_product(*arguments))
+    totals = []
+    for shard in range(3):
+        connection, shard_connection = multiprocessing.Pipe()
+        connection.send(('total_quantity', ()))
+        connection.send(('close', ()))
+        sharding._run_shard(shard_connection, shard, 3, None, str(catalog_path), {})
+        totals.append(connection.recv()[1])
+    assert len(built) == 30
+    assert sum(totals) == 60
+    with ShardedStore(catalog_path=str(catalog_path), shards=3) as sharded:
+        assert sharded.total_quantity == 60
@@ -0,0 +1,406 @@
+import sys
+import threading
+import time
+
+import pytest
+import main
+import promotions
+from products import Product, NonStockedProduct, LimitedProduct
+from store import Store
+
+
+def make_store():
+    """
+    Creates a small store used by the tests.
+    """
+    return Store([Product("MacBook Air M2", price=1450, quantity=100),
+                  Product("Google Pixel 7", price=500, quantity=250),
+                  NonStockedProduct("Windows License", price=125)])
+
+
+def test_store_keeps_insertion_order():
+    """
+    Test that the catalog lists products in the order they were added.
+    """
+    best_buy = make_store()
+    best_buy.add_product(Product("Bose QuietComfort Earbuds", price=250, quantity=500))
+    assert [product.key for product in best_buy.all_products] == [
+        "MacBook Air M2", "Google Pixel 7", "Windows License",
+        "Bose QuietComfort Earbuds"]
+
+
+def test_store_lookup_by_key():
+    """
+    Test that products can be fetched and checked by key or by product object.
+    """
+    best_buy = make_store()
+    pixel = best_buy.get_product("Google Pixel 7")
+    assert pixel in best_buy
+    assert "Google Pixel 7" in best_buy
+    assert Product("Google Pixel 7", price=500, quantity=250) not in best_buy
+    with pytest.raises(ValueError):
+        best_buy.get_product("iPhone 14")
+
+
+def test_store_key_survives_deactivation():
+    """
+    Test that the key of a product does not change when the product is deactivated.
+    """
+    best_buy = make_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    mac_book.deactivate()
+    assert mac_book in best_buy
+    assert best_buy.get_product("MacBook Air M2") is mac_book
+
+
+def test_remove_product():
+    """
+    Test that removing a product takes it out of the store, and removing it twice
+    invokes an exception.
+    """
+    best_buy = make_store()
+    pixel = best_buy.get_product("Google Pixel 7")
+    best_buy.remove_product(pixel)
+    assert pixel not in best_buy
+    with pytest.raises(ValueError):
+        best_buy.remove_product(pixel)
+
+
+def test_add_product_with_duplicate_key():
+    """
+    Test that adding a different product with a key already in the store invokes
+    an exception.
+    """
+    best_buy = make_store()
+    with pytest.raises(ValueError):
+        best_buy.add_product(Product("MacBook Air M2", price=1000, quantity=1))
+
+
+def test_aggregates_follow_product_changes():
+    """
+    Test that the total quantity and active products are kept up to date when the
+    products are bought, restocked, deactivated and activated.
+    """
+    best_buy = Store(make_store().all_products, debug=True)
+    mac_book = best_buy.get_product("MacBook Air M2")
+    pixel = best_buy.get_product("Google Pixel 7")
+    assert best_buy.total_quantity == 350
+
+    best_buy.order([(mac_book, 100), (pixel, 50)])
+    assert best_buy.total_quantity == 200
+    assert mac_book not in best_buy.all_products
+
+    mac_book.quantity = 10
+    pixel.deactivate()
+    assert best_buy.total_quantity == 210
+    assert [product.key for product in best_buy.all_products] == [
+        "MacBook Air M2", "Windows License"]
+
+    pixel.activate()
+    best_buy.remove_product(mac_book)
+    assert best_buy.total_quantity == 200
+    assert [product.key for product in best_buy.all_products] == [
+        "Google Pixel 7", "Windows License"]
+
+
+def test_debug_mode_detects_stale_aggregates():
+    """
+    Test that the debug mode invokes an exception when the cached aggregates differ
+    from a full recompute.
+    """
+    best_buy = Store(make_store().all_products, debug=True)
+    best_buy.get_product("MacBook Air M2")._quantity = 1
+    with pytest.raises(AssertionError):
+        best_buy.total_quantity
+
+
+def test_failed_order_releases_stock():
+    """
+    Test that an order whose last line fails takes no stock from its earlier lines.
+    """
+    best_buy = make_promoted_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    pixel = best_buy.get_product("Google Pixel 7")
+    shipping = best_buy.get_product("Shipping")
+    for failing_line in [(shipping, 2), (pixel, 251), (mac_book, 5)]:
+        with pytest.raises(ValueError):
+            best_buy.order([(mac_book, 6), (pixel, 10), failing_line])
+        assert (mac_book.quantity, pixel.quantity) == (10, 250)
+        assert best_buy.total_quantity == 1010
+        assert mac_book in best_buy.all_products
+    assert best_buy.order([(mac_book, 6), (pixel, 10), (shipping, 1)]) == (
+        11535.0, 15)
+
+
+def make_promoted_store():
+    """
+    Creates a store with one product of each kind and promotion.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=10)
+    mac_book.promotion = promotions.SecondHalfPrice("Second Half price!")
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    earbuds.promotion = promotions.PercentDiscount("10% off!", percent=10)
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+    pixel.promotion = promotions.ThirdOneFree("Third One Free!")
+    return Store([mac_book, earbuds, pixel,
+                  NonStockedProduct("Windows License", price=125),
+                  LimitedProduct("Shipping", price=10, quantity=250, maximum=1)])
+
+
+def test_order_many_matches_sequential_orders():
+    """
+    Test that ordering many shopping lists at once gives the same totals and stock
+    as ordering them one by one.
+    """
+    batch_store, sequential_store = make_promoted_store(), make_promoted_store()
+    keys = ["MacBook Air M2", "Bose QuietComfort Earbuds", "Google Pixel 7",
+            "Windows License", "Shipping"]
+    orders = [[(keys[0], 3), (keys[1], 7)], [(keys[2], 5), (keys[3], 2), (keys[4], 1)],
+              [], [(keys[0], 4), (keys[1], 1), (keys[0], 3)], [(keys[2], 1)]]
+
+    results = batch_store.order_many(
+        [[(batch_store.get_product(key), quantity) for key, quantity in order]
+         for order in orders])
+    expected = [sequential_store.order(
+        [(sequential_store.get_product(key), quantity) for key, quantity in order])
+        for order in orders]
+    assert results == expected
+    assert batch_store.total_quantity == sequential_store.total_quantity
+
+
+def test_order_many_rejects_whole_orders():
+    """
+    Test that an order that cannot be bought is rejected without taking stock, and
+    that the stock goes to the orders first in the list.
+    """
+    best_buy = make_promoted_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    shipping = best_buy.get_product("Shipping")
+    errors = []
+    results = best_buy.order_many([[(mac_book, 6)], [(mac_book, 2), (shipping, 2)],
+                                   [(mac_book, 5)], [(mac_book, 4)]], errors)
+    assert results[1] is None and results[2] is None
+    assert results[3] == (4350, 0)
+    assert [index for index, error in errors] == [1, 2]
+    assert mac_book.quantity == 0
+
+
+class SlowPercentDiscount(promotions.PercentDiscount):
+    """
+    Percent discount that gives up the CPU while pricing, so that other threads
+    run between the stock check and the stock update of a purchase.
+    """
+    def price(self, price: float, quantity: int) -> tuple:
+        time.sleep(0)
+        return super().price(price, quantity)
+
+
+def test_concurrent_orders_never_oversell():
+    """
+    Stress test: many threads order the same product at once. The stock never goes
+    negative and exactly the stock is sold.
+    """
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        best_buy = make_store()
+        mac_book = best_buy.get_product("MacBook Air M2")
+        pixel = best_buy.get_product("Google Pixel 7")
+        mac_book.promotion = SlowPercentDiscount("10% off!", percent=10)
+        sold, rejected = [], []
+
+        def shopper(reverse):
+            for _ in range(50):
+                lines = [(mac_book, 1), (pixel, 1)]
+                try:
+                    best_buy.order(lines[::-1] if reverse else lines)
+                except ValueError:
+                    rejected.append(1)
+                else:
+                    sold.append(1)
+                assert mac_book.quantity >= 0
+
+        threads = [threading.Thread(target=shopper, args=(number % 2,))
+                   for number in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        assert not any(thread.is_alive() for thread in threads)
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert len(sold) == 100
+    assert len(rejected) == 16 * 50 - 100
+    assert mac_book.quantity == 0
+    assert best_buy.total_quantity == pixel.quantity == 150
+
+
+def test_quote_matches_order_without_buying():
+    """
+    Test that a quote costs the same as the order, does not change the stock, and
+    is served from the cache until the price or promotion changes.
+    """
+    best_buy = make_promoted_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    pixel = best_buy.get_product("Google Pixel 7")
+    shopping_list = [(mac_book, 3), (pixel, 4)]
+
+    assert best_buy.quote(shopping_list) == best_buy.quote(shopping_list)
+    assert best_buy.total_quantity == 1010
+    assert best_buy.quote_cache_stats['hits'] == 2
+    with pytest.raises(ValueError):
+        best_buy.quote([(mac_book, 6), (mac_book, 6)])
+
+    mac_book.price = 1000
+    assert best_buy.quote_cache_stats['invalidations'] == 1
+    pixel.promotion = None
+    assert best_buy.quote(shopping_list) == best_buy.order(shopping_list) == (
+        4500.0, 0)
+
+
+def test_quote_cache_evicts_least_recently_used():
+    """
+    Test that the quote cache keeps at most its size, evicting the oldest prices.
+    """
+    best_buy = Store(make_store().all_products, quote_cache_size=2)
+    mac_book = best_buy.get_product("MacBook Air M2")
+    for quantity in (1, 2, 1, 3):
+        best_buy.quote([(mac_book, quantity)])
+    assert best_buy.quote_cache_stats == {
+        'size': 2, 'max_size': 2, 'hits': 1, 'misses': 3, 'evictions': 1,
+        'invalidations': 0}
+
+
+def test_pages_stream_the_active_products():
+    """
+    Test that the pages list the active products in catalog order, skipping the
+    removed and inactive products, and that the cursor ends with None.
+    """
+    best_buy = Store([Product(f"Product {number}", price=10, quantity=5)
+                      for number in range(10)])
+    best_buy.remove_product(best_buy.get_product("Product 2"))
+    best_buy.get_product("Product 3").deactivate()
+    first_page, cursor = best_buy.page(size=3)
+    assert [product.key for product in first_page] == [
+        "Product 0", "Product 1", "Product 4"]
+    assert [[product.key for product in page] for page in best_buy.pages(3)][1:] == [
+        ["Product 5", "Product 6", "Product 7"], ["Product 8", "Product 9"]]
+    assert best_buy.page(cursor, size=100)[1] is None
+    with pytest.raises(ValueError):
+        best_buy.page(size=0)
+
+
+def test_store_view_follows_its_members():
+    """
+    Test that adding stores gives a view that counts shared products once, shows
+    the changes of its members and buys every line from the member that owns it.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+    east, west = Store([mac_book, earbuds]), Store([earbuds, pixel])
+    both = east + west
+    assert both.all_products == [mac_book, earbuds, pixel]
+    assert both.total_quantity == 850
+    assert pixel in both and "MacBook Air M2" in both
+
+    windows = NonStockedProduct("Windows License", price=125)
+    west.add_product(windows)
+    east.remove_product(earbuds)
+    assert both.all_products == [mac_book, earbuds, pixel, windows]
+    assert both.owner_of(earbuds) is west
+    assert (both + east).members == (east, west, east)
+    assert (both + east).total_quantity == both.total_quantity
+
+    assert both.order([(mac_book, 2), (pixel, 1), (windows, 3)]) == (3775, 0)
+    assert both.total_quantity == 847
+    with pytest.raises(ValueError):
+        both.order([(pixel, 1), (mac_book, 1000)])
+    with pytest.raises(ValueError):
+        both.order([(Product("Other", price=1, quantity=1), 1)])
+    assert pixel.quantity == 249 and mac_book.quantity == 98
+
+
+def test_order_many_rejects_malformed_orders_alone():
+    """
+    Test that orders with a quantity that is not an integer, or lines that are not
+    (product, quantity) pairs, are rejected alone and the rest of the batch is
+    bought.
+    """
+    best_buy = make_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    pixel = best_buy.get_product("Google Pixel 7")
+    errors = []
+    results = best_buy.order_many([[(mac_book, 5)], [(pixel, None)], [pixel],
+                                   [("Google Pixel 7", 1)], [(pixel, 2)]], errors)
+    assert [index for index, error in errors] == [1, 2, 3]
+    assert str(errors[0][1]) == "Quantity must be an integer"
+    assert results[0] == (7250, 0) and results[4] == (1000, 0)
+    assert mac_book.quantity == 95 and pixel.quantity == 248
+    with pytest.raises(ValueError, match="must be an integer"):
+        best_buy.order([(pixel, None)])
+
+
+def test_order_many_puts_the_stock_back_when_pricing_fails():
+    """
+    Test that when a promotion or the ledger raises while a batch is priced or
+    recorded, the exception is raised and no stock is taken.
+    """
+    class BrokenPromotion(promotions.PercentDiscount):
+        def apply_promotion_batch(self, prices, quantities):
+            raise RuntimeError("broken promotion")
+
+    class BrokenLedger:
+        def record(self, lines):
+            raise OSError("disk full")
+
+    best_buy = make_store()
+    mac_book = best_buy.get_product("MacBook Air M2")
+    pixel = best_buy.get_product("Google Pixel 7")
+    mac_book.promotion = BrokenPromotion("Broken", percent=10)
+    errors = []
+    with pytest.raises(RuntimeError, match="broken promotion"):
+        best_buy.order_many([[(mac_book, 5)], [(pixel, 2)], [(pixel, None)]], errors)
+    assert mac_book.quantity == 100 and pixel.quantity == 250 and errors == []
+
+    mac_book.promotion = None
+    best_buy._ledger = BrokenLedger()
+    with pytest.raises(OSError, match="disk full"):
+        best_buy.order_many([[(mac_book, 5), (pixel, 2)]])
+    assert mac_book.quantity == 100 and pixel.quantity == 250
+
+
+def test_store_view_answers_the_read_queries(capsys):
+    """
+    Test that a view of two stores lists, pages, searches and quotes like one
+    store, each shared product once, and that the menu functions work with it.
+    """
+    mac_book = Product("MacBook Air M2", price=1450, quantity=100)
+    earbuds = Product("Bose QuietComfort Earbuds", price=250, quantity=500)
+    pixel = Product("Google Pixel 7", price=500, quantity=250)
+    pixel_a = Product("Google Pixel 7a", price=400, quantity=10)
+    east, west = Store([mac_book, earbuds, pixel_a]), Store([earbuds, pixel])
+    both = east + west
+    assert [product for page in both.pages(2) for product in page] == \
+        [mac_book, earbuds, pixel_a, pixel]
+    assert both.page(size=3)[0] == [mac_book, earbuds, pixel_a]
+    assert both.products_in_price_range(300, 1000) == [pixel_a, pixel]
+    assert both.cheapest(2) == [earbuds, pixel_a]
+    assert both.most_expensive(2) == [mac_book, pixel]
+    assert both.search("google") == [pixel_a, pixel]
+    assert both.quote([(pixel, 2), (mac_book, 1), (earbuds, 1)]) == (2700, 0)
+    assert pixel.quantity == 250
+
+    assert main.list_all_products(both) == [mac_book, earbuds, pixel_a, pixel]
+    assert main.find_products(both, "goo", "450") == [pixel]
+    capsys.readouterr()
+
+    windows = NonStockedProduct("Windows License", price=125)
+    both.add_product(windows)
+    assert east.all_products[-1] is windows
+    both.remove_product(earbuds)
+    assert earbuds not in east and earbuds not in west
+    with pytest.raises(ValueError):
+        both.remove_product(earbuds)
+    assert both.all_products == [mac_book, pixel_a, windows, pixel]